@@ -27,8 +27,9 @@ from configparser import ConfigParser
 sys.path.append(".")
 
 # Import reusable code dealing with setting up logging
-from pyLogging import clsLogging
-from pyCommon import writexml, writecsv
+from pyLogging import clsLogging, clsInstrument
+from pyCommon import writeformats, OUTPUTFORMATS, clsCachedSC, writedev, readdev
+from pyPipeline import clsPipeline, batches
 
 #--- Prevent the creation of compiled import modules ---
 sys.dont_write_bytecode = True
@@ -41,11 +42,24 @@ scriptname = os.path.splitext(os.path.basename(__file__))[0]
 repoID = '0'  # Set repository ID to All
 filename = ''  # Initialize filename variable to empty
 optcsv = False
+formats = []  # Output formats to write in one pass (xml, csv, jsonl, sqlite)
+optcache = False  # Variable option to cache SecurityCenter responses locally
+cachettl = 24  # Hours a cached SecurityCenter response stays valid
+optmetrics = False  # Variable option to write Prometheus metrics next to the report
+optprofile = False  # Variable option to profile the run with cProfile
+optprofilemem = False  # Variable option to also take tracemalloc snapshots per stage
+optasynclog = False  # Variable option to write the log from a background thread
+optjsonlog = False  # Variable option to also write the log as JSON lines
+filelevel = 'DEBUG'  # Lowest level of message written to the log file
+consolelevel = 'DEBUG'  # Lowest level of message written to the console
+replayfile = ''  # writedev JSON dump to replay instead of querying SecurityCenter
+optcapture = False  # Variable option to save the raw SecurityCenter records as they are fetched
+optcapturexml = False  # Variable option to also save the raw records as XML
 
 # Get options passed via commandline
 try:
     opts, args = getopt.getopt(sys.argv[1:], 'hcf:', [
-                               'help', 'csv', 'filename='])
+                               'help', 'csv', 'formats=', 'filename=', 'cache', 'cacheTTL=', 'metrics', 'profile', 'profileMemory', 'asyncLog', 'jsonLog', 'fileLevel=', 'consoleLevel=', 'replay=', 'capture', 'captureXML'])
 except getopt.GetoptError as err:
     print('Example: Asset/GetAssets.py --csv')
     print('Example: Asset/GetAssets.py -f "Assets"')
@@ -56,20 +70,72 @@ for opt, arg in opts:
     if opt in ('-h', '--help'):
         print('Example: Asset/GetAssets.py --csv')
         print('Example: Asset/GetAssets.py -f "Assets"')
+        print('Example: Asset/GetAssets.py --cache')
+        print('Example: Asset/GetAssets.py --replay GetAssets_dev.json')
+        print('Example: Asset/GetAssets.py --capture')
+        print('Example: Asset/GetAssets.py --metrics')
+        print('Example: Asset/GetAssets.py --profile')
+        print('Example: Asset/GetAssets.py --asyncLog --fileLevel INFO')
+        print('Example: Asset/GetAssets.py --formats xml,csv,jsonl,sqlite')
         sys.exit(0)
     if opt in ('-c', '--csv'):
         optcsv = True
+    if opt == '--formats':
+        formats = [x.strip().lower() for x in arg.split(',') if x.strip()]
+    if opt == '--cache':
+        optcache = True
+    if opt == '--cacheTTL':
+        cachettl = int(arg)
+    if opt == '--metrics':
+        optmetrics = True
+    if opt == '--profile':
+        optprofile = True
+    if opt == '--profileMemory':
+        optprofile = True
+        optprofilemem = True
+    if opt == '--asyncLog':
+        optasynclog = True
+    if opt == '--jsonLog':
+        optjsonlog = True
+    if opt == '--fileLevel':
+        filelevel = str(arg)
+    if opt == '--consoleLevel':
+        consolelevel = str(arg)
+    if opt == '--replay':
+        replayfile = str(arg)
+    if opt == '--capture':
+        optcapture = True
+    if opt == '--captureXML':
+        optcapture = True
+        optcapturexml = True
+
+# Without --formats the report is written as XML, or CSV if requested
+if not formats:
+    formats = ['csv'] if optcsv else ['xml']
+for outputformat in formats:
+    if outputformat not in OUTPUTFORMATS:
+        print('Unknown output format {}, use any of {}'.format(outputformat, ','.join(OUTPUTFORMATS)))
+        sys.exit(1)
 
 if filename:
     scriptname = filename
 
+# Cache folder is shared by all of the scripts
+cacheloc = os.path.join(scriptloc, '..', 'cache', '')
+
 #--- Begin Logging Configuration Section ---
 # Initialize logging
 loginstance = clsLogging(scriptloc, scriptname)
-logger = loginstance.setup()
+logger = loginstance.setup(queued=optasynclog, filelevel=filelevel, consolelevel=consolelevel, jsonlog=optjsonlog)
 
 logger.info('Running on Python version {}'.format(sys.version))
 
+# Track time spent per stage and calls made to SecurityCenter
+instrument = clsInstrument(scriptloc, scriptname, logger, loginstance)
+
+# Columns of the CSV report, in order
+csvfields = ['ip', 'assetName', 'assetDesc']
+
 
 def main():
     configfile = os.path.join(os.path.dirname(
@@ -99,27 +165,60 @@ def main():
     password = config.get('SecurityCenter', 'pass')
     fldrloc = config.get('SecurityCenter', 'path')
 
-    data = getAssetData(hostip, username, password)
+    # Write the run metrics next to the report if requested
+    if optmetrics:
+        instrument.enablemetrics(fldrloc)
+
+    if replayfile:
+        # Parse the records from a writedev dump instead of SecurityCenter
+        data = readdev(replayfile, logger)
+    else:
+        data = getAssetData(hostip, username, password)
+        if optcapture and data is not None:
+            # Save the raw records, to replay later with --replay
+            try:
+                writedev(fldrloc, scriptname, data, logger, pretty=False, xml=optcapturexml)
+            except Exception:
+                logger.error('Failed to capture the raw data from SecurityCenter', exc_info=True)
+                closeexit(1)
 
     # What the element header for each set of data should be called
     elementname = 'Assets'
 
-    # Write parse data (stored as dictionary objects in a list variable) to XML
+    # The assets all come back from a single request, so there is no fetching
+    # to overlap.  They are parsed and written a batch at a time instead, as
+    # each one can hold thousands of IP addresses, so the rows of one batch
+    # are written while the next is parsed rather than all of them being held
+    instrument.stage('pipeline')
+    pipeline = clsPipeline(logger, instrument=instrument)
     try:
-        if optcsv:
-            writecsv(fldrloc, scriptname, data, logger)
-        else:
-            writexml(fldrloc, scriptname, data, elementname, logger)
+        wrote = pipeline.run(batches(data, 100), parsedata,
+                             lambda rows: writerows(fldrloc, scriptname, rows, elementname))
     except Exception:
-        logger.error('Error in writing the file', exc_info=True)
+        logger.error('Error in parsing or writing the file', exc_info=True)
         closeexit(1)
 
+    if not wrote:
+        logger.info('No assets found')
+        closeexit(0)
+
+    instrument.addrecords('parse', pipeline.rows)
+    instrument.addrecords('write', pipeline.result)
+
     # Close log file and exit script cleanly
     closeexit(0)
 
 
+def writerows(fldrloc, name, rows, elementname):
+    '''Write parsed rows from any iterable to each of the requested formats,
+    reading them once, and return the number written.  Errors are raised for
+    the caller to handle.
+    '''
+    return writeformats(fldrloc, name, rows, formats, elementname, logger, csvfields)
+
+
 def getAssetData(hostip, username, password):
-    '''Collect and parse the Assets from SecurityCenter and returns it at as a list of dictionaries
+    '''Collect the Assets from SecurityCenter and returns them as a list of dictionaries
 
     Parameters
     ----------
@@ -132,7 +231,7 @@ def getAssetData(hostip, username, password):
 
     Returns
     -------
-    list: A list containing a series of asset dictionaries
+    list: A list containing a series of unparsed asset dictionaries
 
     References and Footnotes
     ------------------------
@@ -164,6 +263,7 @@ def getAssetData(hostip, username, password):
         closeexit(1)
 
     #--- Connect to SecurityCenter ---
+    instrument.stage('login')
     try:
         # Create connection to SecurityCenter server using variables stored in pyTenableConfig.py
         # Results are returned as a series of dictionary objects within the 'sc' list variable
@@ -176,7 +276,15 @@ def getAssetData(hostip, username, password):
             'Likely cause is that the credentials to login into SecurityCenter are incorrect', exc_info=True)
         closeexit(1)
 
+    # Count and time every call made to SecurityCenter
+    sc = instrument.wrapsc(sc)
+
+    # Serve repeated queries from the local cache if requested
+    if optcache:
+        sc = clsCachedSC(sc, cacheloc, logger, hostip, username, ttl=cachettl * 3600)
+
     #--- Retrieve data from SecurityCenter and export to XML ---
+    instrument.stage('fetch')
 
     try:
         # Get data from SecurityCenter
@@ -190,6 +298,11 @@ def getAssetData(hostip, username, password):
         })
 
         data = (resp.json()['response']['usable'])
+        if data is not None:
+            instrument.addrecords('fetch', len(data))
+        if optcache:
+            sc.logstats()
+            instrument.addcache('response', sc.hits, sc.misses)
         # Each entry of data is returned as a dictionary variable stored in list 'rules'
     except Exception:
         # Problem with trying to get data from SecurityCenter
@@ -198,17 +311,10 @@ def getAssetData(hostip, username, password):
         logger.error('Likely cause is the query is malformed', exc_info=True)
         closeexit(1)
 
-    try:
-        if data is not None:  # If rules variable doesn't come back null/empty
-            return parsedata(data)
-        else:
-            logger.info('No assets found')
-            closeexit(0)
-    except Exception as e:
-        logger.error('Error parsing list of data in getAssetData function')
-        logger.error('Data string follows')
-        logger.error(e, exc_info=True)
-        closeexit(1)
+    if data is None:  # If rules variable comes back null/empty
+        logger.info('No assets found')
+        closeexit(0)
+    return data
 
 
 def parsedata(data):
@@ -265,11 +371,17 @@ def closeexit(exit_code):
     else:  # Script had an error
         logger.info('Exiting script due to an error')
 
+    # Save the run summary next to the log file
+    instrument.writesummary(exit_code)
+
     # Cleanly close the logging files
     # Function below comes from pyLogging.py script
     loginstance.closeHandlers()
-    sys.exit()
+    sys.exit(exit_code)
 
 
 if __name__ == '__main__':
+    # Profile the run if requested, results are saved next to the log file
+    if optprofile:
+        instrument.startprofile(optprofilemem)
     main()
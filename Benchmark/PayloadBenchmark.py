@@ -0,0 +1,202 @@
+"""-------------------------------------------------------------------------------
+ Purpose:     Compares fetching vulndetails all at once and a page at a time against a stub server
+
+ Author:      DGarland
+-------------------------------------------------------------------------------
+
+Requirements:
+    pysecuritycenter Python module needs to be downloaded and installed
+
+    A small HTTP server standing in for SecurityCenter's analysis endpoint is
+    started on the local computer.  It answers with synthetic vulndetails
+    records carrying the full set of fields SecurityCenter returns.  The same
+    query is then made all at once (SecurityCenter5.analysis) and a page at a
+    time (pyCommon.analysispages), and the time until the first records can be
+    parsed and the total time are printed for each.
+"""
+
+# Import python modules
+import sys
+import os
+import getopt
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+# --- Get location and name of script and store as variables ---
+scriptloc = os.path.join(os.path.dirname(os.path.realpath(__file__)), '')
+parentloc = os.path.join(scriptloc, '..', '')
+
+# adds higher directory to python module path to import
+# custom modules one directory up
+sys.path.append(parentloc)
+sys.path.append(scriptloc)
+
+import SynthData
+
+#--- Prevent the creation of compiled import modules ---
+sys.dont_write_bytecode = True
+
+hosts = 500  # Number of hosts in the synthetic data
+pagesize = 1000  # Records per page
+
+# Get options passed via commandline
+try:
+    opts, args = getopt.getopt(sys.argv[1:], 'h', ['help', 'hosts=', 'pageSize='])
+except getopt.GetoptError as err:
+    print('Example: Benchmark/PayloadBenchmark.py')
+    print('Example: Benchmark/PayloadBenchmark.py --hosts 2000')
+    sys.exit(1)
+for opt, arg in opts:
+    if opt == '--hosts':
+        hosts = int(arg)
+    if opt == '--pageSize':
+        pagesize = int(arg)
+    if opt in ('-h', '--help'):
+        print('Example: Benchmark/PayloadBenchmark.py')
+        print('Example: Benchmark/PayloadBenchmark.py --hosts 2000')
+        sys.exit(0)
+
+# The rest of a vulndetails record, which the scripts never read
+EXTRAFIELDS = {
+    'pluginName': 'Software Enumeration (SSH)',
+    'firstSeen': '1480000000',
+    'exploitAvailable': 'No',
+    'exploitEase': '',
+    'exploitFrameworks': '',
+    'synopsis': 'It was possible to enumerate installed software on the remote host via SSH.',
+    'description': ('Nessus was able to list the software installed on the remote host by calling the '
+                    'appropriate command (e.g., \'rpm -qa\' on RPM-based Linux distributions, qpkg, dpkg, etc.).'),
+    'solution': 'Remove any software that is not in agreement with your organization\'s acceptable use and security policies.',
+    'seeAlso': '',
+    'riskFactor': 'None',
+    'stigSeverity': '',
+    'baseScore': '',
+    'temporalScore': '',
+    'cvssVector': '',
+    'cpe': '',
+    'vulnPubDate': '-1',
+    'patchPubDate': '-1',
+    'pluginPubDate': '1160481600',
+    'pluginModDate': '1543320000',
+    'checkType': 'local',
+    'version': '1.83',
+    'cve': '',
+    'bid': '',
+    'xref': '',
+    'severity': {'id': '0', 'name': 'Info', 'description': 'Informative'},
+    'family': {'id': '1', 'name': 'General', 'type': 'active'},
+    'repository': {'id': '1', 'name': 'Repository 1', 'description': ''},
+    'macAddress': '00:50:56:aa:bb:cc',
+    'uuid': '',
+    'hasBeenMitigated': '0',
+    'acceptRisk': '0',
+    'recastRisk': '0',
+}
+
+
+def makerecords():
+    '''Synthetic software and port records with every vulndetails field filled in'''
+    records = (SynthData.windowssoftware(hosts // 2, 100) + SynthData.unixsoftware(hosts // 2, 100) +
+               SynthData.ports(hosts, 5))
+    return [dict(EXTRAFIELDS, **x) for x in records]
+
+
+class clsStubHandler(BaseHTTPRequestHandler):
+    '''Answers POST /rest/analysis like SecurityCenter'''
+
+    records = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        query = body['query']
+        page = self.records[query['startOffset']:query['endOffset']]
+        content = json.dumps({'type': 'regular', 'error_code': 0, 'error_msg': '', 'response': {
+            'totalRecords': str(len(self.records)),
+            'returnedRecords': len(page),
+            'startOffset': str(query['startOffset']),
+            'endOffset': str(query['startOffset'] + len(page)),
+            'results': page}}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class clsStubSC(object):
+    '''Just enough of a SecurityCenter connection (post, analysis) to run analysis queries'''
+
+    def __init__(self, url):
+        import requests
+
+        self._url = url
+        self._session = requests.Session()
+        self.requests = 0
+
+    def post(self, path, **kwargs):
+        self.requests += 1
+        return self._session.post(self._url + path, **kwargs)
+
+    def analysis(self, *filters, **kwargs):
+        from securitycenter import SecurityCenter5
+
+        return SecurityCenter5.analysis(self, *filters, **kwargs)
+
+
+def firstpage(pages):
+    '''Read every page, noting when the first one arrived'''
+    first = None
+    records = []
+    for page in pages:
+        if first is None:
+            first = time.perf_counter()
+        records.extend(page)
+    return first, records
+
+
+def main():
+    from pyCommon import analysispages
+
+    clsStubHandler.records = makerecords()
+    server = HTTPServer(('127.0.0.1', 0), clsStubHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    url = 'http://127.0.0.1:{}/rest/'.format(server.server_port)
+
+    # What InstallSoftware.py and PortsServices.py ask for
+    filters = [('pluginID', '=', '20811,22869,25221,34252'), ('lastSeen', '=', '0:all')]
+
+    # The whole result has to arrive before SecurityCenter5.analysis returns,
+    # analysispages hands over the first page as soon as it is decoded
+    runs = [
+        ('SecurityCenter5.analysis', lambda sc: firstpage(
+            [sc.analysis(*filters, tool='vulndetails', page_size=pagesize) or []])),
+        ('pyCommon.analysispages', lambda sc: firstpage(
+            analysispages(sc, filters, tool='vulndetails', pagesize=pagesize))),
+    ]
+
+    print('')
+    print('{} records over {} hosts'.format(len(clsStubHandler.records), hosts))
+    print('{:<28}{:>10}{:>10}{:>16}{:>12}'.format(
+        'Query', 'Records', 'Requests', 'First page sec', 'Total sec'))
+    try:
+        for name, run in runs:
+            sc = clsStubSC(url)
+            start = time.perf_counter()
+            first, records = run(sc)
+            elapsed = time.perf_counter() - start
+            print('{:<28}{:>10}{:>10}{:>16.3f}{:>12.3f}'.format(
+                name, len(records), sc.requests, first - start, elapsed))
+    finally:
+        server.shutdown()
+    print('')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,563 @@
+"""-------------------------------------------------------------------------------
+ Purpose:     Benchmarks the parsing and writing stages of the SecurityCenter scripts
+
+ Author:      DGarland
+-------------------------------------------------------------------------------
+
+Requirements:
+    dicttoxml Python module needs to be downloaded and installed
+
+    The parse functions are imported straight out of the scripts and run
+    against synthetic data from SynthData.py, so no SecurityCenter is needed.
+    Each stage reports records per second and peak memory, and is compared
+    against the numbers stored in baseline.json.
+"""
+
+# Import python modules
+import sys
+import os
+import getopt
+import json
+import logging
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+# --- Get location and name of script and store as variables ---
+scriptloc = os.path.join(os.path.dirname(os.path.realpath(__file__)), '')
+parentloc = os.path.join(scriptloc, '..', '')
+
+# adds higher directory to python module path to import
+# custom modules one directory up
+sys.path.append(parentloc)
+sys.path.append(scriptloc)
+
+import SynthData
+
+#--- Prevent the creation of compiled import modules ---
+sys.dont_write_bytecode = True
+
+baselinefile = scriptloc + 'baseline.json'
+scale = 1.0  # Multiplier for the amount of synthetic data
+repeat = 3  # Number of timed runs per stage, the best one is kept
+tolerance = 0.15  # Allowed drop against the baseline before a stage is flagged
+optsave = False  # Variable option to store the results as the new baseline
+
+# Get options passed via commandline
+try:
+    opts, args = getopt.getopt(sys.argv[1:], 'hs', [
+                               'help', 'save', 'scale=', 'repeat=', 'tolerance='])
+except getopt.GetoptError as err:
+    print('Example: Benchmark/RunBenchmarks.py')
+    print('Example: Benchmark/RunBenchmarks.py --scale 5 --save')
+    sys.exit(1)
+for opt, arg in opts:
+    if opt in ('-s', '--save'):
+        optsave = True
+    if opt == '--scale':
+        scale = float(arg)
+    if opt == '--repeat':
+        repeat = int(arg)
+    if opt == '--tolerance':
+        tolerance = float(arg)
+    if opt in ('-h', '--help'):
+        print('Example: Benchmark/RunBenchmarks.py')
+        print('Example: Benchmark/RunBenchmarks.py --scale 5 --save')
+        sys.exit(0)
+
+
+def main():
+    # Keep the scripts' start up messages out of the results
+    logging.disable(logging.INFO)
+    # The scripts open their log files at import, keep them out of the script folders
+    logloc = os.path.join(tempfile.mkdtemp(), '')
+    IS = loadscript('InstallSoft', 'InstallSoftware.py', logloc)
+    PS = loadscript('PortServ', 'PortsServices.py', logloc)
+    GA = loadscript('Asset', 'GetAssets.py', logloc)
+    logging.disable(logging.NOTSET)
+
+    from pyCommon import writexml, writecsv, writedev
+    from pyParsers import softwareparsers, portparsers, stripoutput, clsRpmSoftware, clsWindowsSoftware
+    from pyPipeline import clsPipeline, batches
+
+    # Only warnings and errors from the scripts are wanted while timing
+    scriptlogger = logging.getLogger('pyLogging')
+    for handler in scriptlogger.handlers:
+        handler.close()
+    scriptlogger.handlers = []
+    shutil.rmtree(logloc, ignore_errors=True)
+    scriptlogger.setLevel(logging.WARNING)
+
+    def size(n):
+        return max(1, int(n * scale))
+
+    # Build the synthetic data up front so it isn't part of the timings
+    windows = SynthData.windowssoftware(size(200), 200)
+    rpm = SynthData.unixsoftware(size(200), 200, 'CentOS Linux')
+    solaris = SynthData.unixsoftware(size(100), 200, 'Solaris 11')
+    hpux = SynthData.unixsoftware(size(100), 200, 'HP-UX')
+    ports = SynthData.ports(size(2000), 10)
+    assets = SynthData.assets(size(200), 500)
+    rows = IS.parserecords(copyrecords(windows))[0][:size(20000)]
+    # dicttoxml and minidom are far slower than the rest, keep their run short
+    xmlrows = rows[:size(5000)]
+    # PortsServices rows are still dictionaries
+    portrows = PS.parserecords(copyrecords(ports))[0]
+    # Every kind of record the parsers handle, repeated to make the lookups measurable
+    mixed = (windows + rpm + solaris + hpux) * 50
+    mixedports = ports * 5
+
+    # Package lines on their own, for timing the line parsers without the rest of parserecords
+    rpmlines = [line for x in rpm for line in stripoutput(x['pluginText']).splitlines()[2:] if line]
+    rpmparser = clsRpmSoftware()
+    windowslines = [line for x in windows for line in stripoutput(x['pluginText']).splitlines()[2:] if line]
+    windowsparser = clsWindowsSoftware()
+
+    # Make sure the faster code still gives the same answers as what it replaced before timing it
+    verify(rpmlines, rpmparser, windowslines, windowsparser, windows)
+
+    # Parse and write InstallSoftware rows through the pipeline, as the script does
+    def pipeline(records):
+        runner = clsPipeline(scriptlogger)
+        runner.run(batches(records), lambda page: IS.parserecords(page)[0],
+                   lambda data: writecsv(outloc, 'benchpipe', data, scriptlogger, IS.csvfields))
+        return runner.result
+
+    # The rows of a page of records, as the pipeline asks each script for them
+    def parserows(script):
+        return lambda records: script.parserecords(records)[0]
+
+    def dispatch(records):
+        found = [softwareparsers.get(x['pluginID'], x['pluginText']) for x in records[0]]
+        return found + [portparsers.get(x['pluginID']) for x in records[1]]
+
+    outloc = os.path.join(tempfile.mkdtemp(), '')
+    try:
+        # Stage name, function to run and a function building its input
+        stages = [
+            ('InstallSoftware.parserecords 20811', parserows(IS), lambda: copyrecords(windows)),
+            ('InstallSoftware.parserecords 22869 RPM', parserows(IS), lambda: copyrecords(rpm)),
+            ('InstallSoftware.parserecords 22869 Solaris', parserows(IS), lambda: copyrecords(solaris)),
+            ('InstallSoftware.parserecords 22869 HP-UX', parserows(IS), lambda: copyrecords(hpux)),
+            ('PortsServices.parserecords 34252/25221', parserows(PS), lambda: copyrecords(ports)),
+            ('GetAssets.parsedata', GA.parsedata, lambda: assets),
+            ('pyParsers dispatch', dispatch, lambda: (mixed, mixedports)),
+            ('pyParsers RPM lines', lambda lines: [rpmparser.parse(x) for x in lines], lambda: rpmlines),
+            ('pyParsers Windows lines', lambda lines: [windowsparser.parse(x) for x in lines], lambda: windowslines),
+            ('pyCommon.writecsv', lambda data: writecsv(outloc, 'bench', data, scriptlogger, IS.csvfields),
+             lambda: rows),
+            ('pyCommon.writecsv dict rows', lambda data: writecsv(outloc, 'benchdict', data, scriptlogger, PS.csvfields),
+             lambda: portrows),
+            ('pyPipeline InstallSoftware 20811 CSV', pipeline, lambda: copyrecords(windows)),
+            ('pyCommon.writexml', lambda data: writexml(outloc, 'bench', data, 'SoftwareInventory', scriptlogger) or data,
+             lambda: xmlrows),
+            ('pyCommon.writedev', lambda data: writedev(outloc, 'bench', data, scriptlogger) or data,
+             lambda: windows),
+            ('pyCommon.writedev streamed', lambda data: writedev(outloc, 'bench', data, scriptlogger, pretty=False, xml=False) or data,
+             lambda: windows),
+        ]
+
+        results = {}
+        for name, func, makeinput in stages:
+            results[name] = measure(func, makeinput)
+    finally:
+        shutil.rmtree(outloc)
+
+    baseline = {}
+    basescale = scale
+    if os.path.exists(baselinefile):
+        with open(baselinefile, 'r') as fobj:
+            baseline = json.load(fobj)
+        # Baselines saved before the scale was stored were all taken at the default scale
+        basescale = baseline.get('scale', 1.0) if 'stages' in baseline else 1.0
+        baseline = baseline.get('stages', baseline)
+
+    if basescale != scale and not optsave:
+        # The rates and memory depend on the amount of data, so a different scale can't be compared
+        print('The baseline was taken with --scale {:g}, not comparing against this run with --scale {:g}'.format(
+            basescale, scale))
+        baseline = {}
+
+    regressions = report(results, baseline)
+
+    if optsave:
+        with open(baselinefile, 'w') as fobj:
+            json.dump({'scale': scale, 'stages': results}, fobj, sort_keys=True, indent=4)
+        print('Baseline saved to {}'.format(baselinefile))
+    elif regressions:
+        sys.exit(1)
+
+
+def loadscript(folder, script, logloc):
+    '''Import one of the scripts as a module without running its command line handling
+
+    The module's __file__ points into logloc, so the files the script writes next to
+    itself at import (its log files) end up there instead of the script folder.
+    '''
+    import importlib.util
+
+    path = os.path.join(parentloc, folder, script)
+    saved = sys.argv
+    sys.argv = [path]
+    try:
+        spec = importlib.util.spec_from_file_location(os.path.splitext(script)[0], path)
+        module = importlib.util.module_from_spec(spec)
+        module.__file__ = os.path.join(logloc, script)
+        spec.loader.exec_module(module)
+    finally:
+        sys.argv = saved
+    return module
+
+
+def copyrecords(records):
+    '''The parsers edit the records in place, so each run gets its own copies'''
+    return [dict(x) for x in records]
+
+
+def verify(rpmlines, rpmparser, windowslines, windowsparser, windows):
+    '''Check the parsers and matchers against the regular expressions and
+    ipaddress lookups they replaced, on the synthetic data
+
+    Raises
+    ------
+    AssertionError : if any of them gives a different answer
+    '''
+    # The checks log through their own logger so nothing is printed
+    logger = logging.getLogger('RunBenchmarks')
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+
+    print('Checked {} RPM and {} Windows lines against the old regular expressions'.format(
+        verifyrpm(rpmlines, rpmparser), verifywindows(windowslines, windowsparser)))
+    print('Checked {} addresses against ipaddress for clsIPRanges'.format(verifyranges()))
+    print('Checked {} rule checks against a query per check for clsRulePlanner'.format(verifyplanner()))
+    workloc = os.path.join(tempfile.mkdtemp(), '')
+    try:
+        print('Checked {} records read back in chunks by readdev'.format(verifyreaddev(workloc, windows, logger)))
+        print('Checked {} rule checks resumed from clsJournal'.format(verifyjournal(workloc, logger)))
+    finally:
+        shutil.rmtree(workloc)
+
+
+def verifyrpm(lines, parser):
+    '''RPM package lines split the same as InstallSoftware's old regular expressions'''
+    import re
+
+    for line in lines:
+        softname = re.findall(r'(?<=\s\s).*?(?=-\d)', line)[0]
+        version = re.findall(r'(?<=-)(\d.*)(?=\|)', line)[0]
+        assert parser.parse(line) == (softname, version, ''), line
+    return len(lines)
+
+
+def verifywindows(lines, parser):
+    '''Plugin 20811 lines split the same as InstallSoftware's old regular expressions'''
+    import re
+
+    for line in lines:
+        softname = re.findall(r'.*?(?=\[)', line)[0] if '[' in line else line
+        version = re.findall(r'(?<=\[version\s).*?(?=\])', line)[0] if '[version' in line else ''
+        installedon = re.findall(r'(?<=\[installed\son\s).*?(?=\])', line)[0] if '[installed' in line else ''
+        assert parser.parse(line) == (softname, version, installedon), line
+    return len(lines)
+
+
+def verifyranges():
+    '''clsIPRanges membership matches ipaddress for addresses, CIDR blocks and
+    ranges (IPv4, IPv6 and the short 10.0.3.1-20 form), including both ends
+    of each entry and the addresses just outside them
+    '''
+    import ipaddress
+    import random
+    from pyCommon import clsIPRanges
+
+    rnd = random.Random(1164)
+    base4 = int(ipaddress.ip_address('10.20.0.0'))
+    base6 = int(ipaddress.ip_address('2001:db8::'))
+    count = 0
+    for run in range(200):
+        # Each entry is its text and the first and last address it covers
+        entries = []
+        for index in range(rnd.randint(1, 6)):
+            kind = rnd.choice(['address', 'cidr', 'range', 'short', 'address6', 'cidr6', 'range6'])
+            if kind in ('address', 'address6'):
+                addr = ipaddress.ip_address((base4 if kind == 'address' else base6) + rnd.randint(0, 4096))
+                entries.append((str(addr), addr, addr))
+            elif kind in ('cidr', 'cidr6'):
+                # Host bits are left set at times, as SecurityCenter accepts them
+                addr = ipaddress.ip_address((base4 if kind == 'cidr' else base6) + rnd.randint(0, 4096))
+                text = '{}/{}'.format(addr, rnd.randint(22, 32) + (0 if kind == 'cidr' else 96))
+                network = ipaddress.ip_network(text, strict=False)
+                entries.append((text, network.network_address, network.broadcast_address))
+            else:
+                first = (base4 if kind != 'range6' else base6) + rnd.randint(0, 4096)
+                if kind == 'short':
+                    first -= first % 256 - rnd.randint(0, 200)
+                    last = first + rnd.randint(0, 255 - first % 256)
+                    text = '{}-{}'.format(ipaddress.ip_address(first), last % 256)
+                else:
+                    last = first + rnd.randint(0, 600)
+                    text = '{} - {}'.format(ipaddress.ip_address(first), ipaddress.ip_address(last))
+                entries.append((text, ipaddress.ip_address(first), ipaddress.ip_address(last)))
+
+        ranges = clsIPRanges(','.join(x[0] for x in entries))
+        addrs = [ipaddress.ip_address(x + rnd.randint(-50, 4146)) for x in (base4, base6) for y in range(20)]
+        for text, first, last in entries:
+            for x in (int(first) - 1, int(first), int(last), int(last) + 1):
+                addrs.append(ipaddress.ip_address(x))
+        for addr in addrs:
+            expected = any(addr.version == first.version and first <= addr <= last for text, first, last in entries)
+            assert (str(addr) in ranges) == expected, (str(addr), [x[0] for x in entries])
+        assert ranges.select([str(x) for x in addrs]) == [
+            str(x) for x in addrs if str(x) in ranges]
+        count += len(addrs)
+
+    for text in ('10.20.0.1,host1', '10.20.0.9-10.20.0.1', '10.20.0.1-2001:db8::1', '10.20.0.0/33', ','):
+        try:
+            clsIPRanges(text)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError('clsIPRanges accepted ' + text)
+    return count
+
+
+class clsStubSC(object):
+    '''Answers the analysis queries of clsRulePlanner from a list of synthetic
+    vulnerabilities, matching the IP filter with ipaddress the way SecurityCenter would
+    '''
+
+    def __init__(self, vulns, assets):
+        self._vulns = vulns
+        self._assets = assets
+        # (pluginID, assetID) to the ip filter of each query made for it
+        self.ipfilters = {}
+
+    def analysis(self, *filters, **kwargs):
+        values = dict((x[0], x[2]) for x in filters)
+        self.ipfilters.setdefault((values['pluginID'], values.get('assetID')), []).append(values['ip'])
+        ports = values['port'].split(',') if 'port' in values else None
+        found = [x for x in self._vulns
+                 if x['pluginID'] == values['pluginID'] and (ports is None or x['port'] in ports) and
+                 ('assetID' not in values or x['ip'] in self._assets[values['assetID']]) and
+                 targets(values['ip'], x['ip'])]
+        if kwargs['tool'] == 'sumip':
+            return [{'ip': x} for x in sorted(set(x['ip'] for x in found))]
+        return [{'ip': x['ip'], 'port': x['port']} for x in found]
+
+
+class clsFailingSC(object):
+    '''Fails any query, for checking a resumed run doesn't make any'''
+
+    def analysis(self, *filters, **kwargs):
+        raise AssertionError('Query made after resuming: {}'.format(filters))
+
+
+def targets(text, ip):
+    '''Whether ip is in a comma separated list of addresses, full ranges and CIDR blocks'''
+    import ipaddress
+
+    addr = ipaddress.ip_address(ip)
+    for entry in text.split(','):
+        if '/' in entry:
+            if addr in ipaddress.ip_network(entry, strict=False):
+                return True
+        elif '-' in entry:
+            first, last = [ipaddress.ip_address(x.strip()) for x in entry.split('-')]
+            if first <= addr <= last:
+                return True
+        elif addr == ipaddress.ip_address(entry):
+            return True
+    return False
+
+
+def syntheticrules(seed=1245):
+    '''Vulnerabilities, assets and rule checks for clsRulePlanner'''
+    rnd = random.Random(seed)
+    hosts = ['10.30.{}.{}'.format(x // 256, x % 256) for x in range(0, 1024, 3)]
+    ports = ['22', '80', '443', '445', '3389']
+    plugins = [str(x) for x in range(10001, 10009)]
+    vulns = [{'pluginID': rnd.choice(plugins), 'ip': rnd.choice(hosts), 'port': rnd.choice(ports)}
+             for x in range(1500)]
+    assets = {'1': set(hosts[::2]), '2': set(rnd.sample(hosts, 100))}
+    checks = []
+    for x in range(600):
+        roll = rnd.random()
+        if roll < 0.7:
+            # Mostly hosts that exist, some that don't
+            ip = rnd.choice(hosts) if rnd.random() < 0.8 else '10.30.{}.{}'.format(rnd.randint(0, 3), rnd.randint(0, 255))
+        elif roll < 0.8:
+            ip = '10.30.{}.{}/{}'.format(rnd.randint(0, 3), rnd.randint(0, 255), rnd.randint(26, 30))
+        elif roll < 0.9:
+            first = rnd.randint(0, 1000)
+            ip = '10.30.{}.{}-10.30.{}.{}'.format(first // 256, first % 256, (first + 20) // 256, (first + 20) % 256)
+        else:
+            ip = ','.join(rnd.sample(hosts, 2))
+        checks.append((rnd.choice(plugins), ip, rnd.choice([None] + ports), rnd.choice([None, None, '1', '2'])))
+    return vulns, assets, checks
+
+
+def expected(vulns, assets, check):
+    '''Answer to a check from a pass over every vulnerability, as a query per check would give'''
+    pluginid, ip, port, assetid = check
+    found = any(x['pluginID'] == pluginid and (port is None or x['port'] == port) and
+                (assetid is None or x['ip'] in assets[assetid]) and targets(ip, x['ip']) for x in vulns)
+    return 'True' if found else 'False'
+
+
+def verifyplanner():
+    '''clsRulePlanner answers every check the same as a query per check, and
+    queries each plugin (and asset) once per chunk of its targets
+    '''
+    from pyCommon import clsRulePlanner
+
+    vulns, assets, checks = syntheticrules()
+    sc = clsStubSC(vulns, assets)
+    chunksize = 7
+    planner = clsRulePlanner(sc, ('acceptRiskStatus', '=', 'accepted'), chunksize=chunksize)
+    for check in checks:
+        planner.add(*check)
+    planner.run()
+    for check in checks:
+        assert planner.applies(*check) == expected(vulns, assets, check), check
+
+    # Each group's targets are queried once each, in order, chunksize at a time
+    groups = {}
+    for pluginid, ip, port, assetid in checks:
+        groups.setdefault((pluginid, assetid), set()).add(ip)
+    assert set(sc.ipfilters) == set(groups)
+    for key, ips in groups.items():
+        assert len(sc.ipfilters[key]) == (len(ips) + chunksize - 1) // chunksize, key
+        assert ','.join(sc.ipfilters[key]) == ','.join(sorted(ips)), key
+    assert planner.queries == sum(len(x) for x in sc.ipfilters.values())
+    assert planner.checks == len(checks)
+    return len(checks)
+
+
+def verifyreaddev(workloc, records, logger):
+    '''readdev gives back the records writedev dumped, both as indented JSON and
+    as JSON lines, when records are split across the chunks it reads
+    '''
+    import json
+    from pyCommon import readdev, writedev
+
+    # Non-ASCII text and the separators readdev skips between records, inside the strings
+    records = records[:20] + [dict(records[0], pluginText='Caf\u00e9 [version 1], {"x": [null]}\n')]
+    writedev(workloc, 'verify', records, logger, xml=False)
+    writedev(workloc, 'verifylines', records, logger, pretty=False)
+    writedev(workloc, 'verifyempty', None, logger, xml=False)
+    with open(workloc + 'verify_dev.json', 'r', encoding='utf-8') as fobj:
+        assert json.load(fobj) == records
+    for chunksize in (1, 7, 64, 1048576):
+        assert list(readdev(workloc + 'verify_dev.json', logger, chunksize)) == records, chunksize
+        assert list(readdev(workloc + 'verifylines_dev.jsonl', logger, chunksize)) == records, chunksize
+        assert list(readdev(workloc + 'verifyempty_dev.json', logger, chunksize)) == []
+    return len(records)
+
+
+def verifyjournal(workloc, logger):
+    '''A run resumed from a clsJournal left open, as if the run had died, has
+    the rules, steps and planner answers of the first run without querying again
+    '''
+    from pyCommon import clsJournal, clsRulePlanner
+
+    vulns, assets, checks = syntheticrules(seed=959)
+    status = ('acceptRiskStatus', '=', 'accepted')
+    journal = clsJournal(workloc, 'verify', logger, interval=1000, seconds=3600)
+    journal.start()
+    planner = clsRulePlanner(clsStubSC(vulns, assets), status, chunksize=50, journal=journal)
+    for check in checks:
+        planner.add(*check)
+    planner.run()
+    rows = [['10.30.0.1', 'Rule 1', 'True'], ['10.30.0.2', 'Rule 1', 'False']]
+    journal.record('1', rows)
+    journal.recordstep('hosts 2', ['10.30.0.3'])
+    journal.flush()
+    # Half written line, as a run dying during a write leaves behind
+    with open(workloc + 'verify_journal.json', 'a', encoding='utf-8') as fobj:
+        fobj.write('{"ruleID": "2", "ro')
+
+    resumed = clsJournal(workloc, 'verify', logger)
+    resumed.start(True)
+    assert resumed.isdone('1') and resumed.getrows('1') == rows
+    assert not resumed.isdone('2')
+    assert resumed.getstep('hosts 2') == ['10.30.0.3']
+    again = clsRulePlanner(clsFailingSC(), status, chunksize=50, journal=resumed)
+    for check in checks:
+        again.add(*check)
+    again.run()
+    assert again.queries == 0
+    for check in checks:
+        assert again.applies(*check) == planner.applies(*check) == expected(vulns, assets, check), check
+    journal.close()
+    resumed.close(remove=True)
+    return len(checks)
+
+
+def measure(func, makeinput):
+    '''Time func over its input and record its peak memory
+
+    Returns
+    -------
+    dict : records processed, best elapsed seconds, records per second and peak memory in bytes
+
+    func returns either the records it produced or the number of them.
+    '''
+    best = None
+    for run in range(repeat):
+        data = makeinput()
+        start = time.perf_counter()
+        result = func(data)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    # Separate run for memory as tracemalloc slows everything down
+    data = makeinput()
+    tracemalloc.start()
+    result = func(data)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    records = result if isinstance(result, int) else len(result)
+    return {
+        'records': records,
+        'seconds': round(best, 4),
+        'rate': round(records / best, 1) if best else 0,
+        'peak': peak,
+    }
+
+
+def report(results, baseline):
+    '''Print the results next to the baseline
+
+    Returns
+    -------
+    int : number of stages that are slower or use more memory than the baseline allows
+    '''
+    regressions = 0
+    print('')
+    print('{:<42}{:>10}{:>14}{:>12}{:>10}{:>10}'.format(
+        'Stage', 'Records', 'Records/sec', 'Peak MB', 'Rate', 'Memory'))
+    for name, result in results.items():
+        ratechange = memchange = ''
+        flag = ''
+        if name in baseline:
+            base = baseline[name]
+            rate = result['rate'] / base['rate'] - 1 if base['rate'] else 0
+            mem = result['peak'] / base['peak'] - 1 if base['peak'] else 0
+            ratechange = '{:+.0%}'.format(rate)
+            memchange = '{:+.0%}'.format(mem)
+            if rate < -tolerance or mem > tolerance:
+                flag = '  << REGRESSION'
+                regressions += 1
+        print('{:<42}{:>10}{:>14.0f}{:>12.1f}{:>10}{:>10}{}'.format(
+            name, result['records'], result['rate'], result['peak'] / 1048576, ratechange, memchange, flag))
+    print('')
+    return regressions
+
+
+if __name__ == '__main__':
+    main()
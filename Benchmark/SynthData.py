@@ -0,0 +1,126 @@
+"""-------------------------------------------------------------------------------
+ Purpose:     Synthetic SecurityCenter data for benchmarking the parsers and writers
+
+ Author:      DGarland
+-------------------------------------------------------------------------------
+
+Each generator returns a list of dictionaries shaped like the records the
+pySecurityCenter module returns for the matching query, with plugin output
+laid out the way the Nessus plugins print it.  A fixed seed is used so
+every run works on exactly the same data.
+"""
+
+import random
+
+# Pieces used to build up believable software and host names
+VENDORS = ['Microsoft', 'Adobe', 'Oracle', 'Google', 'Mozilla', 'VMware', 'Cisco', 'Intel']
+PRODUCTS = ['Visual C++ 2015 Redistributable', 'Acrobat Reader DC', 'Java 8 Update 191',
+            'Chrome', 'Firefox ESR', 'Tools', 'AnyConnect Client', 'Management Engine Components',
+            'SQL Server 2014 Native Client', '.NET Framework 4.7.2', 'Office Professional Plus 2016']
+RPMPACKAGES = ['bash', 'openssl-libs', 'kernel', 'glibc-common', 'perl-XML-Simple', 'python-libs',
+               'systemd-sysv', 'NetworkManager-team', 'yum-plugin-fastestmirror', 'libstdc++']
+SOLARISPACKAGES = ['archiver/gnutar', 'shell/bash', 'library/security/openssl', 'network/ssh']
+HPUXPACKAGES = ['PHCO_44111', 'PHKL_43975', 'PHSS_44317', 'OpenSSL', 'Ignite-UX-11-31']
+WINPROCESSES = ['svchost.exe', 'lsass.exe', 'System', 'spoolsv.exe', 'wininit.exe', 'services.exe']
+NIXPROCESSES = ['/usr/sbin/sshd', '/usr/sbin/ntpd', '/usr/sbin/rpcbind', '/usr/lib/postfix/master']
+
+
+def _host(rnd, index):
+    '''Common fields shared by all vulndetails records for a host'''
+    ip = '10.{}.{}.{}'.format(index // 65536 % 256, index // 256 % 256, index % 256)
+    name = 'host{:05d}'.format(index)
+    return {
+        'ip': ip,
+        'dnsName': '{}.corp.example.com'.format(name) if rnd.random() < 0.7 else '',
+        'netbiosName': 'CORP\\{}'.format(name.upper()),
+        'lastSeen': str(1500000000 + rnd.randint(0, 86400 * 30)),
+        'protocol': 'TCP',
+        'port': '0',
+    }
+
+
+def windowssoftware(hosts, lines, seed=20811):
+    '''Plugin 20811 (Microsoft Windows Installed Software Enumeration) records'''
+    rnd = random.Random(seed)
+    records = []
+    for index in range(hosts):
+        entries = []
+        for line in range(lines):
+            name = '{} {} {}'.format(rnd.choice(VENDORS), rnd.choice(PRODUCTS), line)
+            roll = rnd.random()
+            if roll < 0.8:
+                entries.append('{}  [version {}.{}.{}]  [installed on {}/{:02d}/{:02d}]'.format(
+                    name, rnd.randint(1, 20), rnd.randint(0, 9), rnd.randint(0, 9999),
+                    rnd.randint(2012, 2019), rnd.randint(1, 12), rnd.randint(1, 28)))
+            elif roll < 0.9:
+                entries.append('{}  [version {}.{}]'.format(name, rnd.randint(1, 20), rnd.randint(0, 99)))
+            else:
+                entries.append(name)
+        text = ('<plugin_output>\nThe following software are installed on the remote host :\n\n' +
+                '\n'.join(entries) +
+                '\n\nThe following updates are installed :\n\nMicrosoft .NET Framework 4.7.2 :\n  KB4087364\n</plugin_output>')
+        records.append(dict(_host(rnd, index), pluginID='20811', pluginText=text))
+    return records
+
+
+def unixsoftware(hosts, lines, system='CentOS Linux', seed=22869):
+    '''Plugin 22869 (Software Enumeration (SSH)) records for RPM, Solaris 11 or HP-UX systems'''
+    rnd = random.Random(seed)
+    records = []
+    for index in range(hosts):
+        entries = []
+        for line in range(lines):
+            if system in ('CentOS Linux', 'Red Hat Linux'):
+                entries.append('  {}{}-{}.{}.{}-{}.el7.x86_64|(none)|Tue 17 Mar 2015 06:48:27 PM CDT'.format(
+                    rnd.choice(RPMPACKAGES), line, rnd.randint(1, 5), rnd.randint(0, 20),
+                    rnd.randint(0, 99), rnd.randint(1, 60)))
+            elif system == 'Solaris 11':
+                entries.append('  {}{}    {}.{}.{}-0.175.3.0.0.24.0    i--'.format(
+                    rnd.choice(SOLARISPACKAGES), line, rnd.randint(1, 5), rnd.randint(0, 20), rnd.randint(0, 9)))
+            else:
+                entries.append('  {}{}    B.11.{}.{}'.format(
+                    rnd.choice(HPUXPACKAGES), line, rnd.randint(11, 31), rnd.randint(0, 99)))
+        text = ('<plugin_output>\nHere is the list of packages installed on the remote {} system : \n\n'.format(system) +
+                '\n'.join(entries) + '\n\n</plugin_output>')
+        records.append(dict(_host(rnd, index), pluginID='22869', pluginText=text))
+    return records
+
+
+def ports(hosts, portsperhost, seed=34252):
+    '''Plugin 34252 (Microsoft Windows Remote Listeners Enumeration) and
+    25221 (Remote listeners enumeration (Linux / AIX)) records, half of each
+    '''
+    rnd = random.Random(seed)
+    records = []
+    for index in range(hosts):
+        host = _host(rnd, index)
+        windows = index % 2 == 0
+        for port in range(portsperhost):
+            record = dict(host, port=str(rnd.randint(1, 65535)), protocol=rnd.choice(['TCP', 'UDP']))
+            if windows:
+                record['pluginID'] = '34252'
+                record['pluginText'] = ("<plugin_output>\nThe Win32 process '{}' is listening on this port (pid {}).\n"
+                                        "</plugin_output>").format(rnd.choice(WINPROCESSES), rnd.randint(4, 9999))
+            else:
+                record['pluginID'] = '25221'
+                record['pluginText'] = ('<plugin_output>\nProcess id   : {}\nExecutable   : {}\n'
+                                        'Command line : {} -D\n</plugin_output>').format(
+                                            rnd.randint(1, 65535), rnd.choice(NIXPROCESSES), rnd.choice(NIXPROCESSES))
+            records.append(record)
+    return records
+
+
+def assets(count, ipsperasset, seed=1):
+    '''Records from the 'asset' endpoint with their viewable IP lists'''
+    rnd = random.Random(seed)
+    records = [{'id': '0', 'name': 'All Defined Ranges', 'description': '', 'viewableIPs': []}]
+    for index in range(1, count + 1):
+        ips = ''.join('10.{}.{}.{}|host{}\n'.format(index % 256, ip // 256 % 256, ip % 256, ip)
+                      for ip in range(ipsperasset))
+        records.append({
+            'id': str(index),
+            'name': 'Asset {}'.format(index),
+            'description': 'Synthetic asset {}'.format(rnd.randint(0, 99999)),
+            'viewableIPs': [{'ipList': ips}],
+        })
+    return records
@@ -0,0 +1,293 @@
+'''-------------------------------------------------------------------------------
+Purpose:     Gathers Installed Software and Ports and Services from SecurityCenter
+             with a single query
+
+Author:      DGarland
+-------------------------------------------------------------------------------
+
+Requirements:
+    dicttoxml and pysecuritycenter Python modules needs to be downloaded and installed
+
+    'pyLogging.py' file is a set of reusable code so that the scripts
+    can write to both console (when this script is ran from console) as well
+    as to a defined log file.
+
+    'pyCommon.py' file is a set of reusable code for various purposes.  Most of my
+    scripts make use of the functions in this Python script.
+
+    'pyParsers.py' file holds the parsers for the plugin output.  This script
+    uses the same ones as InstallSoftware.py and PortsServices.py, and writes
+    the same two reports they do.
+'''
+
+# Import python modules
+import sys
+import os
+import getpass
+import getopt
+from configparser import ConfigParser
+
+# adds higher directory to python module path to import
+# custom modules one directory up
+sys.path.append(".")
+
+# Import reusable code dealing with setting up logging
+from pyLogging import clsLogging, clsInstrument
+from pyCommon import openformats, OUTPUTFORMATS
+from pyPipeline import clsCollector, batches
+from pyParsers import softwareparsers, portparsers, softwarerows, portrow, clsSoftwareRow
+
+#--- Prevent the creation of compiled import modules ---
+sys.dont_write_bytecode = True
+
+# --- Get location and name of script and store as variables ---
+scriptloc = os.path.join(os.path.dirname(os.path.realpath(__file__)), '')
+# What to save all files as (leave out file extension)
+scriptname = os.path.splitext(os.path.basename(__file__))[0]
+
+repoID = '0'  # Set repository ID to All
+endDay = '0'
+startDay = 'all'
+optcsv = False  # Variable option to write to CSV
+formats = []  # Output formats to write in one pass (xml, csv, jsonl, sqlite)
+optcache = False  # Variable option to cache SecurityCenter responses locally
+cachettl = 24  # Hours a cached SecurityCenter response stays valid
+optmetrics = False  # Variable option to write Prometheus metrics next to the report
+optprofile = False  # Variable option to profile the run with cProfile
+optprofilemem = False  # Variable option to also take tracemalloc snapshots per stage
+optasynclog = False  # Variable option to write the log from a background thread
+optjsonlog = False  # Variable option to also write the log as JSON lines
+filelevel = 'DEBUG'  # Lowest level of message written to the log file
+consolelevel = 'DEBUG'  # Lowest level of message written to the console
+replayfile = ''  # writedev JSON dump to replay instead of querying SecurityCenter
+optcapture = False  # Variable option to save the raw SecurityCenter records as they are fetched
+optcapturexml = False  # Variable option to also save the raw records as XML
+workers = 4  # Number of repositories collected at the same time
+
+# Get options passed via commandline
+try:
+    opts, args = getopt.getopt(sys.argv[1:], 'hcr:', [
+                               'help', 'csv', 'formats=', 'repoID=', 'endDay=', 'startDay=', 'cache', 'cacheTTL=', 'metrics', 'profile', 'profileMemory', 'asyncLog', 'jsonLog', 'fileLevel=', 'consoleLevel=', 'replay=', 'capture', 'captureXML', 'workers='])
+except getopt.GetoptError as err:
+    print('Example: HostInventory/HostInventory.py -r 1')
+    print('Example: HostInventory/HostInventory.py --startDay 90 --endDay 30')
+    sys.exit(1)
+for opt, arg in opts:
+    if opt in ('-r', '--repoID'):
+        repoID = str(arg)
+    if opt == '--endDay':
+        endDay = str(arg)
+    if opt == '--startDay':
+        startDay = str(arg)
+    if opt in ('-h', '--help'):
+        print('Example: HostInventory/HostInventory.py -r 1')
+        print('Example: HostInventory/HostInventory.py --startDay 90 --endDay 30')
+        print('Example: HostInventory/HostInventory.py -r each --workers 8')
+        print('Example: HostInventory/HostInventory.py --cache --cacheTTL 12')
+        print('Example: HostInventory/HostInventory.py --replay HostInventory_dev.json')
+        print('Example: HostInventory/HostInventory.py --capture')
+        print('Example: HostInventory/HostInventory.py --metrics')
+        print('Example: HostInventory/HostInventory.py --profile')
+        print('Example: HostInventory/HostInventory.py --asyncLog --consoleLevel WARNING')
+        print('Example: HostInventory/HostInventory.py --formats xml,csv,jsonl,sqlite')
+        sys.exit(0)
+    if opt in ('-c', '--csv'):
+        optcsv = True
+    if opt == '--formats':
+        formats = [x.strip().lower() for x in arg.split(',') if x.strip()]
+    if opt == '--cache':
+        optcache = True
+    if opt == '--cacheTTL':
+        cachettl = int(arg)
+    if opt == '--metrics':
+        optmetrics = True
+    if opt == '--profile':
+        optprofile = True
+    if opt == '--profileMemory':
+        optprofile = True
+        optprofilemem = True
+    if opt == '--asyncLog':
+        optasynclog = True
+    if opt == '--jsonLog':
+        optjsonlog = True
+    if opt == '--fileLevel':
+        filelevel = str(arg)
+    if opt == '--consoleLevel':
+        consolelevel = str(arg)
+    if opt == '--replay':
+        replayfile = str(arg)
+    if opt == '--capture':
+        optcapture = True
+    if opt == '--captureXML':
+        optcapture = True
+        optcapturexml = True
+    if opt == '--workers':
+        workers = int(arg)
+
+# Without --formats the report is written as XML, or CSV if requested
+if not formats:
+    formats = ['csv'] if optcsv else ['xml']
+for outputformat in formats:
+    if outputformat not in OUTPUTFORMATS:
+        print('Unknown output format {}, use any of {}'.format(outputformat, ','.join(OUTPUTFORMATS)))
+        sys.exit(1)
+
+# Cache folder is shared by all of the scripts
+cacheloc = os.path.join(scriptloc, '..', 'cache', '')
+
+#--- Begin Logging Configuration Section ---
+# Initialize logging
+loginstance = clsLogging(scriptloc, scriptname)
+logger = loginstance.setup(queued=optasynclog, filelevel=filelevel, consolelevel=consolelevel, jsonlog=optjsonlog)
+loginstance.setcontext(repoID=repoID)
+
+logger.info('Running on Python version {}'.format(sys.version))
+
+# Track time spent per stage and calls made to SecurityCenter
+instrument = clsInstrument(scriptloc, scriptname, logger, loginstance)
+
+# Columns of the CSV reports, in order (the same as InstallSoftware.py and PortsServices.py)
+softwarefields = clsSoftwareRow._fields
+portfields = ['AssetName', 'IPAddress', 'Protocol', 'IPVersion', 'PortNumber', 'Process', 'CreateDate', 'pluginText']
+
+
+def main():
+    configfile = os.path.join(os.path.dirname(
+        os.path.abspath(__file__)), '..', 'config.conf')
+    config = ConfigParser()
+
+    if not os.path.exists(configfile):
+        # Well there wasn't a config file located in the parent directory
+        # so we should create a new one.
+        config.add_section('SecurityCenter')
+        config.set('SecurityCenter', 'host', input(
+            'SecurityCenter IP Address : '))
+        config.set('SecurityCenter', 'user', input(
+            'SecurityCenter Username : '))
+        config.set('SecurityCenter', 'pass', getpass.getpass(
+            'SecurityCenter Password : '))
+        config.set('SecurityCenter', 'path', os.path.join(input(
+            'Folder to place reports : '), ''))
+
+        with open(configfile, 'w') as fobj:
+            config.write(fobj)
+    else:
+        config.read(configfile)
+
+    hostip = config.get('SecurityCenter', 'host')
+    username = config.get('SecurityCenter', 'user')
+    password = config.get('SecurityCenter', 'pass')
+    fldrloc = config.get('SecurityCenter', 'path')
+
+    # Write the run metrics next to the report if requested
+    if optmetrics:
+        instrument.enablemetrics(fldrloc)
+
+    # Plugins of both reports (20811,22869 and 25221,34252)
+    plugins = softwareparsers.plugins() + ',' + portparsers.plugins()
+
+    # One query for the plugins of both reports rather than one per report,
+    # collected, parsed and written like InstallSoftware.py and
+    # PortsServices.py do, see pyPipeline.py
+    collector = clsCollector(logger, instrument, closeexit, plugins, parserecords, writerows,
+                             endday=endDay, startday=startDay, cacheloc=cacheloc if optcache else None,
+                             cachettl=cachettl * 3600, capture=optcapture, capturexml=optcapturexml,
+                             workers=workers)
+
+    # Exits the script once done
+    collector.run(hostip, username, password, fldrloc, scriptname, repoID, replayfile)
+
+
+def writerows(fldrloc, name, rows):
+    '''Split the parsed rows between the software and the ports reports,
+    writing both as the rows arrive, and return the number written.  Errors
+    are raised for the caller to handle.
+
+    Saved under the same names InstallSoftware.py and PortsServices.py use,
+    with the repository of name (ie. HostInventory-Repo1 is saved as
+    InstallSoftware-Repo1 and PortsServices-Repo1).
+    '''
+    reposuffix = name[len(os.path.splitext(os.path.basename(__file__))[0]):]
+
+    software = openformats(fldrloc, 'InstallSoftware' + reposuffix, formats, 'SoftwareInventory', logger, softwarefields)
+    try:
+        ports = openformats(fldrloc, 'PortsServices' + reposuffix, formats, 'PortsAndServices', logger, portfields)
+    except:
+        software.abort()
+        raise
+
+    try:
+        for batch in batches(rows, 10000):
+            found = [x for x in batch if x.__class__ is clsSoftwareRow]
+            if found:
+                software.write(found)
+            found = [x for x in batch if x.__class__ is not clsSoftwareRow]
+            if found:
+                ports.write(found)
+        softwarecount = software.close()
+        portcount = ports.close()
+    except:
+        software.abort()
+        ports.abort()
+        raise
+
+    logger.info('{} software and {} ports rows written'.format(softwarecount, portcount))
+    return softwarecount + portcount
+
+
+def parserecords(data):
+    '''--- Parse the data collected from SecurityCenter ---
+    Each record goes to the software or the ports report by its pluginID, and
+    is parsed the same way InstallSoftware.py and PortsServices.py do (see
+    pyParsers.py).  Errors are raised.
+
+    Returns
+    -------
+    tuple : list of clsSoftwareRow and ports and services dictionaries, and the number of records read
+    '''
+    newlist = []
+
+    # Number of unique records found, counted as they are parsed since
+    # replayed data is streamed in rather than held in a list
+    count = 0
+
+    for x in data:
+        count += 1
+
+        if portparsers.get(x['pluginID']) is not None:
+            #--- Ports and services ---
+            row = portrow(x, logger)
+            if row is not None:
+                newlist.append(row)
+        else:
+            #--- Installed software ---
+            newlist.extend(softwarerows(x, logger))
+
+    return newlist, count
+
+
+def closeexit(exit_code):
+    """Function to handle exiting the script either cleanly or with an error
+
+    exit_code - 0 for clean exit, 1 for exiting due to script error
+    """
+
+    if exit_code == 0:  # Script completed without an error
+        logger.info('Script complete')
+    else:  # Script had an error
+        logger.info('Exiting script due to an error')
+
+    # Save the run summary next to the log file
+    instrument.writesummary(exit_code)
+
+    # Cleanly close the logging files
+    # Function below comes from pyLogging.py script
+    loginstance.closeHandlers()
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    # Profile the run if requested, results are saved next to the log file
+    if optprofile:
+        instrument.startprofile(optprofilemem)
+    main()
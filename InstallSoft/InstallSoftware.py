@@ -27,8 +27,10 @@ from configparser import ConfigParser
 sys.path.append(".")
 
 # Import reusable code dealing with setting up logging
-from pyLogging import clsLogging
-from pyCommon import converttime, writexml, gethostname, writecsv
+from pyLogging import clsLogging, clsInstrument
+from pyCommon import writeformats, OUTPUTFORMATS
+from pyPipeline import clsCollector
+from pyParsers import softwareparsers, softwarerows, clsSoftwareRow
 
 #--- Prevent the creation of compiled import modules ---
 sys.dont_write_bytecode = True
@@ -43,11 +45,26 @@ filename = ''  # Initialize filename variable to empty
 endDay = '0'
 startDay = 'all'
 optcsv = False  # Variable option to write to CSV
+formats = []  # Output formats to write in one pass (xml, csv, jsonl, sqlite)
+optcache = False  # Variable option to cache SecurityCenter responses locally
+cachettl = 24  # Hours a cached SecurityCenter response stays valid
+optmetrics = False  # Variable option to write Prometheus metrics next to the report
+optprofile = False  # Variable option to profile the run with cProfile
+optprofilemem = False  # Variable option to also take tracemalloc snapshots per stage
+optasynclog = False  # Variable option to write the log from a background thread
+optjsonlog = False  # Variable option to also write the log as JSON lines
+filelevel = 'DEBUG'  # Lowest level of message written to the log file
+consolelevel = 'DEBUG'  # Lowest level of message written to the console
+replayfile = ''  # writedev JSON dump to replay instead of querying SecurityCenter
+optcapture = False  # Variable option to save the raw SecurityCenter records as they are fetched
+optcapturexml = False  # Variable option to also save the raw records as XML
+optmerge = False  # Variable option to also write all repositories to one file
+workers = 4  # Number of repositories collected at the same time
 
 # Get options passed via commandline
 try:
     opts, args = getopt.getopt(sys.argv[1:], 'hcr:f:', [
-                               'help', 'csv', 'repoID=', 'filename=', 'endDay=', 'startDay='])
+                               'help', 'csv', 'formats=', 'repoID=', 'filename=', 'endDay=', 'startDay=', 'cache', 'cacheTTL=', 'metrics', 'profile', 'profileMemory', 'asyncLog', 'jsonLog', 'fileLevel=', 'consoleLevel=', 'replay=', 'capture', 'captureXML', 'merge', 'workers='])
 except getopt.GetoptError as err:
     print('Example: InstallSoft/InstallSoftware.py -r 1')
     print('Example: InstallSoft/InstallSoftware.py -r 1 -f "siteInstalledSoftware"')
@@ -56,7 +73,6 @@ except getopt.GetoptError as err:
 for opt, arg in opts:
     if opt in ('-r', '--repoID'):
         repoID = str(arg)
-        scriptname = scriptname + '-Repo' + repoID
     if opt in ('-f', '--filename'):
         filename = str(arg)
     if opt in '--endDay':
@@ -67,20 +83,79 @@ for opt, arg in opts:
         print('Example: InstallSoft/InstallSoftware.py -r 1')
         print('Example: InstallSoft/InstallSoftware.py -r 1 -f "siteInstalledSoftware"')
         print('Example: InstallSoft/InstallSoftware.py --startDay 90 --endDay 30')
+        print('Example: InstallSoft/InstallSoftware.py -r 1,2,5 --merge')
+        print('Example: InstallSoft/InstallSoftware.py -r each --workers 8')
+        print('Example: InstallSoft/InstallSoftware.py --cache --cacheTTL 12')
+        print('Example: InstallSoft/InstallSoftware.py --replay InstallSoftware_dev.json')
+        print('Example: InstallSoft/InstallSoftware.py --capture')
+        print('Example: InstallSoft/InstallSoftware.py --metrics')
+        print('Example: InstallSoft/InstallSoftware.py --profile')
+        print('Example: InstallSoft/InstallSoftware.py --asyncLog --consoleLevel WARNING')
+        print('Example: InstallSoft/InstallSoftware.py --formats xml,csv,jsonl,sqlite')
         sys.exit(0)
     if opt in ('-c', '--csv'):
         optcsv = True
+    if opt == '--formats':
+        formats = [x.strip().lower() for x in arg.split(',') if x.strip()]
+    if opt == '--cache':
+        optcache = True
+    if opt == '--cacheTTL':
+        cachettl = int(arg)
+    if opt == '--metrics':
+        optmetrics = True
+    if opt == '--profile':
+        optprofile = True
+    if opt == '--profileMemory':
+        optprofile = True
+        optprofilemem = True
+    if opt == '--asyncLog':
+        optasynclog = True
+    if opt == '--jsonLog':
+        optjsonlog = True
+    if opt == '--fileLevel':
+        filelevel = str(arg)
+    if opt == '--consoleLevel':
+        consolelevel = str(arg)
+    if opt == '--replay':
+        replayfile = str(arg)
+    if opt == '--capture':
+        optcapture = True
+    if opt == '--captureXML':
+        optcapture = True
+        optcapturexml = True
+    if opt == '--merge':
+        optmerge = True
+    if opt == '--workers':
+        workers = int(arg)
+
+# Without --formats the report is written as XML, or CSV if requested
+if not formats:
+    formats = ['csv'] if optcsv else ['xml']
+for outputformat in formats:
+    if outputformat not in OUTPUTFORMATS:
+        print('Unknown output format {}, use any of {}'.format(outputformat, ','.join(OUTPUTFORMATS)))
+        sys.exit(1)
 
 if filename:
     scriptname = filename
 
+# Cache folder is shared by all of the scripts
+cacheloc = os.path.join(scriptloc, '..', 'cache', '')
+
 #--- Begin Logging Configuration Section ---
 # Initialize logging
 loginstance = clsLogging(scriptloc, scriptname)
-logger = loginstance.setup()
+logger = loginstance.setup(queued=optasynclog, filelevel=filelevel, consolelevel=consolelevel, jsonlog=optjsonlog)
+loginstance.setcontext(repoID=repoID)
 
 logger.info('Running on Python version {}'.format(sys.version))
 
+# Track time spent per stage and calls made to SecurityCenter
+instrument = clsInstrument(scriptloc, scriptname, logger, loginstance)
+
+# Columns of the CSV report, in order
+csvfields = clsSoftwareRow._fields
+
 
 def main():
     configfile = os.path.join(os.path.dirname(
@@ -110,122 +185,37 @@ def main():
     password = config.get('SecurityCenter', 'pass')
     fldrloc = config.get('SecurityCenter', 'path')
 
+    # Write the run metrics next to the report if requested
+    if optmetrics:
+        instrument.enablemetrics(fldrloc)
+
+    # Collect, parse and write the data, see pyPipeline.py
+    collector = clsCollector(logger, instrument, closeexit, softwareparsers.plugins(), parserecords, writerows,
+                             endday=endDay, startday=startDay, cacheloc=cacheloc if optcache else None,
+                             cachettl=cachettl * 3600, capture=optcapture, capturexml=optcapturexml,
+                             merge=optmerge, workers=workers)
+
+    # Exits the script once done
+    collector.run(hostip, username, password, fldrloc, scriptname, repoID, replayfile)
+
+
+def writerows(fldrloc, name, rows):
+    '''Write parsed rows from any iterable to each of the requested formats,
+    reading them once, and return the number written.  Errors are raised for
+    the caller to handle.
+    '''
     # What the element header for each set of data should be called
     elementname = 'SoftwareInventory'
+    return writeformats(fldrloc, name, rows, formats, elementname, logger, csvfields)
 
-    # Begin collecting data from SecurityCenter
-    data = collect(hostip, username, password)
-
-    # Enable the writedev line below to help with development and
-    # troubleshooting data from SecurityCenter
-    #
-    # Creates a JSON and XML output of the raw SecurityCenter data
-    #
-    # If you are developing, it is helpful to comment out the
-    # data = parsedata(data) and writexml lines in order to get the JSON
-    # file by itself to see what the data structure is like
-    #writedev(fldrloc, scriptname, data, logger)
-
-    # Parse the data retrieved from SecurityCenter
-    data = parsedata(data)
-
-    # Write parse data (stored as dictionary objects in a list variable) to XML
-    try:
-        if optcsv:
-            writecsv(fldrloc, scriptname, data, logger)
-        else:
-            writexml(fldrloc, scriptname, data, elementname, logger)
-    except Exception:
-        logger.error('Error in writexml function', exc_info=True)
-        closeexit(1)
-
-    # Close log file and exit script cleanly
-    closeexit(0)
-
-
-def collect(hostip, username, password):
-    '''--- Collect data from SecurityCenter ---
-
-       Refer to the following sites for more information on how to build the query
-       pySecurityCenter Python Module
-       https://github.com/SteveMcGrath/pySecurityCenter
-       https://github.com/SteveMcGrath/pySecurityCenter/tree/master/examples/sc5
-
-       SecurityCenter 5 API
-       https://support.tenable.com/support-center/cerberus-support-center/includes/widgets/sc_api/index.html
-
-       Tenable Community Forum for pySecurityCenter module
-       https://community.tenable.com/search.jspa?q=pysecuritycenter
-    '''
 
-    try:
-        # Import SecurityCenter5 class from securitycenter module
-        from securitycenter import SecurityCenter5
-    except Exception:
-        # Log error and exit script
-        logger.error('Failed to import SecurityCenter module')
-        logger.error('Likely cause is that the securitycenter module has not been downloaded and installed. See https://pypi.python.org/pypi/pySecurityCenter', exc_info=True)
-        closeexit(1)
-
-    #--- Connect to SecurityCenter ---
-    try:
-        # Create connection to SecurityCenter server using variables stored in pyTenableConfig.py
-        # Results are returned as a series of dictionary objects within the 'sc' list variable
-        sc = SecurityCenter5(hostip)
-        sc.login(username, password)
-    except Exception:
-        # Log error and exit script
-        logger.error('Failed to connect to SecurityCenter server')
-        logger.error(
-            'Likely cause is that the credentials to login into SecurityCenter are incorrect', exc_info=True)
-        closeexit(1)
-
-    #--- Retrieve data from SecurityCenter and export to XML ---
-    # Filters must be applied in tuples and with the pysecuritycenter modules, filters are and-ed together.
-
-    try:
-        # Get data from SecurityCenter
-        logger.info('Getting data from SecurityCenter')
-        #
-        # Edit the details line below only
-        #
-        # Explanations:
-        #   ('repositoryIDs','=','1')  # NRG NERC Repository
-        #   ('pluginID','=','20811')  # plugin to list Installed Software from Windows
-        #   ('lastSeen','=','0:1')  # Last seen in the past day
-        #   tool='vulndetails' # Provides plugin detailed info.  This maps to the 'Vulnerability Detail List' dropdown option on the Analysis page in SecurityCenter
-        #
-        if repoID == '0':
-            details = sc.analysis(
-                ('pluginID', '=', '20811,22869'), ('lastSeen', '=', endDay+':'+startDay), tool='vulndetails')
-        else:
-            details = sc.analysis(('repositoryIDs', '=', repoID), ('pluginID',
-                                                                   '=', '20811,22869'), ('lastSeen', '=', endDay+':'+startDay), tool='vulndetails')
-        # Each entry of data is returned as a dictionary variable stored in list 'details'
-        return details
-    except Exception:
-        # Problem with trying to get data from SecurityCenter
-        # Log error and exit script
-        logger.error('Failed to get data from SecurityCenter')
-        logger.error('Likely cause is the query is malformed', exc_info=True)
-        closeexit(1)
-
-
-def parsedata(data):
+def parserecords(data):
     '''--- Parse the data collected from SecurityCenter ---
-    This function is the only one that really needs to be modified to parse
-    the data returned from SecurityCenter into a format to be converted and
-    saved as XML.
-
     Data retrieved from SecurityCenter using the pySecurityCenter module is
-    stored as dictionary objects (for each entry) and all dictionary objects
-    are stored into a single list variable.
-
-    For more information on dictionaries and lists see:
-        http://sthurlow.com/python/lesson06/
-
-    Since the data comes in as dictionaries stored in a single list, the parsed
-    data coming out should also be as dictionaries stored in a single list.
+    stored as dictionary objects (for each entry).  It is parsed a page at a
+    time by the pipeline (see pyPipeline.py), one clsSoftwareRow per package.
+    The same host, IP, date and package strings repeat across many rows, so
+    they are interned to share one copy of each.  Errors are raised.
 
     data structure notes, just here for reference while writing code:
          <SoftwareInventory>
@@ -237,136 +227,27 @@ def parsedata(data):
            <InstallDate>Tue 17 Mar 2015 06:48:27 PM CDT</InstallDate>
            <CreateDate>2017-08-30T07:00:24.277</CreateDate>
          </SoftwareInventory>
+
+    Returns
+    -------
+    tuple : list of clsSoftwareRow rows and the number of records read
     '''
+    # Create a new list
+    newlist = []
 
-    if data is not None:  # If details variable doesn't come back null/empty
-        #--- Import additional Python modules needed ---
-        # re module should already be embedded in Python
-        import re
-
-        # Create a new list
-        newlist = []
-        # Create a new dictionary
-        newdict = {}
-
-        logger.info('Processing data from SecurityCenter')
-
-        # Determine the number of unique records were found
-        logger.info('{} unique records found'.format(str(len(data))))
-
-        try:
-            # Loop through each 'x' dictionary variable in 'details' list variable
-            for x in data:
-
-                # Get text value associated with 'pluginText' key in 'x' dictionary
-                # and remove <plugin_output> headers from text
-                x['pluginText'] = re.sub(
-                    '(\\n)?(\\n)?<\/?plugin_output>(\\n)?', '', x['pluginText'])
-
-                # Split multiline 'pluginText' value into individual lines and store into
-                # variable lines (list datatype)
-                lines = x['pluginText'].splitlines()
-
-                for line in range(2, (len(lines))):
-
-                    # if pluginText reaches a blank line, break out of loop
-                    if not lines[line]:
-                        break
-
-                    formatted = False
-                    dontskip = True
-                    softname = ''
-                    version = ''
-                    installedon = ''
-
-                    # This is a Windows box
-                    if x['pluginID'] == '20811':
-                        if not '[' in lines[line]:
-                            # if version or installed on does not exist in string
-                            softname = lines[line]
-                        else:
-                            # version or installed on does exist in string
-                            softname = re.findall('.*?(?=\[)', lines[line])[0]
-
-                        if '[version' in lines[line]:
-                            # if version exist in string
-                            version = re.findall(
-                                '(?<=\[version\s).*?(?=\])', lines[line])[0]
-
-                        if '[installed' in lines[line]:
-                            # if installed exist in string
-                            installedon = re.findall(
-                                '(?<=\[installed\son\s).*?(?=\])', lines[line])[0]
-
-                        formatted = True
-
-                    # This is a linux/unix box of some kind
-                    if x['pluginID'] == '22869':
-                        if 'CentOS Linux system' in x['pluginText'] or 'Red Hat Linux system' in x['pluginText']:
-                            softname = re.findall(
-                                '(?<=\s\s).*?(?=-\d)', lines[line])[0]
-                            version = re.findall(
-                                '(?<=-)(\d.*)(?=\|)', lines[line])[0]
-
-                            formatted = True
-
-                        elif 'Solaris 11 system' in x['pluginText']:
-                            software = re.findall(
-                                '([\w\/]+)\W+([0-9\.\-]+).*', lines[line].strip())
-                            for item in software:
-                                softname = item[0].strip()
-                                version = item[1].strip()
-
-                            formatted = True
-
-                        elif 'HP-UX system' in x['pluginText']:
-                            software = re.findall(
-                                '(.*)\s+(.*)', lines[line].strip())
-                            for item in software:
-                                softname = item[0].strip()
-                                version = item[1].strip()
-
-                            if not software:
-                                dontskip = False
-
-                            formatted = True
-
-                    dnsName = x['dnsName']
-                    netbiosName = x['netbiosName']
-                    if dnsName:  # check to see if dnsName contains any data
-                        hostname = dnsName
-                    else:  # if not, then use NetBIOS Name
-                        hostname = netbiosName
-
-                    if formatted and dontskip:
-                        # Add data to dictionary
-                        newdict['AssetName'] = gethostname(hostname)
-                        newdict['IPAddress'] = x['ip']
-                        newdict['SoftwareVendor'] = ''
-                        newdict['SoftwareName'] = softname
-                        newdict['SoftwareVersion'] = version
-                        newdict['InstallDate'] = installedon
-                        newdict['DateCollected'] = converttime(x['lastSeen'])
-
-                        newlist.append(newdict)  # append dictionary to list
-                        newdict = {}  # clear dictionary for next run through
-                    else:
-                        if not formatted:
-                            logger.warning('No formatter available for ' +
-                                           hostname + '. Data for this system is not parsed nor saved to XML.')
-
-            return newlist
-        except Exception:
-            logger.error('Parsing data failed', exc_info=True)
-            closeexit(1)
-
-    else:  # details variable came back null/empty
-        logger.info('No information found from SecurityCenter')
-        closeexit(0)
-
-
-def myfunc():
-    pass
+    # Number of unique records found, counted as they are parsed since
+    # replayed data is streamed in rather than held in a list
+    count = 0
+
+    # Loop through each 'x' dictionary variable in 'details' list variable
+    for x in data:
+        count += 1
+
+        # One row per package, using the parser for the plugin (and for 22869,
+        # the OS named in the plugin text), see pyParsers.py
+        newlist.extend(softwarerows(x, logger))
+
+    return newlist, count
 
 
 def closeexit(exit_code):
@@ -380,11 +261,17 @@ def closeexit(exit_code):
     else:  # Script had an error
         logger.info('Exiting script due to an error')
 
+    # Save the run summary next to the log file
+    instrument.writesummary(exit_code)
+
     # Cleanly close the logging files
     # Function below comes from pyLogging.py script
     loginstance.closeHandlers()
-    sys.exit()
+    sys.exit(exit_code)
 
 
 if __name__ == '__main__':
+    # Profile the run if requested, results are saved next to the log file
+    if optprofile:
+        instrument.startprofile(optprofilemem)
     main()
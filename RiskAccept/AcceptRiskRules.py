@@ -27,8 +27,8 @@ from configparser import ConfigParser
 sys.path.append(".")
 
 # Import reusable code dealing with setting up logging
-from pyLogging import clsLogging
-from pyCommon import converttime, writexml, writecsv
+from pyLogging import clsLogging, clsInstrument
+from pyCommon import converttime, writeformats, OUTPUTFORMATS, clsJournal, clsCachedSC, clsRulePlanner, clsRuleCache, planrules, queryseconds
 
 #--- Prevent the creation of compiled import modules ---
 sys.dont_write_bytecode = True
@@ -41,11 +41,25 @@ scriptname = os.path.splitext(os.path.basename(__file__))[0]
 repoID = '0'  # Set repository ID to All
 filename = ''  # Initialize filename variable to empty
 optcsv = False  # Variable option to write to CSV
+formats = []  # Output formats to write in one pass (xml, csv, jsonl, sqlite)
+optcache = False  # Variable option to cache SecurityCenter responses locally
+cachettl = 24  # Hours a cached SecurityCenter response stays valid
+optmetrics = False  # Variable option to write Prometheus metrics next to the report
+optprofile = False  # Variable option to profile the run with cProfile
+optprofilemem = False  # Variable option to also take tracemalloc snapshots per stage
+optasynclog = False  # Variable option to write the log from a background thread
+optjsonlog = False  # Variable option to also write the log as JSON lines
+filelevel = 'DEBUG'  # Lowest level of message written to the log file
+consolelevel = 'DEBUG'  # Lowest level of message written to the console
+optresume = False  # Variable option to resume from the journal of a failed run
+optrulecache = False  # Variable option to reuse the results of rules unchanged since the last run
+optplan = False  # Variable option to only estimate the queries a run would make
+optcheckall = False  # Variable option to query SecurityCenter for inactive and expired rules too
 
 # Get options passed via commandline
 try:
     opts, args = getopt.getopt(sys.argv[1:], 'hcr:f:', [
-                               'help', 'csv', 'repoID=', 'filename='])
+                               'help', 'csv', 'formats=', 'repoID=', 'filename=', 'resume', 'ruleCache', 'plan', 'checkAll', 'cache', 'cacheTTL=', 'metrics', 'profile', 'profileMemory', 'asyncLog', 'jsonLog', 'fileLevel=', 'consoleLevel='])
 except getopt.GetoptError as err:
     print('Example: RiskAccept/AcceptRiskRules.py -r 1')
     print('Example: RiskAccept/AcceptRiskRules.py -r 1 -f "siteAcceptRules"')
@@ -59,24 +73,95 @@ for opt, arg in opts:
     if opt in ('-h', '--help'):
         print('Example: RiskAccept/AcceptRiskRules.py -r 1')
         print('Example: RiskAccept/AcceptRiskRules.py -r 1 -f "siteAcceptRules"')
+        print('Example: RiskAccept/AcceptRiskRules.py -r 1 --resume')
+        print('Example: RiskAccept/AcceptRiskRules.py -r 1 --ruleCache')
+        print('Example: RiskAccept/AcceptRiskRules.py --plan')
+        print('Example: RiskAccept/AcceptRiskRules.py --checkAll')
+        print('Example: RiskAccept/AcceptRiskRules.py -r 1 --cache')
+        print('Example: RiskAccept/AcceptRiskRules.py -r 1 --metrics')
+        print('Example: RiskAccept/AcceptRiskRules.py -r 1 --profile --profileMemory')
+        print('Example: RiskAccept/AcceptRiskRules.py -r 1 --asyncLog --consoleLevel WARNING')
+        print('Example: RiskAccept/AcceptRiskRules.py --formats xml,csv,jsonl,sqlite')
         sys.exit(0)
     if opt in ('-c', '--csv'):
         optcsv = True
+    if opt == '--formats':
+        formats = [x.strip().lower() for x in arg.split(',') if x.strip()]
+    if opt == '--cache':
+        optcache = True
+    if opt == '--cacheTTL':
+        cachettl = int(arg)
+    if opt == '--metrics':
+        optmetrics = True
+    if opt == '--profile':
+        optprofile = True
+    if opt == '--profileMemory':
+        optprofile = True
+        optprofilemem = True
+    if opt == '--asyncLog':
+        optasynclog = True
+    if opt == '--jsonLog':
+        optjsonlog = True
+    if opt == '--fileLevel':
+        filelevel = str(arg)
+    if opt == '--consoleLevel':
+        consolelevel = str(arg)
+    if opt == '--resume':
+        optresume = True
+    if opt == '--ruleCache':
+        optrulecache = True
+    if opt == '--plan':
+        optplan = True
+    if opt == '--checkAll':
+        optcheckall = True
+
+# Without --formats the report is written as XML, or CSV if requested
+if not formats:
+    formats = ['csv'] if optcsv else ['xml']
+for outputformat in formats:
+    if outputformat not in OUTPUTFORMATS:
+        print('Unknown output format {}, use any of {}'.format(outputformat, ','.join(OUTPUTFORMATS)))
+        sys.exit(1)
 
 if filename:
     scriptname = filename
 
+# Summary of the last real run, used to time queries for --plan
+summaryfile = scriptloc + scriptname + '_summary.json'
+# Keep the plan's log and summary apart from the real runs
+if optplan:
+    scriptname = scriptname + '-Plan'
+
+# Cache folder is shared by all of the scripts
+cacheloc = os.path.join(scriptloc, '..', 'cache', '')
+
 #--- Begin Logging Configuration Section ---
 # Initialize logging
 loginstance = clsLogging(scriptloc, scriptname)
-logger = loginstance.setup()
+logger = loginstance.setup(queued=optasynclog, filelevel=filelevel, consolelevel=consolelevel, jsonlog=optjsonlog)
+loginstance.setcontext(repoID=repoID)
 
 logger.info('Running on Python version {}'.format(sys.version))
 
+# Track time spent per stage and calls made to SecurityCenter
+instrument = clsInstrument(scriptloc, scriptname, logger, loginstance)
+
+# Columns of the CSV report, in order
+csvfields = ['IP', 'RepoName', 'RuleApplies', 'RuleStatus', 'RuleTarget', 'Protocol', 'Port', 'Expires',
+             'PluginID', 'Severity', 'PluginName', 'Comments', 'CreatedTime', 'CreatedBy', 'Checked']
+
 # create plugin severity dictionary to store severities for already
 # queried plugins. Hopefully this will speed up the script, even if a little.
 plugdict = {}
 
+# Journal of finished rules so a failed run can be picked up with --resume
+journal = clsJournal(scriptloc, scriptname, logger)
+
+# Results of rules from the last run, reused with --ruleCache
+rulecache = clsRuleCache(scriptloc, scriptname, logger)
+# Changed whenever the rows built for a rule change, so older cached rows aren't reused
+rowversion = 3
+
 
 def main():
     configfile = os.path.join(os.path.dirname(
@@ -106,21 +191,35 @@ def main():
     password = config.get('SecurityCenter', 'pass')
     fldrloc = config.get('SecurityCenter', 'path')
 
+    # Write the run metrics next to the report if requested
+    if optmetrics:
+        instrument.enablemetrics(fldrloc)
+
     data = getRuleData(hostip, username, password)
 
     # What the element header for each set of data should be called
     elementname = 'AcceptRiskRules'
 
-    # Write parse data (stored as dictionary objects in a list variable) to XML
+    instrument.addrecords('parse', len(data))
+    instrument.stage('write')
+
+    # Write parse data (stored as dictionary objects in a list variable) to
+    # each of the requested formats
     try:
-        if optcsv:
-            writecsv(fldrloc, scriptname, data, logger)
-        else:
-            writexml(fldrloc, scriptname, data, elementname, logger)
+        writeformats(fldrloc, scriptname, data, formats, elementname, logger, csvfields)
     except Exception:
-        logger.error('Error in writexml function', exc_info=True)
+        logger.error('Error in writeformats function', exc_info=True)
         closeexit(1)
 
+    instrument.addrecords('write', len(data))
+
+    # Results are saved, so the journal is no longer needed
+    journal.close(remove=True)
+
+    # Keep the results of each rule for the next run
+    if optrulecache:
+        rulecache.save()
+
     # Close log file and exit script cleanly
     closeexit(0)
 
@@ -171,6 +270,7 @@ def getRuleData(hostip, username, password):
         closeexit(1)
 
     #--- Connect to SecurityCenter ---
+    instrument.stage('login')
     try:
         # Create connection to SecurityCenter server using variables stored in pyTenableConfig.py
         # Results are returned as a series of dictionary objects within the 'sc' list variable
@@ -183,7 +283,15 @@ def getRuleData(hostip, username, password):
             'Likely cause is that the credentials to login into SecurityCenter are incorrect', exc_info=True)
         closeexit(1)
 
+    # Count and time every call made to SecurityCenter
+    sc = instrument.wrapsc(sc)
+
+    # Serve repeated queries from the local cache if requested
+    if optcache:
+        sc = clsCachedSC(sc, cacheloc, logger, hostip, username, ttl=cachettl * 3600)
+
     #--- Retrieve data from SecurityCenter and export to XML ---
+    instrument.stage('fetch')
 
     try:
         # Get data from SecurityCenter
@@ -194,8 +302,10 @@ def getRuleData(hostip, username, password):
         #
         resp = sc.get('acceptRiskRule', params={
             'repositoryIDs': repoID,
-            'fields': 'plugin,hostValue,hostType,port,protocol,repository,user,comments,plugin,expires,createdTime,status'})
+            'fields': 'id,plugin,hostValue,hostType,port,protocol,repository,user,comments,plugin,expires,createdTime,modifiedTime,status'})
         rules = resp.json()['response']
+        if rules is not None:
+            instrument.addrecords('fetch', len(rules))
         # Each entry of data is returned as a dictionary variable stored in list 'rules'
     except Exception:
         # Problem with trying to get data from SecurityCenter
@@ -204,9 +314,24 @@ def getRuleData(hostip, username, password):
         logger.error('Likely cause is the query is malformed', exc_info=True)
         closeexit(1)
 
+    # Only estimate what parsing the rules would take
+    if optplan and rules is not None:
+        instrument.stage('plan')
+        # Inactive and expired rules aren't checked unless --checkAll is set
+        local = set()
+        if not optcheckall:
+            local = set(rule['id'] for rule in rules if isinactive(rule))
+        planrules(sc, rules, logger, queryseconds(summaryfile), local=local)
+        closeexit(0)
+
     try:
         if rules is not None:  # If rules variable doesn't come back null/empty
-            return parserules(sc, rules)
+            instrument.stage('parse')
+            rulelist = parserules(sc, rules)
+            if optcache:
+                sc.logstats()
+                instrument.addcache('response', sc.hits, sc.misses)
+            return rulelist
         else:
             logger.info('No Accept Risk Rules found')
             closeexit(0)
@@ -237,9 +362,123 @@ def parserules(sc, rules):
     # Create a new dictionary for the individual accepted risk rule
     ruledict = {}
 
-    # loop through each rule found
+    # Open the journal, loading rules finished by a previous run if resuming
+    journal.start(optresume)
+    skipped = 0
+
+    # Pre-filter: an inactive or expired rule no longer accepts any risk, so
+    # it can't currently apply and SecurityCenter doesn't need to be asked
+    # for its hosts or whether it applies to them.  Its rows are marked as
+    # not checked.
+    local = set()
+    if not optcheckall:
+        local = set(rule['id'] for rule in rules if isinactive(rule))
+        logger.info('{} of {} rules are inactive or expired, only active rules are checked against SecurityCenter'.format(
+            len(local), len(rules)))
+    avoided = 0
+
+    # Whether each rule still applies to its hosts is checked in bulk, one
+    # query per plugin rather than one per rule and host
+    # Each answer is journaled as it comes in, so --resume doesn't repeat the queries
+    planner = clsRulePlanner(sc, ('acceptRiskStatus', '=', "accepted"), journal=journal)
+    # Rule ID to the hosts it targets, how the target is shown, the port and asset ID
+    targets = {}
+
+    # Rules unchanged since the last run, and on repositories without new scan
+    # results, reuse their rows from the rule cache
+    cached = {}
+    fingerprints = {}
+    if optrulecache:
+        rulecache.load()
+        repoupdates = getRepoUpdates(sc)
+
+    # First pass: find the hosts of each rule and add their checks to the planner
     for rule in rules:
-        writeval = False
+        # Rule was already finished by a previous run, its rows are reused below
+        if journal.isdone(rule['id']):
+            continue
+
+        if optrulecache:
+            fingerprints[rule['id']] = rulecache.fingerprint(
+                rule, rule['id'] in local, repoupdates.get(rule['repository']['id']), rowversion)
+            rows = rulecache.get(rule['id'], fingerprints[rule['id']])
+            if rows is not None:
+                cached[rule['id']] = rows
+                continue
+
+        # Determine if there is a specific port defined in rule
+        if rule['port'] == 'any' or rule['port'] == '0':
+            port = None
+        else:
+            port = rule['port']
+
+        hosts = []
+        target = ''
+        assetID = None
+
+        # Rule Target is 'IP'
+        if rule['hostType'] == 'ip':
+            hosts = [rule['hostValue']]
+            target = rule['hostValue']
+
+        # Rule Target is 'All Hosts', its hosts aren't looked up for an inactive
+        # or expired rule
+        elif rule['hostType'] == 'all' and rule['id'] in local:
+            hosts = ['']
+            target = 'All Hosts'
+            avoided += 1
+
+        elif rule['hostType'] == 'all':
+            hosts = lookuphosts(sc, rule, ('repositoryIDs', '=', rule['repository']['id']))
+            target = 'All Hosts'
+
+        # Rule Target is an 'Asset'
+        elif rule['hostType'] == 'asset':
+            assetID = rule['hostValue']['id']
+            assetName = rule['hostValue']['name']
+            if assetID == "-1":
+                logger.warning("Asset named: {} does not exist. Line has been skipped.".format(assetName))
+                continue
+            target = 'Asset: ' + assetName
+            if rule['id'] in local:
+                # Inactive or expired, as for 'All Hosts' above
+                hosts = ['']
+                avoided += 1
+            else:
+                # Accept Risk Rules are repository specific, where Assets are not
+                # So an accept risk rule may exist for some repositories, but not others
+                # So an empty SC Analysis is possible
+                hosts = lookuphosts(sc, rule, ('assetID', '=', assetID), ('repositoryIDs', '=', rule['repository']['id']))
+
+        # Each rule gets a single row, for the last of its hosts
+        hosts = hosts[-1:]
+        targets[rule['id']] = (hosts, target, port, assetID)
+        if rule['id'] in local:
+            avoided += len(hosts)
+        else:
+            for targetIP in hosts:
+                planner.add(rule['plugin']['id'], targetIP, port, assetID)
+
+    planner.run()
+    logger.info('{} host checks made with {} queries to SecurityCenter'.format(planner.checks, planner.queries))
+
+    # Second pass: build the rows of each rule in order
+    for rule in rules:
+        # Rule was already finished by a previous run, reuse its rows
+        if journal.isdone(rule['id']):
+            rulelist.extend(journal.getrows(rule['id']))
+            skipped += 1
+            continue
+        if rule['id'] in cached:
+            rulelist.extend(cached[rule['id']])
+            journal.record(rule['id'], cached[rule['id']])
+            continue
+        if rule['id'] not in targets:
+            continue
+        hosts, target, port, assetID = targets[rule['id']]
+
+        # Remember where this rule's rows start so they can be journaled
+        rulestart = len(rulelist)
 
         # Get when the rule expires
         # '-1' for never
@@ -258,102 +497,54 @@ def parserules(sc, rules):
         # Get comments from accepted risk rules
         comments = rule['comments']
 
-        # Determine if there is a specific port defined in rule
-        if rule['port'] == 'any' or rule['port'] == '0':
-            portFilter = 0
-        else:
-            portFilter = 1
-
         # Get the Plugin Severity
         plugSeverity = getSeverity(sc, rule['plugin']['id'])
 
-        # Rule Target is 'IP'
-        if rule['hostType'] == 'ip':
-            targetIP = rule['hostValue']
-            if portFilter == 1:
-                vulndetails = sc.analysis(('acceptRiskStatus', '=', "accepted"), ('pluginID', '=', rule['plugin']['id']), (
-                    'port', '=', rule['port']), ('ip', '=', targetIP), tool='sumip')
-            else:
-                vulndetails = sc.analysis(('acceptRiskStatus', '=', "accepted"), (
-                    'pluginID', '=', rule['plugin']['id']), ('ip', '=', targetIP), tool='sumip')
+        # Whether the rule was checked against SecurityCenter
+        checked = str(rule['id'] not in local)
 
+        for targetIP in hosts:
             # Store Status of whether the rule still applies to IP
-            if vulndetails is not None:
-                CurrentlyApplies = 'True'
-            else:
+            if rule['id'] in local:
                 CurrentlyApplies = 'False'
+            else:
+                CurrentlyApplies = planner.applies(rule['plugin']['id'], targetIP, port, assetID)
 
-            target = targetIP
-            writeval = True
-
-        # Rule Target is 'All Hosts'
-        elif rule['hostType'] == 'all':
-            getall = sc.analysis(
-                ('repositoryIDs', '=', rule['repository']['id']), tool='sumip')
-
-            # If SC Analysis did not return empty, parse data
-            if getall is not None:
-                for devices in getall:
-                    targetIP = devices['ip']
-                    if portFilter == 1:
-                        vulndetails = sc.analysis(('acceptRiskStatus', '=', "accepted"), (
-                            'pluginID', '=', rule['plugin']['id']), ('port', '=', rule['port']), ('ip', '=', targetIP), tool='sumip')
-                    else:
-                        vulndetails = sc.analysis(('acceptRiskStatus', '=', "accepted"), (
-                            'pluginID', '=', rule['plugin']['id']), ('ip', '=', targetIP), tool='sumip')
-
-                    # Store Status of whether the rule still applies to IP
-                    if vulndetails is not None:
-                        CurrentlyApplies = 'True'
-                    else:
-                        CurrentlyApplies = 'False'
-
-                    target = 'All Hosts'
-                    writeval = True
-
-        # Rule Target is an 'Asset'
-        elif rule['hostType'] == 'asset':
-            assetID = rule['hostValue']['id']
-            assetName = rule['hostValue']['name']
-            if assetID == "-1":
-                logger.warning("Asset named: {} does not exist. Line has been skipped.".format(assetName))
-                continue
-            getassets = sc.analysis(
-                ('assetID', '=', assetID), ('repositoryIDs', '=', rule['repository']['id']), tool='sumip')
-
-            # If SC Analysis did not return empty, parse data
-            # Accept Risk Rules are repository specific, where Assets are not
-            # So an accept risk rule may exist for some repositories, but not others
-            # So an empty SC Analysis is possible
-            if getassets is not None:
-                for devices in getassets:
-                    targetIP = devices['ip']
-                    if portFilter == 1:
-                        vulndetails = sc.analysis(('acceptRiskStatus', '=', "accepted"), ('pluginID', '=', rule['plugin']['id']), (
-                            'port', '=', rule['port']), ('assetID', '=', assetID), ('ip', '=', targetIP), tool='sumip')
-                    else:
-                        vulndetails = sc.analysis(('acceptRiskStatus', '=', "accepted"), (
-                            'pluginID', '=', rule['plugin']['id']), ('assetID', '=', assetID), ('ip', '=', targetIP), tool='sumip')
-
-                    # Store Status of whether the rule still applies to IP
-                    if vulndetails is not None:
-                        CurrentlyApplies = 'True'
-                    else:
-                        CurrentlyApplies = 'False'
-
-                    target = 'Asset: ' + assetName
-                    writeval = True
-
-        if writeval:
             ruledict = writetodict(
-                rule, targetIP, CurrentlyApplies, status, target, expires, plugSeverity, comments)
+                rule, targetIP, CurrentlyApplies, status, target, expires, plugSeverity, comments, checked)
             rulelist.append(ruledict)  # append dictionary to list
             ruledict = {}  # clear dictionary for next run through
 
+        # Checkpoint the rows produced for this rule
+        journal.record(rule['id'], rulelist[rulestart:])
+        if optrulecache:
+            rulecache.put(rule['id'], fingerprints[rule['id']], rulelist[rulestart:])
+
+    if skipped:
+        logger.info('{} rules skipped as already finished in journal'.format(skipped))
+    if optrulecache:
+        logger.info('{} rules reused from the rule cache'.format(len(cached)))
+        instrument.addcache('rulecache', rulecache.hits, rulecache.misses)
+    if local:
+        logger.info('{} host lookups and checks skipped for inactive or expired rules'.format(avoided))
+
     return rulelist
 
 
-def writetodict(wrule, ip, ruleapplies, rulestatus, ruletarget, expires, severity, comments):
+def isinactive(rule):
+    """Returns True if the accept risk rule is inactive or has expired
+
+    rule = Accept risk rule dictionary from SecurityCenter
+    """
+    import time
+
+    if rule['status'] != '0':
+        return True
+    # '-1' for never, otherwise the time it expires in Epoch
+    return rule['expires'] != '-1' and int(rule['expires']) < time.time()
+
+
+def writetodict(wrule, ip, ruleapplies, rulestatus, ruletarget, expires, severity, comments, checked):
     """Simple function to organize parsed rule data and return it in a dictionary format
     Parameters
     ----------
@@ -371,6 +562,8 @@ def writetodict(wrule, ip, ruleapplies, rulestatus, ruletarget, expires, severit
         Severity of the plugin the accept risk rule applies to
     comments : str
         Comments from accept risk rule
+    checked : str
+        Whether the rule's hosts were looked up and checked against SecurityCenter
 
     Returns
     -------
@@ -402,6 +595,7 @@ def writetodict(wrule, ip, ruleapplies, rulestatus, ruletarget, expires, severit
         dictvar['Comments'] = comments
         dictvar['CreatedTime'] = time
         dictvar['CreatedBy'] = createdby
+        dictvar['Checked'] = checked
     except Exception as e:
         logger.error('Adding data to dictionary failed')
         logger.error('Data string follows')
@@ -411,6 +605,39 @@ def writetodict(wrule, ip, ruleapplies, rulestatus, ruletarget, expires, severit
     return dictvar
 
 
+def lookuphosts(sc, rule, *filters):
+    """Returns the hosts of a rule matching the filters, only the last of them
+    as each rule gets a single row.  The hosts are recorded in the journal
+    so a resumed run doesn't look them up again.
+
+    sc = SecurityCenter connection
+
+    rule = Accept risk rule dictionary from SecurityCenter
+
+    filters = Filters of the sumip query for the hosts
+    """
+    stepkey = 'hosts {}'.format(rule['id'])
+    hosts = journal.getstep(stepkey)
+    if hosts is None:
+        found = sc.analysis(*filters, tool='sumip')
+
+        # If SC Analysis did not return empty, parse data
+        hosts = []
+        if found is not None:
+            hosts = [devices['ip'] for devices in found][-1:]
+        journal.recordstep(stepkey, hosts)
+    return hosts
+
+
+def getRepoUpdates(sc):
+    """Returns when each repository last imported scan results, by repository ID
+
+    sc = SecurityCenter connection
+    """
+    resp = sc.get('repository', params={'fields': 'id,typeFields'})
+    return dict((repo['id'], repo.get('typeFields', {}).get('lastVulnUpdate')) for repo in resp.json()['response'])
+
+
 def getSeverity(sc, pluginID):
     """Returns the severity level of a plugin
 
@@ -419,8 +646,10 @@ def getSeverity(sc, pluginID):
     pluginID = Plugin ID number to search the severity for
     """
     if pluginID in plugdict:
+        instrument.addcache('plugdict', 1, 0)
         return plugdict[pluginID]
     else:
+        instrument.addcache('plugdict', 0, 1)
         resp = sc.get('plugin', params={
             'id': pluginID,
             'fields': 'riskFactor'})
@@ -442,11 +671,20 @@ def closeexit(exit_code):
     else:  # Script had an error
         logger.info('Exiting script due to an error')
 
+    # Save any rules finished so far so the run can be resumed
+    journal.close()
+
+    # Save the run summary next to the log file
+    instrument.writesummary(exit_code)
+
     # Cleanly close the logging files
     # Function below comes from pyLogging.py script
     loginstance.closeHandlers()
-    sys.exit()
+    sys.exit(exit_code)
 
 
 if __name__ == '__main__':
+    # Profile the run if requested, results are saved next to the log file
+    if optprofile:
+        instrument.startprofile(optprofilemem)
     main()
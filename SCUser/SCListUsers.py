@@ -27,8 +27,8 @@ from configparser import ConfigParser
 sys.path.append(".")
 
 # Import reusable code dealing with setting up logging
-from pyLogging import clsLogging
-from pyCommon import writexml, writecsv
+from pyLogging import clsLogging, clsInstrument
+from pyCommon import writeformats, OUTPUTFORMATS, clsCachedSC, readdev, writedev
 
 #--- Prevent the creation of compiled import modules ---
 sys.dont_write_bytecode = True
@@ -40,11 +40,24 @@ scriptname = os.path.splitext(os.path.basename(__file__))[0]
 
 filename = ''  # Initialize filename variable to empty
 optcsv = False
+formats = []  # Output formats to write in one pass (xml, csv, jsonl, sqlite)
+optcache = False  # Variable option to cache SecurityCenter responses locally
+cachettl = 24  # Hours a cached SecurityCenter response stays valid
+optmetrics = False  # Variable option to write Prometheus metrics next to the report
+optprofile = False  # Variable option to profile the run with cProfile
+optprofilemem = False  # Variable option to also take tracemalloc snapshots per stage
+optasynclog = False  # Variable option to write the log from a background thread
+optjsonlog = False  # Variable option to also write the log as JSON lines
+filelevel = 'DEBUG'  # Lowest level of message written to the log file
+consolelevel = 'DEBUG'  # Lowest level of message written to the console
+replayfile = ''  # writedev JSON dump to replay instead of querying SecurityCenter
+optcapture = False  # Variable option to save the raw SecurityCenter records as they are fetched
+optcapturexml = False  # Variable option to also save the raw records as XML
 
 # Get options passed via commandline
 try:
     opts, args = getopt.getopt(sys.argv[1:], 'hcf:', [
-                               'help', 'csv', 'filename='])
+                               'help', 'csv', 'formats=', 'filename=', 'cache', 'cacheTTL=', 'metrics', 'profile', 'profileMemory', 'asyncLog', 'jsonLog', 'fileLevel=', 'consoleLevel=', 'replay=', 'capture', 'captureXML'])
 except getopt.GetoptError as err:
     print('Example: SCUser/ListUsers.py --csv')
     print('Example: SCUser/ListUsers.py -f "SCUsers"')
@@ -55,20 +68,72 @@ for opt, arg in opts:
     if opt in ('-h', '--help'):
         print('Example: SCUser/ListUsers.py --csv')
         print('Example: SCUser/ListUsers.py -f "SCUsers"')
+        print('Example: SCUser/ListUsers.py --cache')
+        print('Example: SCUser/ListUsers.py --capture')
+        print('Example: SCUser/ListUsers.py --replay SCListUsers_dev.jsonl')
+        print('Example: SCUser/ListUsers.py --metrics')
+        print('Example: SCUser/ListUsers.py --profile')
+        print('Example: SCUser/ListUsers.py --asyncLog --fileLevel INFO')
+        print('Example: SCUser/ListUsers.py --formats xml,csv,jsonl,sqlite')
         sys.exit(0)
     if opt in ('-c', '--csv'):
         optcsv = True
+    if opt == '--formats':
+        formats = [x.strip().lower() for x in arg.split(',') if x.strip()]
+    if opt == '--cache':
+        optcache = True
+    if opt == '--cacheTTL':
+        cachettl = int(arg)
+    if opt == '--metrics':
+        optmetrics = True
+    if opt == '--profile':
+        optprofile = True
+    if opt == '--profileMemory':
+        optprofile = True
+        optprofilemem = True
+    if opt == '--asyncLog':
+        optasynclog = True
+    if opt == '--jsonLog':
+        optjsonlog = True
+    if opt == '--fileLevel':
+        filelevel = str(arg)
+    if opt == '--consoleLevel':
+        consolelevel = str(arg)
+    if opt == '--replay':
+        replayfile = str(arg)
+    if opt == '--capture':
+        optcapture = True
+    if opt == '--captureXML':
+        optcapture = True
+        optcapturexml = True
+
+# Without --formats the report is written as XML, or CSV if requested
+if not formats:
+    formats = ['csv'] if optcsv else ['xml']
+for outputformat in formats:
+    if outputformat not in OUTPUTFORMATS:
+        print('Unknown output format {}, use any of {}'.format(outputformat, ','.join(OUTPUTFORMATS)))
+        sys.exit(1)
 
 if filename:
     scriptname = filename
 
+# Cache folder is shared by all of the scripts
+cacheloc = os.path.join(scriptloc, '..', 'cache', '')
+
 #--- Begin Logging Configuration Section ---
 # Initialize logging
 loginstance = clsLogging(scriptloc, scriptname)
-logger = loginstance.setup()
+logger = loginstance.setup(queued=optasynclog, filelevel=filelevel, consolelevel=consolelevel, jsonlog=optjsonlog)
 
 logger.info('Running on Python version {}'.format(sys.version))
 
+# Track time spent per stage and calls made to SecurityCenter
+instrument = clsInstrument(scriptloc, scriptname, logger, loginstance)
+
+# Columns of the CSV report, in order
+csvfields = ['userID', 'username', 'firstname', 'lastname', 'role', 'group']
+
 
 def main():
     configfile = os.path.join(os.path.dirname(
@@ -98,26 +163,38 @@ def main():
     password = config.get('SecurityCenter', 'pass')
     fldrloc = config.get('SecurityCenter', 'path')
 
-    data = getUserData(hostip, username, password)
+    # Write the run metrics next to the report if requested
+    if optmetrics:
+        instrument.enablemetrics(fldrloc)
+
+    if replayfile:
+        # Parse the records from a writedev dump instead of SecurityCenter
+        instrument.stage('parse')
+        data = parsedata(readdev(replayfile, logger))
+    else:
+        data = getUserData(hostip, username, password, fldrloc)
 
     # What the element header for each set of data should be called
     elementname = 'Users'
 
-    # Write parse data (stored as dictionary objects in a list variable) to XML
+    instrument.addrecords('parse', len(data))
+    instrument.stage('write')
+
+    # Write parse data (stored as dictionary objects in a list variable) to
+    # each of the requested formats
     try:
-        if optcsv:
-            writecsv(fldrloc, scriptname, data, logger)
-        else:
-            writexml(fldrloc, scriptname, data, elementname, logger)
+        writeformats(fldrloc, scriptname, data, formats, elementname, logger, csvfields)
     except Exception:
         logger.error('Error in writing the file', exc_info=True)
         closeexit(1)
 
+    instrument.addrecords('write', len(data))
+
     # Close log file and exit script cleanly
     closeexit(0)
 
 
-def getUserData(hostip, username, password):
+def getUserData(hostip, username, password, fldrloc):
     '''Collect and parse the list of users from SecurityCenter and returns it at as a list of dictionaries
 
     Parameters
@@ -128,6 +205,8 @@ def getUserData(hostip, username, password):
         Username with at least full read privileges in SecurityCenter
     password : str
         Password of user with at least full read privileges in SecurityCenter
+    fldrloc : str
+        Folder the report is saved to, where --capture saves the raw data
 
     Returns
     -------
@@ -163,6 +242,7 @@ def getUserData(hostip, username, password):
         closeexit(1)
 
     #--- Connect to SecurityCenter ---
+    instrument.stage('login')
     try:
         # Create connection to SecurityCenter server using variables stored in pyTenableConfig.py
         # Results are returned as a series of dictionary objects within the 'sc' list variable
@@ -175,7 +255,15 @@ def getUserData(hostip, username, password):
             'Likely cause is that the credentials to login into SecurityCenter are incorrect', exc_info=True)
         closeexit(1)
 
+    # Count and time every call made to SecurityCenter
+    sc = instrument.wrapsc(sc)
+
+    # Serve repeated queries from the local cache if requested
+    if optcache:
+        sc = clsCachedSC(sc, cacheloc, logger, hostip, username, ttl=cachettl * 3600)
+
     #--- Retrieve data from SecurityCenter and export to XML ---
+    instrument.stage('fetch')
 
     try:
         # Get data from SecurityCenter
@@ -188,6 +276,11 @@ def getUserData(hostip, username, password):
             'fields': 'id,username,firstname,lastname,status,role,group'
         })
         users = resp.json()['response']
+        if users is not None:
+            instrument.addrecords('fetch', len(users))
+        if optcache:
+            sc.logstats()
+            instrument.addcache('response', sc.hits, sc.misses)
         # Each entry of data is returned as a dictionary variable stored in list 'rules'
     except Exception:
         # Problem with trying to get data from SecurityCenter
@@ -196,8 +289,17 @@ def getUserData(hostip, username, password):
         logger.error('Likely cause is the query is malformed', exc_info=True)
         closeexit(1)
 
+    if optcapture and users is not None:
+        # Save the raw records, to replay later with --replay
+        try:
+            writedev(fldrloc, scriptname, users, logger, pretty=False, xml=optcapturexml)
+        except Exception:
+            logger.error('Failed to capture the raw data from SecurityCenter', exc_info=True)
+            closeexit(1)
+
     try:
         if users is not None:  # If rules variable doesn't come back null/empty
+            instrument.stage('parse')
             return parsedata(users)
         else:
             logger.info('No list of users found')
@@ -256,11 +358,17 @@ def closeexit(exit_code):
     else:  # Script had an error
         logger.info('Exiting script due to an error')
 
+    # Save the run summary next to the log file
+    instrument.writesummary(exit_code)
+
     # Cleanly close the logging files
     # Function below comes from pyLogging.py script
     loginstance.closeHandlers()
-    sys.exit()
+    sys.exit(exit_code)
 
 
 if __name__ == '__main__':
+    # Profile the run if requested, results are saved next to the log file
+    if optprofile:
+        instrument.startprofile(optprofilemem)
     main()
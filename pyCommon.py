@@ -90,7 +90,7 @@ def converttime(epoch):
 # in both XML and JSON formats.
 
 
-def writedev(fldrloc, filename, dictdetails, logger):
+def writedev(fldrloc, filename, dictdetails, logger, pretty=True, xml=True):
     '''Dump unparsed data from SC Analysis to an XML and JSON file for testing and troubleshooting
     Parameters
     ----------
@@ -102,12 +102,27 @@ def writedev(fldrloc, filename, dictdetails, logger):
         A list of dictionaries
     logger : obj
         Instance of logging obj
+    pretty : bool
+        Write indented JSON and XML built from the whole list.  Otherwise the
+        records are streamed to <filename>_dev.jsonl by clsDevCapture, which
+        is much faster and doesn't hold a second copy of the data in memory.
+    xml : bool
+        Also write the XML file
 
     Returns
     -------
     None
 
     '''
+    if not pretty:
+        capture = clsDevCapture(fldrloc, filename, logger, xml=xml)
+        try:
+            capture.write(dictdetails)
+        except:
+            capture.abort()
+            raise
+        capture.close()
+        return
 
     import json
     from xml.dom.minidom import parseString
@@ -136,6 +151,9 @@ def writedev(fldrloc, filename, dictdetails, logger):
             fldrloc, filename))
         raise
 
+    if not xml:
+        return
+
     try:
         # convert JSON format (from SecurityCenter) to XML
         xml = dicttoxml.dicttoxml(dictdetails, attr_type=False)
@@ -156,6 +174,191 @@ def writedev(fldrloc, filename, dictdetails, logger):
             fldrloc, filename))
         raise
 
+# Saves the unformatted SecurityCenter data as it is fetched, one JSON object
+# per line, rather than all at once like writedev
+
+
+class clsDevCapture(object):
+    '''Write raw records to <filename>_dev.jsonl (and optionally
+    <filename>_dev.xml) a batch at a time, as they arrive from SecurityCenter
+
+    Nothing is sorted, indented or parsed into a DOM, so it is cheap enough to
+    leave on for every run as a raw capture, and the file can be replayed with
+    readdev (the scripts' --replay option).  The files are written under a
+    .part name and only replace the last capture once close is called, so a
+    failed run doesn't leave half a capture behind.
+
+    Parameters
+    ----------
+    flrloc : str
+        Folder location
+    filename : str
+        Filename to write to, without the _dev.jsonl
+    logger : obj
+        Instance of logging obj
+    xml : bool
+        Also write the records to XML (without pretty printing)
+
+        capture = clsDevCapture(fldrloc, scriptname, logger)
+        pages = capture.pages(analysispages(sc, filters))
+    '''
+
+    def __init__(self, fldrloc, filename, logger, xml=False):
+        self._logger = logger
+        self._paths = ['{}{}_dev.jsonl'.format(fldrloc, filename)]
+        self._xml = None
+        self.count = 0
+
+        if xml:
+            try:
+                # Import dicttoxml module (needs to be installed, not embedded into Python)
+                import dicttoxml
+            except:
+                logger.error('Failed to import dicttoxml module')
+                logger.error(
+                    'Likely cause is that the dicttoxml module has not been downloaded and installed. See https://pypi.python.org/pypi/dicttoxml', exc_info=True)
+                raise
+            self._dicttoxml = dicttoxml.dicttoxml
+            self._paths.append('{}{}_dev.xml'.format(fldrloc, filename))
+
+        self._json = open(self._paths[0] + '.part', 'w', encoding='utf-8', buffering=1048576)
+        if xml:
+            self._xml = open(self._paths[1] + '.part', 'wb', buffering=1048576)
+            self._xml.write(b'<?xml version="1.0" encoding="UTF-8" ?>\n<root>\n')
+        logger.info('Capturing raw data to {}'.format(' and '.join(self._paths)))
+
+    def write(self, records):
+        '''Append records (any iterable of dictionaries) to the capture'''
+        import json
+        from itertools import islice
+
+        dumps = json.dumps
+        records = iter(records)
+        while True:
+            batch = list(islice(records, 1000))
+            if not batch:
+                break
+            self._json.write(''.join(dumps(x, ensure_ascii=False, separators=(',', ':')) + '\n' for x in batch))
+            if self._xml is not None:
+                # One <item> per record, a line per batch
+                self._xml.write(self._dicttoxml(batch, root=False, attr_type=False) + b'\n')
+            self.count += len(batch)
+
+    def pages(self, pages):
+        '''Yields each page of records after adding it to the capture, which is
+        closed once the last page has been read
+        '''
+        try:
+            for page in pages:
+                self.write(page)
+                yield page
+        except BaseException:
+            # Includes the pages being abandoned when a later stage fails
+            self.abort()
+            raise
+        self.close()
+
+    def close(self):
+        '''Finish the files and replace the previous capture with them'''
+        import os
+
+        if self._json is None:
+            return
+        self._json.close()
+        self._json = None
+        if self._xml is not None:
+            self._xml.write(b'</root>\n')
+            self._xml.close()
+            self._xml = None
+        for path in self._paths:
+            os.replace(path + '.part', path)
+        self._logger.info('{} records captured to {}'.format(self.count, ' and '.join(self._paths)))
+
+    def abort(self):
+        '''Close and remove the unfinished files, keeping the previous capture'''
+        import os
+
+        if self._json is None:
+            return
+        self._json.close()
+        self._json = None
+        if self._xml is not None:
+            self._xml.close()
+            self._xml = None
+        for path in self._paths:
+            try:
+                os.remove(path + '.part')
+            except OSError:
+                pass
+        self._logger.info('Raw data capture stopped, {} kept as it was'.format(self._paths[0]))
+
+# Streams the records back out of a JSON file written by writedev
+
+
+def readdev(devfile, logger, chunksize=1048576):
+    '''Read the records from a writedev JSON dump one at a time
+    Parameters
+    ----------
+    devfile : str
+        Path of the JSON file written by writedev, or the JSON lines file
+        written by clsDevCapture
+    logger : obj
+        Instance of logging obj
+    chunksize : int
+        Number of characters to read from the file at a time
+
+    Returns
+    -------
+    generator : yields each dictionary stored in the dump
+
+    The file is decoded incrementally, so only the record being decoded
+    (plus one chunk) is held in memory no matter how big the dump is.
+    '''
+    import json
+
+    decoder = json.JSONDecoder()
+    count = 0
+
+    try:
+        logger.info('Replaying data from {}'.format(devfile))
+        with open(devfile, 'r', encoding='utf-8') as fobj:
+            buf = ''
+            pos = 0
+            eof = False
+            while True:
+                # Skip the whitespace, commas and brackets between records
+                while pos < len(buf) and buf[pos] in ' \t\r\n,[]':
+                    pos += 1
+                if buf.startswith('null', pos):
+                    # writedev was handed an empty result
+                    pos += 4
+                    continue
+
+                if pos < len(buf):
+                    try:
+                        record, pos = decoder.raw_decode(buf, pos)
+                    except ValueError:
+                        # Record runs past the end of the buffer, read some more
+                        if eof:
+                            raise
+                    else:
+                        count += 1
+                        yield record
+                        continue
+                elif eof:
+                    break
+
+                # Drop what has already been decoded before reading the next chunk
+                chunk = fobj.read(chunksize)
+                eof = not chunk
+                buf = buf[pos:] + chunk
+                pos = 0
+    except Exception:
+        logger.error('Error encountered when trying to replay data from {}'.format(devfile))
+        raise
+
+    logger.info('{} records replayed from {}'.format(count, devfile))
+
 # Writes the results of the dictionary variable to XML
 
 
@@ -168,7 +371,7 @@ def writexml(fldrloc, filename, dictdetails, elementheader, logger):
     filename : str
         Filename of XML to write to
     dictdetails : list
-        A list of dictionaries
+        A list of dictionaries (or namedtuples)
     elementheader : str
         Name of element header for XML file
     logger : obj
@@ -197,6 +400,9 @@ def writexml(fldrloc, filename, dictdetails, elementheader, logger):
         # replace 'item' header tag name with variable 'elementheader'
         def my_item_func(x): return elementheader
 
+        # dicttoxml only knows dictionaries, namedtuple rows are converted
+        dictdetails = [x._asdict() if hasattr(x, '_asdict') else x for x in dictdetails]
+
         # convert parsed data to XML
         xml = dicttoxml.dicttoxml(
             dictdetails, attr_type=False, item_func=my_item_func)
@@ -229,44 +435,1189 @@ def writexml(fldrloc, filename, dictdetails, elementheader, logger):
         raise
 
 
-def writecsv(fldrloc, filename, dictdetails, logger):
-    '''Write list (containing dictionaries) to an XML file
+def writecsv(fldrloc, filename, dictdetails, logger, fieldnames=None):
+    '''Write rows (dictionaries or namedtuples) to a CSV file
+
+    Rows are written in batches as they are read, so dictdetails can be a
+    generator rather than a list.  With fieldnames the columns are fixed up
+    front: a key missing from a row is left blank and a key that isn't one of
+    the fieldnames is ignored.  Without fieldnames they come from the first row.
+
     Parameters
     ----------
     flrloc : str
         Folder location
     filename : str
-        Filename of XML to write to
-    dictdetails : list
-        A list of dictionaries
+        Filename of CSV to write to
+    dictdetails : iterable
+        Dictionaries or namedtuples, one per row
     logger : obj
         Instance of logging obj
+    fieldnames : list
+        Columns of the CSV, in order
 
     Returns
     -------
-    None
+    int : number of rows written
 
     '''
-    # Import CSV module
-    import csv
+    return writeformats(fldrloc, filename, dictdetails, ['csv'], None, logger, fieldnames)
+
+# Writes the same rows to several files (XML, CSV, JSON lines, SQLite) at once
+
+# Formats writeformats knows, as given to the scripts' --formats option
+OUTPUTFORMATS = ('xml', 'csv', 'jsonl', 'sqlite')
 
+
+def writeformats(fldrloc, filename, dictdetails, formats, elementheader, logger, fieldnames=None):
+    '''Write rows (dictionaries or namedtuples) to one file per format, reading
+    them only once
+    Parameters
+    ----------
+    flrloc : str
+        Folder location
+    filename : str
+        Filename to write to, each format adds its own extension
+    dictdetails : iterable
+        Dictionaries or namedtuples, one per row
+    formats : list
+        Any of OUTPUTFORMATS
+    elementheader : str
+        Name of element header for the XML file, and of the SQLite table
+    logger : obj
+        Instance of logging obj
+    fieldnames : list
+        Columns of the CSV and SQLite table, in order
+
+    Returns
+    -------
+    int : number of rows written
+
+    '''
+    tee = openformats(fldrloc, filename, formats, elementheader, logger, fieldnames)
     try:
-        # Open CSV file for writing
-        logger.info('Saving {}{}.csv'.format(fldrloc, filename))
-        csvFile = open(fldrloc + filename + '.csv', 'w', newline='')
-
-        with csvFile:
-            # Get a list of headers for the CSV from the dictdetails
-            csvHeaders = list(dictdetails[0].keys())
-            writer = csv.DictWriter(csvFile, fieldnames=csvHeaders)
-            writer.writeheader()
-
-            # Write data from dictdetails to CSV
-            for user in dictdetails:
-                writer.writerow(user)
+        tee.write(dictdetails)
+        return tee.close()
     except:
         # Log error and exit script
-        logger.error('Failed to write XML file')
-        logger.error('Unable to write the XML file', exc_info=True)
-    finally:
-        csvFile.close()
+        tee.abort()
+        logger.error('Failed to write {} file'.format(', '.join(x.upper() for x in formats)))
+        logger.error('Unable to write the {} file'.format(', '.join(x.upper() for x in formats)), exc_info=True)
+        raise
+
+
+def openformats(fldrloc, filename, formats, elementheader, logger, fieldnames=None):
+    '''Open one file per format for rows that are written a batch at a time,
+    ie. when one stream of rows is split between several reports.  See
+    writeformats for the parameters.
+
+    Returns
+    -------
+    obj : clsTeeWriter, write each batch with write(rows) and finish with close()
+
+    '''
+    sinks = {'xml': clsXmlSink, 'csv': clsCsvSink, 'jsonl': clsJsonlSink, 'sqlite': clsSqliteSink}
+    unknown = [x for x in formats if x not in sinks]
+    if unknown:
+        raise ValueError('Unknown output format: ' + ', '.join(unknown))
+
+    tee = clsTeeWriter([])
+    try:
+        for outputformat in formats:
+            tee.add(sinks[outputformat](fldrloc, filename, logger, fieldnames, elementheader))
+    except:
+        # Log error and exit script
+        tee.abort()
+        logger.error('Failed to write {} file'.format(', '.join(x.upper() for x in formats)))
+        logger.error('Unable to write the {} file'.format(', '.join(x.upper() for x in formats)), exc_info=True)
+        raise
+    return tee
+
+
+class clsTeeWriter(object):
+    '''Hands each batch of rows to every sink, so a stream of rows (ie. from
+    clsPipeline) is only read, and parsed, once however many files it goes to
+
+    Parameters
+    ----------
+    sinks : list
+        Objects with write(rows), close() and abort() methods, ie. clsCsvSink
+    batchsize : int
+        Rows read from the stream before they are passed on
+    '''
+
+    def __init__(self, sinks, batchsize=10000):
+        self._sinks = sinks
+        self._batchsize = batchsize
+        self.count = 0
+
+    def add(self, sink):
+        self._sinks.append(sink)
+
+    def write(self, rows):
+        from itertools import islice
+
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, self._batchsize))
+            if not batch:
+                break
+            for sink in self._sinks:
+                sink.write(batch)
+            self.count += len(batch)
+
+    def close(self):
+        '''Finish every file and return the number of rows written'''
+        for sink in self._sinks:
+            sink.close()
+        return self.count
+
+    def abort(self):
+        '''Close every file after an error, without finishing them'''
+        for sink in self._sinks:
+            try:
+                sink.abort()
+            except Exception:
+                pass
+
+
+class clsCsvSink(object):
+    '''Writes batches of rows to <filename>.csv through a large buffer, see
+    writecsv for how the columns are chosen
+    '''
+
+    def __init__(self, fldrloc, filename, logger, fieldnames=None, elementheader=None):
+        self._path = '{}{}.csv'.format(fldrloc, filename)
+        self._logger = logger
+        self._fieldnames = None if fieldnames is None else list(fieldnames)
+        self._file = None
+        self.count = 0
+
+    def _open(self, first):
+        import csv
+
+        fieldnames = self._fieldnames
+        if fieldnames is None:
+            # Get a list of headers for the CSV from the first row
+            if first is None:
+                fieldnames = []
+            else:
+                fieldnames = list(first._fields if hasattr(first, '_fields') else first.keys())
+
+        # Open CSV file for writing, through a large buffer
+        self._logger.info('Saving {}'.format(self._path))
+        self._file = open(self._path, 'w', newline='', buffering=1048576)
+        self._asdict = False
+        if hasattr(first, '_fields') and list(first._fields) == fieldnames:
+            # namedtuple rows already hold the columns in order
+            writer = csv.writer(self._file)
+            writer.writerow(fieldnames)
+        else:
+            self._asdict = hasattr(first, '_asdict')
+            writer = csv.DictWriter(self._file, fieldnames=fieldnames, restval='', extrasaction='ignore')
+            if fieldnames:
+                writer.writeheader()
+        self._writerows = writer.writerows
+
+    def write(self, rows):
+        if self._file is None:
+            self._open(rows[0] if rows else None)
+        if self._asdict:
+            rows = [x._asdict() for x in rows]
+        self._writerows(rows)
+        self.count += len(rows)
+
+    def close(self):
+        if self._file is None:
+            self._open(None)
+        self._file.close()
+        if not self.count:
+            self._logger.info('No data to save, {} only has headers'.format(self._path))
+
+    def abort(self):
+        if self._file is not None:
+            self._file.close()
+
+
+class clsXmlSink(object):
+    '''Writes batches of rows to <filename>.xml as they arrive, laid out the
+    same as writexml
+
+    Each batch is converted with dicttoxml and pretty printed with minidom on
+    its own, so only one batch is held at a time rather than the whole
+    document.
+    '''
+
+    def __init__(self, fldrloc, filename, logger, fieldnames=None, elementheader=None):
+        try:
+            # Import dicttoxml module (needs to be installed, not embedded into Python)
+            import dicttoxml
+        except:
+            logger.error('Failed to import dicttoxml module')
+            logger.error(
+                'Likely cause is that the dicttoxml module has not been downloaded and installed. See https://pypi.python.org/pypi/dicttoxml', exc_info=True)
+            raise
+        self._dicttoxml = dicttoxml.dicttoxml
+        self._path = '{}{}.xml'.format(fldrloc, filename)
+        self._logger = logger
+        self._elementheader = elementheader
+        self._file = None
+
+    def write(self, rows):
+        from xml.dom.minidom import parseString
+
+        if not rows:
+            return
+        if self._file is None:
+            self._logger.info('Saving {}'.format(self._path))
+            self._file = open(self._path, 'w', encoding='utf-8', buffering=1048576)
+            self._file.write('<?xml version="1.0" ?>\n<root>\n')
+
+        # dicttoxml only knows dictionaries, namedtuple rows are converted
+        rows = [x._asdict() if hasattr(x, '_asdict') else x for x in rows]
+        xml = self._dicttoxml(rows, attr_type=False, item_func=lambda x: self._elementheader)
+        # Indented as children of <root>, as toprettyxml does for the whole document
+        for node in parseString(xml).documentElement.childNodes:
+            node.writexml(self._file, '\t', '\t', '\n')
+
+    def close(self):
+        if self._file is None:
+            # Nothing was written, an empty document
+            self._logger.info('Saving {}'.format(self._path))
+            with open(self._path, 'w', encoding='utf-8') as fobj:
+                fobj.write('<?xml version="1.0" ?>\n<root/>\n')
+            return
+        self._file.write('</root>\n')
+        self._file.close()
+        self._file = None
+
+    def abort(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class clsJsonlSink(object):
+    '''Writes batches of rows to <filename>.jsonl, one JSON object per line with
+    every key of the row (like the XML rather than the CSV)
+    '''
+
+    def __init__(self, fldrloc, filename, logger, fieldnames=None, elementheader=None):
+        self._path = '{}{}.jsonl'.format(fldrloc, filename)
+        logger.info('Saving {}'.format(self._path))
+        self._file = open(self._path, 'w', encoding='utf-8', buffering=1048576)
+
+    def write(self, rows):
+        import json
+
+        dumps = json.dumps
+        self._file.write(''.join(dumps(x._asdict() if hasattr(x, '_asdict') else x,
+                                       ensure_ascii=False, default=str) + '\n' for x in rows))
+
+    def close(self):
+        self._file.close()
+
+    def abort(self):
+        self._file.close()
+
+
+class clsSqliteSink(object):
+    '''Writes batches of rows to a table in <filename>.sqlite, replacing the
+    table from an earlier run
+
+    The table is named after the element header and has a TEXT column for
+    each of the fieldnames (or the keys of the first row).  All of the rows
+    go in as one transaction, committed by close.
+    '''
+
+    def __init__(self, fldrloc, filename, logger, fieldnames=None, elementheader=None):
+        self._path = '{}{}.sqlite'.format(fldrloc, filename)
+        self._logger = logger
+        self._fieldnames = None if fieldnames is None else list(fieldnames)
+        self._table = elementheader or filename
+        self._db = None
+
+    def _open(self, first):
+        import sqlite3
+
+        fieldnames = self._fieldnames
+        if fieldnames is None:
+            if first is None:
+                fieldnames = []
+            else:
+                fieldnames = list(first._fields if hasattr(first, '_fields') else first.keys())
+        self._fieldnames = fieldnames
+
+        def quote(name): return '"{}"'.format(str(name).replace('"', '""'))
+
+        self._logger.info('Saving {} (table {})'.format(self._path, self._table))
+        self._db = sqlite3.connect(self._path)
+        self._db.execute('DROP TABLE IF EXISTS {}'.format(quote(self._table)))
+        if fieldnames:
+            self._db.execute('CREATE TABLE {} ({})'.format(
+                quote(self._table), ', '.join(quote(x) + ' TEXT' for x in fieldnames)))
+        self._insert = 'INSERT INTO {} VALUES ({})'.format(quote(self._table), ', '.join('?' * len(fieldnames)))
+        # namedtuple rows already hold the columns in order
+        self._tuples = hasattr(first, '_fields') and list(first._fields) == fieldnames
+
+    def write(self, rows):
+        if self._db is None:
+            self._open(rows[0] if rows else None)
+        if not self._fieldnames:
+            return
+        if not self._tuples:
+            fieldnames = self._fieldnames
+            rows = [x._asdict() if hasattr(x, '_asdict') else x for x in rows]
+            rows = [tuple(x.get(y) for y in fieldnames) for x in rows]
+        self._db.executemany(self._insert, rows)
+
+    def close(self):
+        if self._db is None:
+            self._open(None)
+        self._db.commit()
+        self._db.close()
+
+    def abort(self):
+        if self._db is not None:
+            self._db.rollback()
+            self._db.close()
+
+
+def analysispages(sc, filters, tool='vulndetails', pagesize=1000):
+    '''Run a vulnerability analysis query a page at a time, yielding each page
+    of records as it arrives rather than waiting for all of them (see
+    pyPipeline.py)
+
+    Each page is a SecurityCenter5.analysis call for that page only.  Paging
+    stops at the first empty or short page, so a query whose results change
+    while it is being paged through ends cleanly.
+
+    Parameters
+    ----------
+    sc : obj
+        SecurityCenter connection
+    filters : list
+        Filters as (name, operator, value) tuples, and-ed together
+    tool : str
+        Analysis tool (ie. vulndetails, sumip)
+    pagesize : int
+        Number of records requested at a time
+
+    Returns
+    -------
+    generator : yields a list of records for each page, nothing if there weren't any
+
+    '''
+    page = 0
+    while True:
+        records = sc.analysis(*filters, tool=tool, page=page, page_size=pagesize)
+        if not records:
+            break
+        yield records
+        if len(records) < pagesize:
+            break
+        page += 1
+
+
+def planrules(sc, rules, logger, callseconds=1.0, local=(), pagesize=1000, chunksize=500):
+    '''Estimate the SecurityCenter queries and run time of parsing the risk
+    rules, without running them
+
+    Only the number of hosts behind each 'All Hosts' and asset rule is asked
+    for (one single record query per repository and asset).  The estimate
+    follows how the rule scripts run: one host lookup per 'All Hosts' or
+    asset rule, a page for every 'pagesize' hosts, the bulk checks of
+    clsRulePlanner, and one plugin lookup per plugin.
+
+    Parameters
+    ----------
+    sc : obj
+        SecurityCenter connection
+    rules : list
+        Risk rule dictionaries from SecurityCenter
+    logger : obj
+        Instance of logging obj
+    callseconds : float
+        Average seconds a query to SecurityCenter takes
+    local : set
+        IDs of rules answered without asking SecurityCenter (ie. expired)
+    pagesize : int
+        Records returned per page of a query
+    chunksize : int
+        Most IP addresses clsRulePlanner puts in a single query
+
+    Returns
+    -------
+    dict : estimated queries and seconds per rule ID, with the totals under 'total'
+
+    '''
+    import math
+
+    counts = {}
+    groups = {}
+    plugins = set()
+    plan = {}
+    byrepo = {}
+    bytype = {}
+
+    for rule in rules:
+        repoid = rule['repository']['id']
+        hosttype = rule['hostType']
+        hosts = 0
+        lookups = 0
+        assetid = None
+        if hosttype == 'ip':
+            hosts = 1
+        elif rule['id'] in local:
+            # Hosts of a rule answered locally aren't looked up (see parserules)
+            pass
+        elif hosttype == 'all':
+            key = (repoid, None)
+            if key not in counts:
+                counts[key] = _counthosts(sc, [('repositoryIDs', '=', repoid)])
+            hosts = counts[key]
+            lookups = max(1, int(math.ceil(hosts / float(pagesize))))
+        elif hosttype == 'asset':
+            assetid = rule['hostValue']['id']
+            if assetid == '-1':
+                continue
+            key = (repoid, assetid)
+            if key not in counts:
+                counts[key] = _counthosts(sc, [('assetID', '=', assetid), ('repositoryIDs', '=', repoid)])
+            hosts = counts[key]
+            lookups = max(1, int(math.ceil(hosts / float(pagesize))))
+
+        # Each rule has one host checked (see parserules), in bulk with the
+        # other rules for the same plugin, and its plugin looked up for the severity
+        if hosts and rule['id'] not in local:
+            groups[(rule['plugin']['id'], assetid)] = groups.get((rule['plugin']['id'], assetid), 0) + 1
+        plugins.add(rule['plugin']['id'])
+
+        plan[rule['id']] = {'repository': rule['repository']['name'], 'hostType': hosttype, 'hosts': hosts,
+                            'queries': lookups, 'seconds': lookups * callseconds}
+        for total, name in ((byrepo, rule['repository']['name']), (bytype, hosttype)):
+            entry = total.setdefault(name, {'rules': 0, 'hosts': 0, 'queries': 0})
+            entry['rules'] += 1
+            entry['hosts'] += hosts
+            entry['queries'] += lookups
+
+    checks = sum(int(math.ceil(x / float(chunksize))) for x in groups.values())
+    queries = sum(x['queries'] for x in plan.values()) + checks + len(plugins)
+
+    logger.info('Plan: {:<10}{:<12}{:<14}{:>10}{:>10}{:>12}'.format(
+        'Rule', 'Repository', 'Host type', 'Hosts', 'Queries', 'Est. sec'))
+    for ruleid, entry in plan.items():
+        logger.info('Plan: {:<10}{:<12}{:<14}{:>10}{:>10}{:>12.1f}'.format(
+            ruleid, entry['repository'], entry['hostType'], entry['hosts'], entry['queries'], entry['seconds']))
+    for title, totals in (('repository', byrepo), ('host type', bytype)):
+        for name, entry in sorted(totals.items()):
+            logger.info('Plan: by {} {}: {} rules, {} hosts, {} host lookup queries, {:.1f} sec'.format(
+                title, name, entry['rules'], entry['hosts'], entry['queries'], entry['queries'] * callseconds))
+    logger.info('Plan: {} bulk check queries for {} plugin groups, {} plugin lookups'.format(
+        checks, len(groups), len(plugins)))
+    logger.info('Plan: about {} queries to SecurityCenter taking {:.1f} seconds ({:.2f} sec per query)'.format(
+        queries, queries * callseconds, callseconds))
+
+    plan['total'] = {'queries': queries, 'seconds': queries * callseconds}
+    return plan
+
+
+def _counthosts(sc, filters):
+    '''Returns the number of hosts matching the filters, from a one record sumip query'''
+    query = {
+        'tool': 'sumip',
+        'type': 'vuln',
+        'filters': [{'filterName': f[0], 'operator': f[1], 'value': f[2], 'type': 'vuln'} for f in filters],
+        'startOffset': 0,
+        'endOffset': 1,
+    }
+    payload = {'type': 'vuln', 'sourceType': 'cumulative', 'query': query}
+    return int(sc.post('analysis', json=payload).json()['response']['totalRecords'])
+
+
+def queryseconds(summaryfile, default=1.0):
+    '''Returns the average seconds an analysis query took in the run the
+    summary file was written for, or default if it isn't known
+    '''
+    import json
+    import os
+
+    if not os.path.exists(summaryfile):
+        return default
+    try:
+        with open(summaryfile, 'r') as fobj:
+            calls = json.load(fobj).get('apiCalls', {})
+    except ValueError:
+        return default
+    count = sum(x['count'] for name, x in calls.items() if name.startswith('analysis:'))
+    seconds = sum(x['seconds'] for name, x in calls.items() if name.startswith('analysis:'))
+    if not count:
+        return default
+    return seconds / count
+
+
+class clsJournal(object):
+    '''Checkpoint journal used to resume long running rule parsing loops
+
+    Each finished rule is stored as one JSON line containing the rule ID and
+    the rows that were produced for it.  Lines are written out in batches
+    (every 'interval' rules or 'seconds' seconds, whichever comes first) so a
+    failure late in a run only loses the last batch instead of everything.
+
+    Work done before any rule is finished (ie. the host lookups of each rule
+    and the bulk queries of clsRulePlanner) is stored the same way as steps,
+    each under a key of its own, so resuming doesn't repeat it either.
+
+    Parameters
+    ----------
+    path : str
+        Folder location to store the journal in
+    filename : str
+        Name of the journal (leave out file extension)
+    logger : obj
+        Instance of logging obj
+    interval : int
+        Number of finished rules to collect before writing to the journal
+    seconds : int
+        Maximum number of seconds to hold finished rules before writing them
+    '''
+
+    def __init__(self, path, filename, logger, interval=25, seconds=60):
+        self._journalfile = '{}{}_journal.json'.format(path, filename)
+        self._logger = logger
+        self._interval = interval
+        self._seconds = seconds
+        self._pending = []
+        self._done = {}
+        self._steps = {}
+        self._fobj = None
+        self._lastflush = 0
+
+    def start(self, resume=False):
+        '''Open the journal.  If resume is True, rules recorded by a previous
+        run are loaded so they can be skipped, otherwise the journal starts empty.
+        '''
+        import json
+        import os
+        import time
+
+        self._done = {}
+        self._steps = {}
+        if resume and os.path.exists(self._journalfile):
+            with open(self._journalfile, 'r', encoding='utf-8') as fobj:
+                for line in fobj:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Last line may be cut short if the previous run died mid-write
+                        self._logger.warning(
+                            'Ignoring incomplete line in journal {}'.format(self._journalfile))
+                        continue
+                    if 'step' in entry:
+                        self._steps[entry['step']] = entry['value']
+                    else:
+                        self._done[entry['ruleID']] = entry['rows']
+            self._logger.info('Resuming from journal {}, {} rules and {} steps already finished'.format(
+                self._journalfile, len(self._done), len(self._steps)))
+            self._fobj = open(self._journalfile, 'a', encoding='utf-8')
+        else:
+            self._fobj = open(self._journalfile, 'w', encoding='utf-8')
+        self._lastflush = time.time()
+
+    def isdone(self, ruleid):
+        '''Returns True if the rule was finished by a previous run'''
+        return ruleid in self._done
+
+    def getrows(self, ruleid):
+        '''Returns the rows recorded for a rule finished by a previous run'''
+        return self._done[ruleid]
+
+    def record(self, ruleid, rows):
+        '''Record the rows produced for a finished rule'''
+        import time
+
+        self._pending.append({'ruleID': ruleid, 'rows': rows})
+        if len(self._pending) >= self._interval or time.time() - self._lastflush >= self._seconds:
+            self.flush()
+
+    def getstep(self, key):
+        '''Returns the value recorded for a step by a previous run, or None'''
+        return self._steps.get(key)
+
+    def recordstep(self, key, value):
+        '''Record the result of a finished step, value must be JSON serializable'''
+        import time
+
+        self._steps[key] = value
+        self._pending.append({'step': key, 'value': value})
+        if len(self._pending) >= self._interval or time.time() - self._lastflush >= self._seconds:
+            self.flush()
+
+    def flush(self):
+        '''Write any pending rules out to the journal file'''
+        import json
+        import os
+        import time
+
+        if self._fobj is None:
+            return
+        for entry in self._pending:
+            self._fobj.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._fobj.flush()
+        os.fsync(self._fobj.fileno())
+        self._pending = []
+        self._lastflush = time.time()
+
+    def close(self, remove=False):
+        '''Flush and close the journal.  Set remove to True once the run has
+        completed and its results are saved, as the journal is no longer needed.
+        '''
+        import os
+
+        if self._fobj is None:
+            return
+        self.flush()
+        self._fobj.close()
+        self._fobj = None
+        if remove and os.path.exists(self._journalfile):
+            os.remove(self._journalfile)
+
+
+class clsRuleCache(object):
+    '''Rows produced for each risk rule by earlier runs, reused while neither
+    the rule nor its repository has changed
+
+    Each rule is stored under its ID with a fingerprint of everything its rows
+    depend on: the rule itself (every field fetched, so the scripts ask for
+    its modifiedTime along with the target, port, plugin, status and created
+    time), when its repository last imported scan results, and anything else
+    the script passes in.  A rule whose fingerprint still
+    matches doesn't need any queries to SecurityCenter.  The file is rewritten
+    in one step by save, keeping only the rules seen in this run.
+
+    Parameters
+    ----------
+    path : str
+        Folder location to store the cache in
+    filename : str
+        Name of the cache (leave out file extension)
+    logger : obj
+        Instance of logging obj
+    '''
+
+    def __init__(self, path, filename, logger):
+        self._cachefile = '{}{}_rulecache.json'.format(path, filename)
+        self._logger = logger
+        self._entries = {}
+        self._seen = {}
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        '''Read the rules stored by the previous run, if there is a cache file'''
+        import json
+        import os
+
+        self._entries = {}
+        if os.path.exists(self._cachefile):
+            try:
+                with open(self._cachefile, 'r', encoding='utf-8') as fobj:
+                    self._entries = json.load(fobj)
+            except ValueError:
+                self._logger.warning('Ignoring unreadable rule cache {}'.format(self._cachefile))
+        self._logger.info('Loaded {} rules from rule cache {}'.format(len(self._entries), self._cachefile))
+
+    def fingerprint(self, rule, *extra):
+        '''Returns the fingerprint of a rule and anything else its rows depend on'''
+        import hashlib
+        import json
+
+        content = json.dumps([rule, extra], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+    def get(self, ruleid, fingerprint):
+        '''Returns the stored rows of the rule, or None if it has changed'''
+        entry = self._entries.get(ruleid)
+        if entry is not None and entry['fingerprint'] == fingerprint:
+            self.hits += 1
+            self._seen[ruleid] = entry
+            return entry['rows']
+        self.misses += 1
+        return None
+
+    def put(self, ruleid, fingerprint, rows):
+        '''Store the rows produced for a rule'''
+        self._seen[ruleid] = {'fingerprint': fingerprint, 'rows': rows}
+
+    def save(self):
+        '''Write the rules seen in this run to the cache file'''
+        import json
+        import os
+
+        tmpfile = self._cachefile + '.tmp'
+        with open(tmpfile, 'w', encoding='utf-8') as fobj:
+            json.dump(self._seen, fobj, ensure_ascii=False)
+        os.replace(tmpfile, self._cachefile)
+        self._logger.info('Rule cache: {} rules reused, {} evaluated'.format(self.hits, self.misses))
+
+
+class clsIPRanges(object):
+    '''Set of IP addresses written the way SecurityCenter takes them in rule
+    targets: single addresses, ranges and CIDR blocks in a comma separated list
+        10.0.0.1,10.0.1.0/24,10.0.2.1-10.0.2.50,10.0.3.1-20
+
+    The list is turned into sorted, non-overlapping intervals of addresses,
+    so checking whether an address is in the set is a binary search rather
+    than a pass over every entry.
+
+    Parameters
+    ----------
+    text : str
+        Comma separated addresses, ranges and CIDR blocks (IPv4 or IPv6)
+
+    Raises
+    ------
+    ValueError : if an entry isn't an address, range or CIDR block
+    '''
+
+    def __init__(self, text):
+        intervals = sorted(self._parse(x.strip()) for x in text.split(',') if x.strip())
+        if not intervals:
+            raise ValueError('No IP addresses in: ' + text)
+
+        # Merge overlapping and adjoining intervals.  Addresses are kept as
+        # (version, number) so IPv4 and IPv6 never mix.
+        merged = [list(intervals[0])]
+        for start, end in intervals[1:]:
+            last = merged[-1]
+            if start[0] == last[1][0] and start[1] <= last[1][1] + 1:
+                if end > last[1]:
+                    last[1] = end
+            else:
+                merged.append([start, end])
+        self._starts = [x[0] for x in merged]
+        self._ends = [x[1] for x in merged]
+
+    def __contains__(self, ip):
+        import bisect
+
+        key = self._key(ip)
+        if key is None:
+            return False
+        index = bisect.bisect_right(self._starts, key) - 1
+        return index >= 0 and key <= self._ends[index]
+
+    def select(self, ips):
+        '''Returns the addresses from ips that are in the set'''
+        return [x for x in ips if x in self]
+
+    def _key(self, ip):
+        import ipaddress
+
+        try:
+            addr = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        return (addr.version, int(addr))
+
+    def _parse(self, entry):
+        '''Returns the first and last address of an entry as (version, number)'''
+        import ipaddress
+
+        if '/' in entry:
+            network = ipaddress.ip_network(entry, strict=False)
+            return ((network.version, int(network.network_address)),
+                    (network.version, int(network.broadcast_address)))
+        if '-' in entry:
+            first, last = [x.strip() for x in entry.split('-', 1)]
+            start = ipaddress.ip_address(first)
+            # Short form where only the last octet is given (10.0.3.1-20)
+            if start.version == 4 and '.' not in last:
+                last = first.rsplit('.', 1)[0] + '.' + last
+            end = ipaddress.ip_address(last)
+            if start.version != end.version or end < start:
+                raise ValueError('Invalid IP range: ' + entry)
+            return (start.version, int(start)), (end.version, int(end))
+        addr = ipaddress.ip_address(entry)
+        return (addr.version, int(addr)), (addr.version, int(addr))
+
+
+class clsRulePlanner(object):
+    '''Groups the checks of whether risk rules still apply into bulk analysis queries
+
+    Checking every host of every rule with its own query makes the number of
+    queries grow with rules x hosts.  Instead each check is added to the
+    planner first.  Checks for the same plugin (and asset) are merged into
+    one query with comma separated IP and port values, and the results are
+    split back to each check locally, so the number of queries grows with
+    the number of distinct plugins:
+        planner = clsRulePlanner(sc, ('acceptRiskStatus', '=', 'accepted'))
+        planner.add(pluginid, ip, port)
+        planner.run()
+        applies = planner.applies(pluginid, ip, port)
+
+    Targets that are ranges, CIDR blocks or lists go into the same query, and
+    the addresses found are matched against them locally with clsIPRanges.
+    Only a target that can't be read as addresses is queried on its own.
+
+    Given a clsJournal, the result of each query is recorded as soon as it
+    is answered, and a resumed run reuses the answers recorded for the same
+    plugin (and asset) that covered all of its hosts and ports.
+
+    Parameters
+    ----------
+    sc : obj
+        SecurityCenter connection
+    statusfilter : tuple
+        Filter selecting the vulnerabilities the rules were applied to
+    chunksize : int
+        Most IP addresses put in a single query
+    journal : obj
+        clsJournal to record the answers in, None to not record them
+    '''
+
+    def __init__(self, sc, statusfilter, chunksize=500, journal=None):
+        self._sc = sc
+        self._status = statusfilter
+        self._chunksize = chunksize
+        self._journal = journal
+        # (pluginid, assetid) to {ip: set of ports}, a port of None is any port
+        self._groups = {}
+        # (pluginid, assetid) to the IPs and (ip, port) pairs found
+        self._found = {}
+        # Targets that aren't a single address to the clsIPRanges for them
+        self._ranges = {}
+        # Checks that have to be queried on their own, to 'True' or 'False'
+        self._single = {}
+        self.checks = 0
+        self.queries = 0
+
+    def add(self, pluginid, ip, port=None, assetid=None):
+        '''Add a check of whether the plugin has a vulnerability on the host
+
+        Parameters
+        ----------
+        pluginid : str
+            Plugin ID of the rule
+        ip : str
+            Host the rule targets
+        port : str
+            Port of the rule, None for any port
+        assetid : str
+            Asset ID of the rule, if it targets an asset
+        '''
+        self.checks += 1
+        if not self._isaddress(ip) and ip not in self._ranges:
+            try:
+                self._ranges[ip] = clsIPRanges(ip)
+            except ValueError:
+                self._single[(pluginid, ip, port, assetid)] = None
+                return
+        self._groups.setdefault((pluginid, assetid), {}).setdefault(ip, set()).add(port)
+
+    def run(self):
+        '''Run the queries for every check added'''
+        for key, targets in self._groups.items():
+            pluginid, assetid = key
+            ports = set()
+            for x in targets.values():
+                ports.update(x)
+            filters = [self._status, ('pluginID', '=', pluginid)]
+            if assetid is not None:
+                filters.append(('assetID', '=', assetid))
+            if None not in ports:
+                filters.append(('port', '=', ','.join(sorted(ports))))
+            # The port of each result is only needed when a check has one
+            tool = 'sumip' if ports == set([None]) else 'listvuln'
+
+            hosts = sorted(targets)
+            stepkey = 'planner {} {}'.format(pluginid, assetid)
+            if self._resumed(stepkey, tool, hosts, ports):
+                step = self._journal.getstep(stepkey)
+                self._found[key] = (set(step['ips']), set(tuple(x) for x in step['pairs']))
+                continue
+
+            ips = set()
+            pairs = set()
+            for start in range(0, len(hosts), self._chunksize):
+                chunk = hosts[start:start + self._chunksize]
+                results = self._query(filters + [('ip', '=', ','.join(chunk))], tool)
+                for x in results or []:
+                    ips.add(x['ip'])
+                    if tool == 'listvuln':
+                        pairs.add((x['ip'], x['port']))
+            self._found[key] = (ips, pairs)
+            if self._journal is not None:
+                self._journal.recordstep(stepkey, {
+                    'tool': tool, 'hosts': hosts, 'ports': None if None in ports else sorted(ports),
+                    'ips': sorted(ips), 'pairs': sorted(pairs)})
+
+        for key in self._single:
+            pluginid, ip, port, assetid = key
+            stepkey = 'planner single {} {} {} {}'.format(pluginid, ip, port, assetid)
+            if self._journal is not None and self._journal.getstep(stepkey) is not None:
+                self._single[key] = self._journal.getstep(stepkey)
+                continue
+            filters = [self._status, ('pluginID', '=', pluginid)]
+            if port is not None:
+                filters.append(('port', '=', port))
+            if assetid is not None:
+                filters.append(('assetID', '=', assetid))
+            filters.append(('ip', '=', ip))
+            self._single[key] = 'True' if self._query(filters, 'sumip') is not None else 'False'
+            if self._journal is not None:
+                self._journal.recordstep(stepkey, self._single[key])
+
+    def applies(self, pluginid, ip, port=None, assetid=None):
+        '''Returns 'True' if the plugin has a vulnerability on the host the
+        rule was applied to, otherwise 'False'.  Only valid after run.
+        '''
+        if (pluginid, ip, port, assetid) in self._single:
+            return self._single[(pluginid, ip, port, assetid)]
+        ips, pairs = self._found[(pluginid, assetid)]
+        if ip in self._ranges:
+            # Which of the addresses found fall in the target
+            matches = self._ranges[ip].select(ips)
+            if port is None:
+                found = bool(matches)
+            else:
+                found = any((x, port) in pairs for x in matches)
+        elif port is None:
+            found = ip in ips
+        else:
+            found = (ip, port) in pairs
+        return 'True' if found else 'False'
+
+    def _resumed(self, stepkey, tool, hosts, ports):
+        '''Whether a previous run recorded an answer for the group that covers
+        every one of these hosts and ports, and so can be reused
+        '''
+        if self._journal is None:
+            return False
+        step = self._journal.getstep(stepkey)
+        if step is None or step['tool'] != tool:
+            return False
+        if not set(hosts) <= set(step['hosts']):
+            return False
+        # Answers for any port cover every port, otherwise only the ports queried
+        return step['ports'] is None or (None not in ports and ports <= set(step['ports']))
+
+    def _query(self, filters, tool):
+        self.queries += 1
+        return self._sc.analysis(*filters, tool=tool)
+
+    def _isaddress(self, ip):
+        '''Whether the target is a single IP address rather than a range, CIDR or list'''
+        return not any(x in ip for x in (',', '-', '/'))
+
+
+class clsCachedResponse(object):
+    '''Stands in for a requests response object when it is served from the cache'''
+
+    def __init__(self, content):
+        self._content = content
+
+    def json(self):
+        return self._content
+
+
+class clsCachedSC(object):
+    '''Local response cache wrapped around a SecurityCenter connection
+
+    Calls to analysis(), get() and post('analysis') are fingerprinted from the
+    SecurityCenter host and user, the endpoint, filters and keyword arguments
+    (tool, params, etc.) and the responses are stored
+    gzip compressed in the cache folder.  The host and user are part of the
+    fingerprint as the cache folder is shared by every script, and two
+    SecurityCenters (or two users who can see different repositories) must
+    not be served each other's responses.  The repository endpoint is never
+    cached, its lastVulnUpdate times are what clsRuleCache checks to decide
+    whether a result is stale.  Entries older than 'ttl' seconds are
+    fetched again, and once the folder grows past 'maxsize' bytes the least
+    recently used entries are removed.  Anything else is passed straight
+    through to the SecurityCenter connection.
+
+    The size of the folder is worked out once when the cache is opened and
+    then kept up to date as entries are stored, so the folder is only listed
+    again once it has grown past 'maxsize'.  Eviction then removes entries
+    until the folder is back under 'lowwater' of 'maxsize', so it isn't
+    listed again on the very next store.  The repository workers share one
+    cache, so the size is updated under a lock.
+
+    Parameters
+    ----------
+    sc : obj
+        SecurityCenter connection
+    path : str
+        Folder location to store the cache in
+    logger : obj
+        Instance of logging obj
+    host : str
+        Address of the SecurityCenter the connection is logged in to
+    username : str
+        User the connection is logged in as
+    ttl : int
+        Number of seconds a cached response stays valid
+    maxsize : int
+        Maximum size of the cache folder in bytes
+    lowwater : float
+        Fraction of maxsize eviction brings the folder back down to
+    '''
+
+    # Endpoints always fetched from SecurityCenter
+    _uncached = ('repository',)
+
+    def __init__(self, sc, path, logger, host, username, ttl=86400, maxsize=500000000, lowwater=0.8):
+        import os
+        import threading
+
+        self._sc = sc
+        self._host = host
+        self._username = username
+        self._cacheloc = path
+        self._logger = logger
+        self._ttl = ttl
+        self._maxsize = maxsize
+        self._lowwater = lowwater
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if not os.path.exists(self._cacheloc):
+            os.makedirs(self._cacheloc)
+
+        # Size of the folder, scanned once here and kept up to date by _store
+        self._size = sum(x[1] for x in self._entries())
+
+    def __getattr__(self, name):
+        # Anything not cached goes straight to the SecurityCenter connection
+        return getattr(self._sc, name)
+
+    def analysis(self, *filters, **kwargs):
+        '''Cached version of SecurityCenter5.analysis'''
+        key = self._fingerprint('analysis', list(filters), kwargs)
+        found, content = self._load(key)
+        if not found:
+            content = self._sc.analysis(*filters, **kwargs)
+            self._store(key, content)
+        return content
+
+    def get(self, path, **kwargs):
+        '''Cached version of SecurityCenter5.get'''
+        if path in self._uncached:
+            return self._sc.get(path, **kwargs)
+        key = self._fingerprint(path, [], kwargs)
+        found, content = self._load(key)
+        if not found:
+            content = self._sc.get(path, **kwargs).json()
+            self._store(key, content)
+        return clsCachedResponse(content)
+
+    def post(self, path, **kwargs):
+        '''Cached version of SecurityCenter5.post, only for analysis queries
+        as any other post changes something in SecurityCenter
+        '''
+        if path != 'analysis':
+            return self._sc.post(path, **kwargs)
+        key = self._fingerprint(path, [], kwargs)
+        found, content = self._load(key)
+        if not found:
+            content = self._sc.post(path, **kwargs).json()
+            self._store(key, content)
+        return clsCachedResponse(content)
+
+    def logstats(self):
+        '''Log how many requests were served from the cache'''
+        self._logger.info('Cache served {} of {} requests'.format(
+            self.hits, self.hits + self.misses))
+
+    def _fingerprint(self, endpoint, filters, kwargs):
+        import hashlib
+        import json
+
+        request = json.dumps({'host': self._host, 'username': self._username, 'endpoint': endpoint,
+                              'filters': filters, 'kwargs': kwargs}, sort_keys=True, default=str)
+        return hashlib.sha256(request.encode('utf-8')).hexdigest()
+
+    def _load(self, key):
+        import gzip
+        import json
+        import os
+        import time
+
+        cachefile = '{}{}.json.gz'.format(self._cacheloc, key)
+        if os.path.exists(cachefile):
+            try:
+                with gzip.open(cachefile, 'rt', encoding='utf-8') as fobj:
+                    entry = json.load(fobj)
+                if time.time() - entry['created'] < self._ttl:
+                    # Touch the file so eviction treats it as recently used
+                    os.utime(cachefile, None)
+                    self.hits += 1
+                    return True, entry['content']
+            except (OSError, ValueError, KeyError):
+                self._logger.warning('Unreadable cache entry {}, fetching again'.format(cachefile))
+        self.misses += 1
+        return False, None
+
+    def _store(self, key, content):
+        import gzip
+        import json
+        import os
+        import threading
+        import time
+
+        cachefile = '{}{}.json.gz'.format(self._cacheloc, key)
+        # Write to a temp file first so a partial entry is never read back,
+        # named for the thread as the repository workers share the folder
+        tmpfile = '{}.{}-{}.tmp'.format(cachefile, os.getpid(), threading.get_ident())
+        with gzip.open(tmpfile, 'wt', encoding='utf-8', compresslevel=6) as fobj:
+            json.dump({'created': time.time(), 'content': content}, fobj, ensure_ascii=False)
+        size = os.path.getsize(tmpfile)
+
+        with self._lock:
+            # An expired or unreadable entry being replaced no longer counts
+            try:
+                size -= os.path.getsize(cachefile)
+            except OSError:
+                pass
+            os.replace(tmpfile, cachefile)
+            self._size += size
+            if self._size > self._maxsize:
+                self._evict()
+
+    def _entries(self):
+        '''Returns the modified time, size and name of every entry in the folder'''
+        import os
+
+        # Other scripts can be storing and evicting entries at the same time,
+        # so an entry may vanish while this runs
+        entries = []
+        for name in os.listdir(self._cacheloc):
+            if name.endswith('.json.gz'):
+                try:
+                    fstat = os.stat(self._cacheloc + name)
+                except FileNotFoundError:
+                    continue
+                entries.append((fstat.st_mtime, fstat.st_size, name))
+        return entries
+
+    def _evict(self):
+        '''Remove least recently used entries until the folder is back under
+        lowwater of maxsize.  Called with the lock held.
+        '''
+        import os
+
+        # Listed again rather than trusting the running size, which doesn't
+        # see entries stored or removed by other scripts
+        entries = self._entries()
+        total = sum(x[1] for x in entries)
+        entries.sort()
+        while total > self._maxsize * self._lowwater and entries:
+            mtime, size, name = entries.pop(0)
+            try:
+                os.remove(self._cacheloc + name)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._size = total
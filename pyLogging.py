@@ -19,10 +19,26 @@
 #        from pyLogging import clsLogging
 #        loginstance = clsLogging(scriptname)
 #        logger = loginstance.setup()
+#
+#    To keep logging off the worker thread, use the queued mode instead:
+#        logger = loginstance.setup(queued=True)
+#
+#    To also write the log as JSON lines (one object per message, tagged with
+#    a run ID and whatever is set with setcontext) to <scriptname>_log.jsonl:
+#        logger = loginstance.setup(jsonlog=True)
+#        loginstance.setcontext(repoID=repoID)
 
 # Import logging and logging.handlers modules (embedded into Python)
 import logging
 import logging.handlers
+import queue
+# Used by clsInstrument for the run summary
+import json
+import os
+import sys
+import threading
+import time
+import uuid
 
 
 class clsLogging(object):
@@ -32,29 +48,619 @@ class clsLogging(object):
         self._scriptname = filename
         self._fh = None
         self._ch = None
+        self._qh = None
+        self._jh = None
+        self._listener = None
+        self._dedupe = None
+        # Unique ID for this run so runs sharing a log can be told apart
+        self.runid = uuid.uuid4().hex
+        self._context = {'script': filename, 'runID': self.runid}
         # Configure debug logging
         # create logger with '__main__'
         self._logger = logging.getLogger(__name__)
         self._logger.setLevel(logging.DEBUG)
 
-    def setup(self):
-        # create rotating filehandler which logs messages to file
-        self._fh = logging.handlers.RotatingFileHandler(
-            self._scriptloc + self._scriptname + '.log', maxBytes=500000, backupCount=5)
-        self._fh.setLevel(logging.DEBUG)
+    def setup(self, queued=False, filelevel=logging.DEBUG, consolelevel=logging.DEBUG, dedupe=None, jsonlog=False):
+        '''Attach the log file and console handlers to the logger
+
+        queued : bool
+            Hand records to a background thread (QueueListener) which writes
+            them to the log file in batches, instead of writing them on the
+            thread doing the logging
+        filelevel / consolelevel : int
+            Lowest level written to the log file / console
+        dedupe : bool
+            Suppress repeats of the same warning (counted and reported when the
+            handlers are closed).  Defaults to on in queued mode.
+        jsonlog : bool
+            Also write every message as a line of JSON to <scriptname>_log.jsonl
+        '''
+        if dedupe is None:
+            dedupe = queued
+
+        # Every clsLogging in a process shares the one logger (ie. when the
+        # benchmarks load several scripts), so what an earlier setup attached
+        # is removed rather than stacked
+        for handler in list(self._logger.handlers):
+            self._logger.removeHandler(handler)
+            handler.close()
+        for logfilter in list(self._logger.filters):
+            self._logger.removeFilter(logfilter)
+
+        # levels can also be given by name (ie. 'WARNING')
+        filelevel = _tolevel(filelevel)
+        consolelevel = _tolevel(consolelevel)
+
+        if queued:
+            # create batching filehandler, flushed every 200 records or on errors
+            self._fh = clsBatchedFileHandler(
+                self._scriptloc + self._scriptname + '.log', maxBytes=500000, backupCount=5)
+        else:
+            # create rotating filehandler which logs messages to file
+            self._fh = logging.handlers.RotatingFileHandler(
+                self._scriptloc + self._scriptname + '.log', maxBytes=500000, backupCount=5)
+        self._fh.setLevel(filelevel)
         # create console handler which sends log messages to console
         self._ch = logging.StreamHandler()
-        self._ch.setLevel(logging.DEBUG)
+        self._ch.setLevel(consolelevel)
         # create formatter and add it to the handlers
         formatter = logging.Formatter(
             '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
         self._fh.setFormatter(formatter)
         self._ch.setFormatter(formatter)
-        # add the handlers to the logger
-        self._logger.addHandler(self._fh)
-        self._logger.addHandler(self._ch)
+        handlers = [self._fh, self._ch]
+
+        if jsonlog:
+            if queued:
+                self._jh = clsBatchedFileHandler(
+                    self._scriptloc + self._scriptname + '_log.jsonl', maxBytes=5000000, backupCount=5)
+            else:
+                self._jh = logging.handlers.RotatingFileHandler(
+                    self._scriptloc + self._scriptname + '_log.jsonl', maxBytes=5000000, backupCount=5)
+            self._jh.setLevel(filelevel)
+            self._jh.setFormatter(clsJsonFormatter())
+            handlers.append(self._jh)
+            # the context is copied onto each record when it is logged, as
+            # in queued mode it is only formatted later on another thread
+            self._logger.addFilter(clsContextFilter(self._context))
+
+        if dedupe:
+            # drop repeated warnings before they cost anything further
+            self._dedupe = clsDedupeFilter()
+            self._logger.addFilter(self._dedupe)
+
+        if queued:
+            # the logger only puts records on the queue, the listener thread
+            # does the formatting and writing
+            logqueue = queue.Queue(-1)
+            self._qh = logging.handlers.QueueHandler(logqueue)
+            self._qh.setLevel(min(filelevel, consolelevel))
+            self._listener = logging.handlers.QueueListener(
+                logqueue, *handlers, respect_handler_level=True)
+            self._listener.start()
+            self._logger.addHandler(self._qh)
+        else:
+            # add the handlers to the logger
+            for handler in handlers:
+                self._logger.addHandler(handler)
         return self._logger
 
+    def setcontext(self, **fields):
+        '''Set fields (ie. repoID, stage) added to every JSON log line from now on.
+        A field set to None is removed.
+        '''
+        # replaced rather than changed in place so records already holding
+        # the old context keep it
+        context = dict(self._context)
+        for key, value in fields.items():
+            if value is None:
+                context.pop(key, None)
+            else:
+                context[key] = value
+        self._context.clear()
+        self._context.update(context)
+
     def closeHandlers(self):
+        if self._dedupe is not None:
+            # report what was held back before the handlers go away
+            self._dedupe.report(self._logger)
+        if self._listener is not None:
+            # stop() waits for the queue to be written out
+            self._listener.stop()
+            self._listener = None
         self._fh.close()
         self._ch.close()
+        if self._jh is not None:
+            self._jh.close()
+
+
+class clsContextFilter(logging.Filter):
+    '''Copies the run context (script, run ID, repoID, stage, counters) onto each record'''
+
+    def __init__(self, context):
+        logging.Filter.__init__(self)
+        self._context = context
+
+    def filter(self, record):
+        record.context = dict(self._context)
+        return True
+
+
+class clsJsonFormatter(logging.Formatter):
+    '''Formats each record as a single line of JSON'''
+
+    def format(self, record):
+        entry = {
+            'time': '{}.{:03d}'.format(
+                time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created)), int(record.msecs)),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'pid': record.process,
+            'thread': record.threadName,
+        }
+        entry.update(getattr(record, 'context', {}))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+def _tolevel(level):
+    '''Returns the numeric logging level for a level number or name'''
+    if isinstance(level, int):
+        return level
+    value = logging.getLevelName(str(level).upper())
+    if not isinstance(value, int):
+        raise ValueError('Unknown logging level: {}'.format(level))
+    return value
+
+
+class clsBatchedFileHandler(logging.handlers.RotatingFileHandler):
+    '''RotatingFileHandler that only flushes every 'batchsize' records (or on
+    errors) and keeps track of the file size itself, rather than asking the
+    file for its size on every record to decide when to roll over.
+    '''
+
+    def __init__(self, filename, maxBytes=0, backupCount=0, batchsize=200):
+        logging.handlers.RotatingFileHandler.__init__(
+            self, filename, maxBytes=maxBytes, backupCount=backupCount)
+        self._batchsize = batchsize
+        self._unflushed = 0
+        self._size = None
+
+    def emit(self, record):
+        try:
+            msg = self.format(record) + self.terminator
+            if self.stream is None:
+                self.stream = self._open()
+            if self._size is None:
+                # file is opened for append, so this is its current size
+                self._size = self.stream.tell()
+            if self.maxBytes > 0 and self._size and self._size + len(msg) >= self.maxBytes:
+                self.doRollover()
+                self._size = 0
+            self.stream.write(msg)
+            self._size += len(msg)
+            self._unflushed += 1
+            if self._unflushed >= self._batchsize or record.levelno >= logging.ERROR:
+                self.stream.flush()
+                self._unflushed = 0
+        except Exception:
+            self.handleError(record)
+
+    def doRollover(self):
+        logging.handlers.RotatingFileHandler.doRollover(self)
+        self._unflushed = 0
+
+
+class clsDedupeFilter(logging.Filter):
+    '''Lets the first occurrence of a warning (or lower) message through and
+    counts the repeats instead of logging them.  Also caps the number of
+    different warnings let through per second.  Errors are never held back.
+
+    Messages are matched on their template (record.msg) rather than the
+    formatted text, so a warning logged with arguments for each host, ie.
+        logger.warning('No formatter available for %s', hostname)
+    is only let through once.  The most recently seen maxkeys templates are
+    remembered; one that drops out is let through again the next time.  The
+    pipeline and repository workers log from several threads, so the counts
+    are updated under a lock.
+    '''
+
+    def __init__(self, maxpersecond=50, maxkeys=5000):
+        from collections import OrderedDict
+
+        logging.Filter.__init__(self)
+        self._maxpersecond = maxpersecond
+        self._maxkeys = maxkeys
+        self._lock = threading.Lock()
+        # Template to [repeats, first formatted message], least recently seen first
+        self._seen = OrderedDict()
+        self._suppressed = 0
+        self._second = 0
+        self._passed = 0
+        self._ratelimited = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.ERROR or record.levelno < logging.WARNING:
+            return True
+        key = (record.levelno, record.msg)
+        with self._lock:
+            entry = self._seen.get(key)
+            if entry is not None:
+                entry[0] += 1
+                self._suppressed += 1
+                self._seen.move_to_end(key)
+                return False
+            self._seen[key] = [0, record.getMessage()]
+            if len(self._seen) > self._maxkeys:
+                self._seen.popitem(last=False)
+
+            now = int(time.time())
+            if now != self._second:
+                self._second = now
+                self._passed = 0
+            self._passed += 1
+            if self._passed > self._maxpersecond:
+                self._ratelimited += 1
+                return False
+        return True
+
+    def report(self, logger, top=10):
+        '''Log how many messages were held back, and the most repeated ones'''
+        with self._lock:
+            repeats = sorted(((entry[0], entry[1]) for entry in self._seen.values() if entry[0]), reverse=True)
+            suppressed = self._suppressed
+            ratelimited = self._ratelimited
+            self._seen.clear()
+            self._suppressed = 0
+            self._ratelimited = 0
+        if suppressed:
+            logger.info('{} repeated log messages were suppressed'.format(suppressed))
+            for count, message in repeats[:top]:
+                logger.info('Repeated {} more times: {}'.format(count, message))
+        if ratelimited:
+            logger.info('{} log messages were dropped by the rate limit'.format(ratelimited))
+
+
+class clsInstrument(object):
+    '''Tracks where the time of a run goes and writes it out as a JSON summary
+
+    Stages are marked as the script moves through them (login, fetch, parse,
+    write).  Marking a new stage ends the one before it.  Stages that run side
+    by side (see pyPipeline.py) are added with addstage() instead, each with
+    the time it was busy, while the stage they run in holds their total time.  Calls to
+    SecurityCenter are counted and timed by wrapping the connection with
+    wrapsc().  The summary is saved next to the log file as
+    <scriptname>_summary.json.
+
+    Optionally the same numbers, along with cache hit rates and peak memory,
+    are written as a Prometheus textfile collector file (<scriptname>.prom)
+    to the folder given to enablemetrics().
+
+    startprofile() runs the script under cProfile (saved as <scriptname>.prof)
+    and can also take a tracemalloc snapshot at the end of every stage
+    (saved as <scriptname>_<stage>.snapshot).
+
+    When given the clsLogging instance, the current stage and record counts
+    are kept in its JSON log context and the run ID goes in the summary.
+
+    Implement by adding the following to the calling script:
+        from pyLogging import clsInstrument
+        instrument = clsInstrument(scriptloc, scriptname, logger, loginstance)
+        instrument.stage('fetch')
+        instrument.addrecords('fetch', len(details))
+        instrument.writesummary(exit_code)
+    '''
+
+    # Upper bounds (in seconds) of the API latency histogram buckets
+    buckets = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, path, filename, logger, loginstance=None):
+        self._scriptloc = path
+        self._scriptname = filename
+        self._logger = logger
+        self._loginstance = loginstance
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self._clock = time.perf_counter()
+        self._current = None
+        self._stagestart = None
+        self._metricsloc = None
+        self._profiler = None
+        self._tracemem = False
+        self.stages = {}
+        self.apicalls = {}
+        self.caches = {}
+
+    def stage(self, name):
+        '''Mark the start of a stage, ending the current one'''
+        now = time.perf_counter()
+        with self._lock:
+            ended = self._current
+            if ended is not None:
+                self._getstage(ended)['seconds'] += now - self._stagestart
+            self._current = name
+            self._stagestart = now
+            if name is not None:
+                self._getstage(name)
+
+        if self._loginstance is not None:
+            self._loginstance.setcontext(stage=name)
+        if self._tracemem and ended is not None:
+            self._snapshot(ended)
+
+    def addstage(self, name, seconds):
+        '''Add the seconds a stage spent working while it ran alongside others
+        (ie. the busy time of each clsPipeline stage), without ending the
+        current stage, and take its memory snapshot if those are being taken
+        '''
+        with self._lock:
+            self._getstage(name)['seconds'] += seconds
+        if self._tracemem:
+            self._snapshot(name)
+
+    def currentstage(self):
+        '''Returns the name of the stage the run is in'''
+        return self._current
+
+    def addrecords(self, name, count):
+        '''Add to the number of records processed by a stage'''
+        with self._lock:
+            self._getstage(name)['records'] += count
+            counters = dict((stage, item['records']) for stage, item in self.stages.items() if item['records'])
+        if self._loginstance is not None:
+            self._loginstance.setcontext(counters=counters)
+
+    def apicall(self, name, seconds):
+        '''Record one call to SecurityCenter and how long it took'''
+        with self._lock:
+            call = self.apicalls.get(name)
+            if call is None:
+                call = self.apicalls[name] = {
+                    'count': 0, 'seconds': 0.0,
+                    'buckets': dict((str(b), 0) for b in self.buckets + ('+Inf',))}
+            call['count'] += 1
+            call['seconds'] += seconds
+            for bound in self.buckets:
+                if seconds <= bound:
+                    call['buckets'][str(bound)] += 1
+                    break
+            else:
+                call['buckets']['+Inf'] += 1
+
+    def addcache(self, name, hits, misses):
+        '''Add to the hit and miss counts of a cache (ie. plugdict)'''
+        with self._lock:
+            cache = self.caches.setdefault(name, {'hits': 0, 'misses': 0})
+            cache['hits'] += hits
+            cache['misses'] += misses
+
+    def enablemetrics(self, path):
+        '''Also write the run as a Prometheus textfile collector file to the given folder'''
+        self._metricsloc = path
+
+    def startprofile(self, memory=False):
+        '''Start profiling the run with cProfile, and with tracemalloc if memory is True.
+        The results are saved next to the log file by writesummary().
+        '''
+        import cProfile
+
+        if memory:
+            import tracemalloc
+            tracemalloc.start(25)
+            self._tracemem = True
+        self._profiler = cProfile.Profile()
+        self._profiler.enable()
+
+    def wrapsc(self, sc):
+        '''Returns the SecurityCenter connection wrapped so every call is counted and timed'''
+        return clsTimedSC(sc, self)
+
+    def writesummary(self, exit_code=0):
+        '''End the current stage and save the run summary as JSON next to the log
+        file, and as metrics if enablemetrics() was called
+        '''
+        self.stage(None)
+        if self._profiler is not None:
+            self._stopprofile()
+
+        summary = {
+            'script': self._scriptname,
+            'runID': self._loginstance.runid if self._loginstance is not None else None,
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self._started)),
+            'seconds': round(time.perf_counter() - self._clock, 3),
+            'exitCode': exit_code,
+            'python': sys.version.split()[0],
+            'peakRSS': peakrss(),
+            'stages': self.stages,
+            'apiCalls': self.apicalls,
+            'caches': self.caches,
+        }
+        for item in list(self.stages.values()) + list(self.apicalls.values()):
+            item['seconds'] = round(item['seconds'], 6)
+        summaryfile = self._scriptloc + self._scriptname + '_summary.json'
+        try:
+            with open(summaryfile, 'w') as fobj:
+                json.dump(summary, fobj, indent=4)
+            self._logger.info('Run summary written to {}'.format(summaryfile))
+        except Exception:
+            self._logger.warning('Unable to write run summary to {}'.format(summaryfile), exc_info=True)
+
+        if self._metricsloc is not None:
+            self.writemetrics(summary)
+
+    def writemetrics(self, summary):
+        '''Write the run summary in the Prometheus textfile collector format
+
+        The file is written to a temp file first and then moved into place so
+        the collector never reads a half written file.
+        '''
+        script = 'script="{}"'.format(_escapelabel(self._scriptname))
+        lines = []
+
+        def metric(name, mtype, helptext, samples):
+            # samples are (series suffix, extra labels, value)
+            lines.append('# HELP {} {}'.format(name, helptext))
+            lines.append('# TYPE {} {}'.format(name, mtype))
+            for suffix, labels, value in samples:
+                lines.append('{}{}{{{}}} {}'.format(name, suffix, ','.join([script] + labels), value))
+
+        def stagelabel(name):
+            return 'stage="{}"'.format(_escapelabel(name))
+
+        metric('sc_collector_last_run_timestamp_seconds', 'gauge', 'Time the run started',
+               [('', [], int(self._started))])
+        metric('sc_collector_run_seconds', 'gauge', 'Duration of the run',
+               [('', [], summary['seconds'])])
+        metric('sc_collector_exit_code', 'gauge', 'Exit code of the run, 0 when successful',
+               [('', [], summary['exitCode'])])
+        metric('sc_collector_peak_rss_bytes', 'gauge', 'Peak resident memory of the run',
+               [('', [], summary['peakRSS'])])
+        metric('sc_collector_stage_seconds', 'gauge', 'Time spent in each stage of the run',
+               [('', [stagelabel(name)], round(stage['seconds'], 6))
+                for name, stage in sorted(self.stages.items())])
+        metric('sc_collector_stage_records', 'gauge', 'Records fetched, parsed and written by each stage',
+               [('', [stagelabel(name)], stage['records'])
+                for name, stage in sorted(self.stages.items())])
+
+        samples = []
+        for name, call in sorted(self.apicalls.items()):
+            label = 'call="{}"'.format(_escapelabel(name))
+            # Prometheus histogram buckets are cumulative
+            total = 0
+            for bound in [str(b) for b in self.buckets] + ['+Inf']:
+                total += call['buckets'][bound]
+                samples.append(('_bucket', [label, 'le="{}"'.format(bound)], total))
+            samples.append(('_sum', [label], round(call['seconds'], 6)))
+            samples.append(('_count', [label], call['count']))
+        metric('sc_collector_api_request_seconds', 'histogram', 'Latency of calls made to SecurityCenter',
+               samples)
+
+        samples = []
+        for name, cache in sorted(self.caches.items()):
+            label = 'cache="{}"'.format(_escapelabel(name))
+            samples.append(('', [label, 'result="hit"'], cache['hits']))
+            samples.append(('', [label, 'result="miss"'], cache['misses']))
+        metric('sc_collector_cache_lookups', 'gauge', 'Cache lookups by result (ie. plugdict)', samples)
+
+        metricsfile = self._metricsloc + self._scriptname + '.prom'
+        try:
+            with open(metricsfile + '.tmp', 'w') as fobj:
+                fobj.write('\n'.join(lines) + '\n')
+            os.replace(metricsfile + '.tmp', metricsfile)
+            self._logger.info('Metrics written to {}'.format(metricsfile))
+        except Exception:
+            self._logger.warning('Unable to write metrics to {}'.format(metricsfile), exc_info=True)
+
+    def _stopprofile(self):
+        '''Save the cProfile stats (plus a readable top 40) and stop tracemalloc'''
+        import io
+        import pstats
+
+        self._profiler.disable()
+        proffile = self._scriptloc + self._scriptname + '.prof'
+        try:
+            self._profiler.dump_stats(proffile)
+            report = io.StringIO()
+            pstats.Stats(self._profiler, stream=report).sort_stats('cumulative').print_stats(40)
+            with open(self._scriptloc + self._scriptname + '_profile.txt', 'w') as fobj:
+                fobj.write(report.getvalue())
+            self._logger.info('Profile written to {} (view with: python -m pstats {})'.format(proffile, proffile))
+        except Exception:
+            self._logger.warning('Unable to write profile to {}'.format(proffile), exc_info=True)
+        self._profiler = None
+
+        if self._tracemem:
+            import tracemalloc
+            tracemalloc.stop()
+            self._tracemem = False
+
+    def _snapshot(self, name):
+        '''Save a tracemalloc snapshot at the end of a stage along with the stage's peak memory'''
+        import tracemalloc
+
+        current, peak = tracemalloc.get_traced_memory()
+        with self._lock:
+            self._getstage(name)['peakMemory'] = max(peak, self._getstage(name).get('peakMemory', 0))
+        snapfile = '{}{}_{}.snapshot'.format(self._scriptloc, self._scriptname, name)
+        try:
+            tracemalloc.take_snapshot().dump(snapfile)
+        except Exception:
+            self._logger.warning('Unable to write memory snapshot to {}'.format(snapfile), exc_info=True)
+        # Start measuring the next stage's peak from here
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+
+    def _getstage(self, name):
+        if name not in self.stages:
+            self.stages[name] = {'seconds': 0.0, 'records': 0}
+        return self.stages[name]
+
+
+def _escapelabel(value):
+    '''Escape a value for use as a Prometheus label'''
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def peakrss():
+    '''Returns the peak resident memory of this process in bytes, or 0 if it can't be determined'''
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS reports bytes
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except ImportError:
+        pass
+
+    try:
+        # Windows has no resource module, ask the process API instead
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        ctypes.windll.psapi.GetProcessMemoryInfo(
+            ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb)
+        return counters.PeakWorkingSetSize
+    except Exception:
+        return 0
+
+
+class clsTimedSC(object):
+    '''Wraps a SecurityCenter connection so calls to analysis, get and post are
+    counted and timed by a clsInstrument.  Anything else is passed straight through.
+    '''
+
+    def __init__(self, sc, instrument):
+        self._sc = sc
+        self._instrument = instrument
+
+    def __getattr__(self, name):
+        return getattr(self._sc, name)
+
+    def _timed(self, name, func, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self._instrument.apicall(name, time.perf_counter() - start)
+
+    def analysis(self, *filters, **kwargs):
+        return self._timed('analysis:' + str(kwargs.get('tool', 'vulndetails')),
+                           self._sc.analysis, *filters, **kwargs)
+
+    def get(self, path, **kwargs):
+        return self._timed('get:' + path, self._sc.get, path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self._timed('post:' + path, self._sc.post, path, **kwargs)
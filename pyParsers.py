@@ -0,0 +1,372 @@
+#-------------------------------------------------------------------------------
+# Name:        pyParsers
+# Purpose:      Parsers for the plugin output of vulndetails records
+#               (Common code)
+#
+# Author:      DGarland
+#-------------------------------------------------------------------------------
+
+# Requirements:
+#    Each plugin a script reads is registered with the parser that understands
+#    its output.  A plugin whose output differs by operating system (ie. 22869)
+#    is registered once per OS, with the text that identifies the OS in the
+#    plugin output (its fingerprint).  The script looks up the parser once per
+#    record and hands it the lines of the plugin output:
+#        from pyParsers import softwareparsers, stripoutput
+#        parser = softwareparsers.get(x['pluginID'], x['pluginText'])
+#        softname, version, installedon = parser.parse(line)
+#
+#    To read another plugin, write a parser class with the same parse method
+#    and register it below.  The registered plugin IDs are also used for the
+#    scripts' SecurityCenter query.
+#
+#    softwarerows and portrow at the bottom turn a whole record into the rows
+#    of the software and ports reports, so InstallSoftware.py,
+#    PortsServices.py and HostInventory.py all build them the same way.
+
+import re
+from collections import namedtuple
+from sys import intern
+
+from pyCommon import gethostname, converttime, ipversion
+
+# Compiled once when the module is imported rather than for every record
+_PLUGINOUTPUT = re.compile(r'(\n)?(\n)?<\/?plugin_output>(\n)?')
+
+
+def stripoutput(text):
+    '''Returns the plugin text with the <plugin_output> tags removed'''
+    return _PLUGINOUTPUT.sub('', text)
+
+
+class clsParserRegistry(object):
+    '''Maps plugin IDs, and optionally OS fingerprints found in the plugin
+    output, to the parser objects for them
+    '''
+
+    def __init__(self):
+        # Plugin ID to either a parser, or a list of (fingerprints, parser)
+        self._parsers = {}
+
+    def register(self, pluginid, parser, fingerprints=None):
+        '''Register the parser for a plugin
+
+        Paramaters
+        ----------
+        pluginid : str
+            Nessus plugin ID
+        parser : object
+            Parser for the plugin output
+        fingerprints : tuple
+            Strings identifying the OS in the plugin output, any one of which
+            selects this parser.  Checked in the order they were registered.
+        '''
+        if fingerprints is None:
+            self._parsers[pluginid] = parser
+        else:
+            entry = self._parsers.get(pluginid)
+            if not isinstance(entry, list):
+                entry = self._parsers[pluginid] = []
+            entry.append((tuple(fingerprints), parser))
+
+    def get(self, pluginid, text=''):
+        '''Returns the parser for a record, or None if there isn't one'''
+        entry = self._parsers.get(pluginid)
+        if entry.__class__ is not list:
+            return entry
+        for fingerprints, parser in entry:
+            for fingerprint in fingerprints:
+                if fingerprint in text:
+                    return parser
+        return None
+
+    def plugins(self):
+        '''Returns the registered plugin IDs as a comma separated string for queries'''
+        return ','.join(sorted(self._parsers))
+
+
+#--- Installed software (InstallSoftware.py) ---
+# parse returns (softname, version, installedon) for a line of the software
+# list, or None if the line should be skipped
+
+# One row of the software report.  Rows are kept as tuples rather than
+# dictionaries to save memory on large exports, the writers in pyCommon.py
+# take either.
+clsSoftwareRow = namedtuple('clsSoftwareRow', [
+    'AssetName', 'IPAddress', 'SoftwareVendor', 'SoftwareName', 'SoftwareVersion', 'InstallDate', 'DateCollected'])
+
+
+class clsWindowsSoftware(object):
+    '''Plugin 20811 (Microsoft Windows Installed Software Enumeration) lines:
+    Name  [version 1.2.3]  [installed on 2017/01/01]
+
+    The name, version and install date are all taken in one pass over the
+    brackets in the line rather than a regular expression for each.  The name
+    is everything before the first '[', the version the text after the first
+    '[version ' up to the next ']', and the install date the same for
+    '[installed on '.
+    '''
+
+    def parse(self, line):
+        bracket = line.find('[')
+        if bracket == -1:
+            # if version or installed on does not exist in string
+            return line, '', ''
+
+        softname = line[:bracket]
+        version = None
+        installedon = None
+        # Whether the tags appear at all, as a tag without its text is an error
+        seenversion = seeninstalled = False
+
+        find = line.find
+        while bracket != -1:
+            if line.startswith('version', bracket + 1):
+                seenversion = True
+                if version is None and line[bracket + 8:bracket + 9].isspace():
+                    close = find(']', bracket + 9)
+                    if close == -1:
+                        break
+                    version = line[bracket + 9:close]
+            elif line.startswith('installed', bracket + 1):
+                seeninstalled = True
+                if (installedon is None and line[bracket + 10:bracket + 11].isspace() and
+                        line.startswith('on', bracket + 11) and line[bracket + 13:bracket + 14].isspace()):
+                    close = find(']', bracket + 14)
+                    if close == -1:
+                        break
+                    installedon = line[bracket + 14:close]
+            if version is not None and installedon is not None:
+                break
+            bracket = find('[', bracket + 1)
+
+        if (seenversion and version is None) or (seeninstalled and installedon is None):
+            raise ValueError('Unable to read software line: ' + line)
+
+        return softname, version or '', installedon or ''
+
+
+class clsRpmSoftware(object):
+    '''Plugin 22869 lines from CentOS / Red Hat:
+      name-version-release.arch|(none)|install date
+
+    Split with str methods and a single search for the first '-' followed by
+    a digit, as this is run for every package on every host.  The split
+    matches the lookbehind patterns it replaced: the name runs from after the
+    first two whitespace characters in a row up to the first '-' followed by
+    a digit, and the version from the first '-' followed by a digit up to the
+    last '|'.
+    '''
+
+    def __init__(self):
+        self._dash = re.compile(r'-\d')
+
+    def parse(self, line):
+        # The name nearly always starts after two leading spaces
+        if line[:2].isspace():
+            start = 2
+        else:
+            start = self._start(line)
+
+        found = self._dash.search(line)
+        end = line.rfind('|')
+        if start == -1 or found is None or end <= found.start() + 1:
+            raise ValueError('Unable to read RPM package line: ' + line)
+        dash = found.start()
+
+        # Only when the line doesn't start with the spaces can the version's
+        # dash come before the name
+        namedash = dash
+        if dash < start:
+            found = self._dash.search(line, start)
+            if found is None:
+                raise ValueError('Unable to read RPM package line: ' + line)
+            namedash = found.start()
+
+        return line[start:namedash], line[dash + 1:end], ''
+
+    def _start(self, line):
+        '''Returns where the first two whitespace characters in a row end, or -1'''
+        for index in range(2, len(line) + 1):
+            if line[index - 2].isspace() and line[index - 1].isspace():
+                return index
+        return -1
+
+
+class clsSolarisSoftware(object):
+    '''Plugin 22869 lines from Solaris 11:
+      package/name    version    flags
+    '''
+
+    def __init__(self):
+        self._software = re.compile(r'([\w\/]+)\W+([0-9\.\-]+).*')
+
+    def parse(self, line):
+        softname = ''
+        version = ''
+        for item in self._software.findall(line.strip()):
+            softname = item[0].strip()
+            version = item[1].strip()
+        return softname, version, ''
+
+
+class clsHpuxSoftware(object):
+    '''Plugin 22869 lines from HP-UX:
+      name    version
+    '''
+
+    def __init__(self):
+        self._software = re.compile(r'(.*)\s+(.*)')
+
+    def parse(self, line):
+        software = self._software.findall(line.strip())
+        if not software:
+            return None
+        for item in software:
+            softname = item[0].strip()
+            version = item[1].strip()
+        return softname, version, ''
+
+
+softwareparsers = clsParserRegistry()
+softwareparsers.register('20811', clsWindowsSoftware())
+softwareparsers.register('22869', clsRpmSoftware(), ('CentOS Linux system', 'Red Hat Linux system'))
+softwareparsers.register('22869', clsSolarisSoftware(), ('Solaris 11 system',))
+softwareparsers.register('22869', clsHpuxSoftware(), ('HP-UX system',))
+
+
+#--- Listening ports (PortsServices.py) ---
+# parse returns the name of the process listening on the port from the
+# whole plugin text
+
+
+class clsWindowsListener(object):
+    '''Plugin 34252 (Microsoft Windows Remote Listeners Enumeration):
+    The Win32 process 'svchost.exe' is listening on this port (pid 4).
+    '''
+
+    def __init__(self):
+        self._process = re.compile('(?<=\')(.+)(?=\')')
+
+    def parse(self, text):
+        return self._process.findall(text)[0]
+
+
+class clsUnixListener(object):
+    '''Plugin 25221 (Remote listeners enumeration (Linux / AIX)), the
+    executable on the second line:
+    Executable   : /usr/sbin/sshd
+    '''
+
+    def __init__(self):
+        self._process = re.compile('([^/]*)$')
+
+    def parse(self, text):
+        return self._process.findall(text.splitlines()[1])[0]
+
+
+portparsers = clsParserRegistry()
+portparsers.register('34252', clsWindowsListener())
+portparsers.register('25221', clsUnixListener())
+
+
+#--- Records to report rows ---
+
+
+def recordhost(record):
+    '''Returns the name of the host of a record, its DNS name or else its NetBIOS name'''
+    if record['dnsName']:  # check to see if dnsName contains any data
+        return record['dnsName']
+    return record['netbiosName']  # if not, then use NetBIOS Name
+
+
+def softwarerows(record, logger):
+    '''Returns the clsSoftwareRow rows of a 20811 or 22869 record, one per package
+
+    The plugin text of the record is replaced by the text without its
+    <plugin_output> tags.  The same host, IP, date and package strings repeat
+    across many rows, so they are interned to share one copy of each.
+    '''
+    # remove <plugin_output> headers from text
+    text = record['pluginText'] = stripoutput(record['pluginText'])
+
+    # Parser for this plugin (and for 22869, the OS named in the plugin text)
+    parser = softwareparsers.get(record['pluginID'], text)
+
+    hostname = recordhost(record)
+
+    # The same for every package on the host, only worked out once there is a
+    # package to report so a record without any never fails on its host name or date
+    assetname = ipaddress = datecollected = None
+
+    rows = []
+
+    # Split multiline plugin text into individual lines, the packages start on the third
+    lines = text.splitlines()
+    for line in range(2, (len(lines))):
+
+        # if pluginText reaches a blank line, break out of loop
+        if not lines[line]:
+            break
+
+        if parser is None:
+            logger.warning('No formatter available for %s. Data for this system is not parsed nor saved to XML.',
+                           hostname)
+            continue
+
+        software = parser.parse(lines[line])
+
+        # Line the parser couldn't read
+        if software is None:
+            continue
+
+        if assetname is None:
+            assetname = intern(gethostname(hostname))
+            ipaddress = intern(record['ip'])
+            datecollected = intern(converttime(record['lastSeen']))
+
+        rows.append(clsSoftwareRow(
+            assetname, ipaddress, '', intern(software[0]), intern(software[1]),
+            intern(software[2]), datecollected))
+
+    return rows
+
+
+def portrow(record, logger):
+    '''Returns the ports and services row (a dictionary) of a 34252 or 25221
+    record, or None if the process listening couldn't be found
+
+    The plugin text of the record is replaced by the text without its
+    <plugin_output> tags.
+    '''
+    # remove <plugin_output> headers from text
+    text = record['pluginText'] = stripoutput(record['pluginText'])
+
+    # Filter out all extraneous text except for the process name (ie. svchost.exe)
+    servicename = ''
+    parser = portparsers.get(record['pluginID'])
+    if parser is not None:
+        servicename = parser.parse(text)
+
+    if not servicename:
+        logger.warning('No formatter available for %s. Data for this system is not parsed nor saved to XML.',
+                       recordhost(record))
+        return None
+
+    # names in the record dictionary are case sensitive
+    try:
+        return {
+            'AssetName': gethostname(recordhost(record)),
+            'IPAddress': record['ip'],
+            'Protocol': record['protocol'],
+            'IPVersion': ipversion(record['ip']),
+            'PortNumber': record['port'],
+            'Process': servicename,
+            'CreateDate': converttime(record['lastSeen']),
+            'pluginText': text,
+        }
+    except Exception:
+        logger.error('Adding data to dictionary failed')
+        logger.error('Data string follows')
+        logger.error(record)
+        raise
@@ -0,0 +1,615 @@
+#-------------------------------------------------------------------------------
+# Name:        pyPipeline
+# Purpose:      Runs the fetch, parse and write stages of a script side by side
+#               (Common code)
+#
+# Author:      DGarland
+#-------------------------------------------------------------------------------
+
+# Requirements:
+#    Rather than fetching everything, then parsing everything, then writing
+#    everything, each stage runs in its own thread and hands its work on to
+#    the next through a queue as soon as it is done with it:
+#
+#        fetch thread  -->  parse thread  -->  writer thread
+#        (pages of records)   (rows per page)    (rows in page order)
+#
+#    so waiting on SecurityCenter and on the disk overlaps with the parsing,
+#    and a run takes about as long as its slowest stage rather than the sum
+#    of them.  The queues only hold a few pages each, so a fast stage waits
+#    for a slow one instead of piling everything up in memory.
+#
+#    The stages are threads, so only one of them runs Python code at a time.
+#    What overlaps is the time spent waiting: on SecurityCenter's responses,
+#    and on writing files.  Parsing is pure Python, so more parse threads
+#    don't parse any faster and there is one by default.
+#
+#        from pyPipeline import clsPipeline
+#        pipeline = clsPipeline(logger)
+#        wrote = pipeline.run(pages, parse, write)
+#
+#    pages is any iterable of lists of records (ie. analysispages in
+#    pyCommon.py), parse takes one page and returns its rows, and write takes
+#    an iterable of all of the rows in order (ie. writecsv).  An error in any
+#    stage stops the others and is raised by run.
+#
+#    clsCollector drives a whole run of the vulndetails scripts with it:
+#    connecting to SecurityCenter (or replaying a writedev dump), collecting
+#    one repository through the pipeline or several side by side (each
+#    through its own pipeline), and writing the results, so each script only brings its parse and write
+#    functions.
+
+import pickle
+import queue
+import tempfile
+import threading
+import time
+from itertools import chain, islice
+
+# Marks the end of the pages on a queue
+_DONE = object()
+
+
+class _clsStopped(Exception):
+    '''Raised in a stage when another stage has failed'''
+
+
+def repofilename(filename, repo):
+    '''Returns the name a repository's results are saved under, the same
+    whether it was asked for on its own or in a list: <filename>-Repo<repository
+    ID#>, or just filename for all repositories ('0')
+    '''
+    if repo == '0':
+        return filename
+    return filename + '-Repo' + repo
+
+
+def batches(records, size=1000):
+    '''Returns the records as lists of up to size records, to feed a pipeline
+    from a stream of single records (ie. readdev)
+    '''
+    records = iter(records)
+    while True:
+        batch = list(islice(records, size))
+        if not batch:
+            return
+        yield batch
+
+
+class clsSpool(object):
+    '''Keeps a copy of rows in a temporary file as they are written, to be
+    read back once they are all done, so rows written to one file can also
+    go into a merged file without being held in memory
+
+    The file is removed when the spool is closed.
+    '''
+
+    def __init__(self, batchsize=1000):
+        self._file = tempfile.TemporaryFile()
+        self._batchsize = batchsize
+
+    def rows(self, rows):
+        '''Yields each of the rows after adding it to the spool'''
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, self._batchsize))
+            if not batch:
+                return
+            pickle.dump(batch, self._file, pickle.HIGHEST_PROTOCOL)
+            for row in batch:
+                yield row
+
+    def read(self):
+        '''Yields the rows in the spool, in the order they were added'''
+        self._file.seek(0)
+        while True:
+            try:
+                batch = pickle.load(self._file)
+            except EOFError:
+                return
+            for row in batch:
+                yield row
+
+    def close(self):
+        self._file.close()
+
+
+class clsPipeline(object):
+    '''Fetch, parse and write pages of records in separate threads
+
+    Parameters
+    ----------
+    logger : obj
+        Instance of logging obj
+    workers : int
+        Number of threads parsing pages.  They share the GIL, so more than one
+        only helps a parse function that waits on something (ie. I/O), not
+        the pure Python parsers of the scripts.
+    queuesize : int
+        Most pages waiting between two stages
+    instrument : obj
+        clsInstrument of the script, given the busy seconds of each stage (and
+        so its memory snapshot) as the stage finishes
+
+    After run, records holds the number of records fetched, rows the number
+    parsed, result what the write function returned, and busy the seconds
+    each stage spent working (as opposed to waiting on the others).
+    '''
+
+    def __init__(self, logger, workers=1, queuesize=4, instrument=None):
+        self._logger = logger
+        self._workers = workers
+        self._queuesize = queuesize
+        self._instrument = instrument
+        self.pages = 0
+        self.records = 0
+        self.rows = 0
+        self.result = None
+        self.busy = {}
+
+    def run(self, pages, parse, write):
+        '''Run the pipeline until every page is written
+
+        Parameters
+        ----------
+        pages : iterable
+            Lists of records, fetched as they are asked for
+        parse : function
+            Takes a list of records and returns a list of rows
+        write : function
+            Takes an iterable of rows, in the order of the pages
+
+        Returns
+        -------
+        bool : False if there were no pages, in which case write isn't called
+
+        '''
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._error = None
+        self._fetched = queue.Queue(self._queuesize)
+        self._parsed = queue.Queue(self._queuesize)
+        self._wrote = False
+        self._parsing = self._workers
+        self.pages = self.records = self.rows = 0
+        self.result = None
+        self.busy = {'fetch': 0.0, 'parse': 0.0, 'write': 0.0}
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=self._guard, args=(self._fetch, pages), name='pipeline-fetch')]
+        for index in range(self._workers):
+            threads.append(threading.Thread(target=self._guard, args=(self._parse, parse),
+                                            name='pipeline-parse{}'.format(index)))
+        threads.append(threading.Thread(target=self._guard, args=(self._write, write), name='pipeline-write'))
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if self._error is not None:
+            raise self._error
+
+        self._logger.info('Pipeline: {} pages, {} records, {} rows in {:.2f} sec (fetch {:.2f}, parse {:.2f}, write {:.2f} sec busy)'.format(
+            self.pages, self.records, self.rows, time.perf_counter() - start,
+            self.busy['fetch'], self.busy['parse'], self.busy['write']))
+        return self._wrote
+
+    def _guard(self, func, arg):
+        '''Run a stage, stopping the others if it fails'''
+        try:
+            func(arg)
+        except _clsStopped:
+            pass
+        except BaseException as e:
+            with self._lock:
+                if self._error is None:
+                    self._error = e
+            self._stop.set()
+
+    def _addbusy(self, stage, seconds):
+        with self._lock:
+            self.busy[stage] += seconds
+
+    def _stagedone(self, stage):
+        '''Hand the busy seconds of a finished stage to the instrument'''
+        if self._instrument is not None:
+            self._instrument.addstage(stage, self.busy[stage])
+
+    def _put(self, fifo, item):
+        while True:
+            if self._stop.is_set():
+                raise _clsStopped()
+            try:
+                fifo.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _get(self, fifo):
+        while True:
+            if self._stop.is_set():
+                raise _clsStopped()
+            try:
+                return fifo.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+    def _fetch(self, pages):
+        pages = iter(pages)
+        while True:
+            start = time.perf_counter()
+            try:
+                page = next(pages)
+            except StopIteration:
+                break
+            finally:
+                self._addbusy('fetch', time.perf_counter() - start)
+            if not page:
+                continue
+            self._put(self._fetched, (self.pages, page))
+            self.pages += 1
+            self.records += len(page)
+        self._stagedone('fetch')
+        # Each parse thread stops at its own end marker
+        for index in range(self._workers):
+            self._put(self._fetched, _DONE)
+
+    def _parse(self, parse):
+        while True:
+            item = self._get(self._fetched)
+            if item is _DONE:
+                with self._lock:
+                    self._parsing -= 1
+                    last = not self._parsing
+                # The stage is done once the last of the parse threads is
+                if last:
+                    self._stagedone('parse')
+                self._put(self._parsed, _DONE)
+                return
+            number, page = item
+            start = time.perf_counter()
+            rows = parse(page)
+            self._addbusy('parse', time.perf_counter() - start)
+            self._put(self._parsed, (number, rows))
+
+    def _write(self, write):
+        start = time.perf_counter()
+        self._waited = 0.0
+        ordered = self._ordered()
+        first = next(ordered, None)
+        if first is not None:
+            self._wrote = True
+            self.result = write(self._rows(first, ordered))
+        self._addbusy('write', time.perf_counter() - start - self._waited)
+        self._stagedone('write')
+
+    def _ordered(self):
+        '''Yields the parsed pages in the order they were fetched, as the parse
+        threads can finish them out of order
+        '''
+        pending = {}
+        number = 0
+        done = 0
+        while done < self._workers:
+            start = time.perf_counter()
+            item = self._get(self._parsed)
+            self._waited += time.perf_counter() - start
+            if item is _DONE:
+                done += 1
+                continue
+            pending[item[0]] = item[1]
+            while number in pending:
+                yield pending.pop(number)
+                number += 1
+
+    def _rows(self, first, ordered):
+        for page in chain([first], ordered):
+            self.rows += len(page)
+            for row in page:
+                yield row
+
+
+class clsCollector(object):
+    '''Collects vulndetails records from SecurityCenter and runs them through a
+    script's parse and write functions (used by InstallSoftware.py and
+    PortsServices.py)
+
+    Parameters
+    ----------
+    logger : obj
+        Instance of logging obj
+    instrument : obj
+        clsInstrument of the script
+    closeexit : function
+        The script's closeexit, called when the run can't go on
+    plugins : str
+        Comma separated plugin IDs to query
+    parse : function
+        Takes a list of records and returns a list of rows and the number of
+        records read.  Errors are raised.
+    write : function
+        Takes a folder, a filename and an iterable of rows and returns the
+        number of rows written.  Errors are raised.
+    endday, startday : str
+        Range of the lastSeen filter, in days
+    cacheloc : str
+        Folder to cache SecurityCenter responses in, None to not cache them
+    cachettl : int
+        Seconds a cached response stays valid
+    capture : bool
+        Save the raw records as they are fetched, to replay later
+    capturexml : bool
+        Also save the raw records as XML
+    merge : bool
+        When collecting several repositories, also write all of them to one file
+    workers : int
+        Number of repositories collected at the same time
+
+    Implement by adding the following to the calling script:
+        from pyPipeline import clsCollector
+        collector = clsCollector(logger, instrument, closeexit, plugins, parserecords, writerows)
+        collector.run(hostip, username, password, fldrloc, scriptname, repoID)
+    '''
+
+    def __init__(self, logger, instrument, closeexit, plugins, parse, write, endday='0', startday='all',
+                 cacheloc=None, cachettl=86400, capture=False, capturexml=False, merge=False, workers=4):
+        self._logger = logger
+        self._instrument = instrument
+        self._closeexit = closeexit
+        self._plugins = plugins
+        self._parse = parse
+        self._write = write
+        self._endday = endday
+        self._startday = startday
+        self._cacheloc = cacheloc
+        self._cachettl = cachettl
+        self._capture = capture
+        self._capturexml = capturexml
+        self._merge = merge
+        self._workers = workers
+
+    def run(self, hostip, username, password, fldrloc, filename, repoid='0', replayfile=''):
+        '''Collect, parse and write a repository ('0' for all of them, 'each' or
+        a comma separated list for several) and exit the script
+
+        With replayfile the records are streamed from a writedev dump instead
+        of SecurityCenter.
+        '''
+        from pyCommon import readdev, analysispages, clsDevCapture
+
+        if not replayfile and (repoid == 'each' or ',' in repoid):
+            # Collect the repositories side by side, one output file each
+            self.collectrepos(hostip, username, password, fldrloc, filename, repoid)
+
+        # A single repository is saved under the same name as in a list
+        if repoid != 'each' and ',' not in repoid:
+            filename = repofilename(filename, repoid)
+
+        sc = None
+        if replayfile:
+            # Stream the records from a writedev dump instead of SecurityCenter
+            pages = batches(readdev(replayfile, self._logger))
+        else:
+            # Begin collecting data from SecurityCenter, a page at a time
+            self._instrument.stage('login')
+            try:
+                sc = self.connect(hostip, username, password)
+            except Exception:
+                self._closeexit(1)
+            self._logger.info('Getting data from SecurityCenter')
+            pages = analysispages(sc, self.queryfilters(repoid), tool='vulndetails')
+            if self._capture:
+                # Save the raw records as they are fetched, to replay later with --replay
+                try:
+                    capture = clsDevCapture(fldrloc, filename, self._logger, xml=self._capturexml)
+                except Exception:
+                    self._logger.error('Failed to capture the raw data from SecurityCenter', exc_info=True)
+                    self._closeexit(1)
+                pages = capture.pages(pages)
+
+        # Fetch, parse and write the data at the same time
+        self.runpipeline(pages, fldrloc, filename)
+
+        if self._cacheloc is not None and sc is not None:
+            sc.logstats()
+            self._instrument.addcache('response', sc.hits, sc.misses)
+
+        # Close log file and exit script cleanly
+        self._closeexit(0)
+
+    def runpipeline(self, pages, fldrloc, filename):
+        '''--- Fetch, parse and write side by side ---
+        Each page of records is parsed as soon as it arrives and its rows written
+        as soon as they are parsed, see clsPipeline
+        '''
+        self._instrument.stage('pipeline')
+        self._logger.info('Processing data from SecurityCenter')
+        pipeline = clsPipeline(self._logger, instrument=self._instrument)
+        try:
+            wrote = pipeline.run(pages, lambda page: self._parse(page)[0],
+                                 lambda rows: self._write(fldrloc, filename, rows))
+        except Exception:
+            self._logger.error('Failed to collect, parse or write the data', exc_info=True)
+            self._closeexit(1)
+
+        self._instrument.addrecords('fetch', pipeline.records)
+        if not wrote:
+            self._logger.info('No information found from SecurityCenter')
+            self._closeexit(0)
+
+        # Determine the number of unique records were found
+        self._logger.info('{} unique records found'.format(pipeline.records))
+        self._instrument.addrecords('parse', pipeline.rows)
+        self._instrument.addrecords('write', pipeline.result)
+
+    def writeoutput(self, fldrloc, filename, rows):
+        '''Write the parsed rows, exiting the script if that fails'''
+        try:
+            count = self._write(fldrloc, filename, rows)
+        except Exception:
+            self._logger.error('Error in writeformats function', exc_info=True)
+            self._closeexit(1)
+
+        self._instrument.addrecords('write', count)
+
+    def collectrepos(self, hostip, username, password, fldrloc, filename, repoid):
+        '''--- Collect several repositories at the same time ---
+        Each repository is queried over its own SecurityCenter session and run
+        through its own pipeline in a worker thread, so its results are written
+        to <filename>-Repo<repository ID#> a page at a time as they arrive and
+        small repositories don't wait on large ones.  With merge the rows of
+        each repository are also spooled to a temporary file, and once all of
+        them are done the spools are written to <filename>.
+
+        A repository that fails is logged and skipped, and the script exits with
+        an error once the rest are written.
+        '''
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+
+        if repoid == 'each':
+            self._instrument.stage('login')
+            repos = self.listrepos(hostip, username, password)
+        else:
+            repos = [x.strip() for x in repoid.split(',') if x.strip()]
+
+        self._instrument.stage('pipeline')
+        self._logger.info('Collecting {} repositories using {} workers'.format(len(repos), self._workers))
+
+        # Only kept when a merged file is wanted
+        spools = {}
+        if self._merge:
+            spools = dict((repo, clsSpool()) for repo in repos)
+        found = []
+        failed = []
+        try:
+            with ThreadPoolExecutor(max_workers=self._workers) as executor:
+                futures = dict((executor.submit(self.collectrepo, hostip, username, password, repo, fldrloc, filename,
+                                                spools.get(repo)), repo) for repo in repos)
+                for future in as_completed(futures):
+                    repo = futures[future]
+                    try:
+                        if future.result():
+                            found.append(repo)
+                    except Exception:
+                        self._logger.error('Failed to collect repository {}, it has been skipped'.format(repo),
+                                           exc_info=True)
+                        failed.append(repo)
+
+            if self._merge:
+                self._instrument.stage('write')
+                # Merged in the order the repositories were given
+                merged = chain.from_iterable(spools[repo].read() for repo in repos if repo in found)
+                self.writeoutput(fldrloc, filename, merged)
+        finally:
+            for spool in spools.values():
+                spool.close()
+
+        if failed:
+            self._logger.error('{} of {} repositories failed: {}'.format(len(failed), len(repos), ', '.join(failed)))
+            self._closeexit(1)
+
+        self._closeexit(0)
+
+    def collectrepo(self, hostip, username, password, repo, fldrloc, filename, spool=None):
+        '''Collect, parse and write a single repository through a pipeline, run
+        by the collectrepos workers.  Errors are raised for collectrepos to log
+        and skip the repository.
+
+        Returns
+        -------
+        bool : False when the repository has no results
+        '''
+        from pyCommon import analysispages, clsDevCapture
+
+        self._logger.info('Collecting repository {}'.format(repo))
+        name = repofilename(filename, repo)
+        sc = self.connect(hostip, username, password)
+        try:
+            pages = analysispages(sc, self.queryfilters(repo), tool='vulndetails')
+            if self._capture:
+                # Save the raw records as they are fetched, to replay later with --replay
+                pages = clsDevCapture(fldrloc, name, self._logger, xml=self._capturexml).pages(pages)
+
+            if spool is None:
+                def write(rows):
+                    return self._write(fldrloc, name, rows)
+            else:
+                def write(rows):
+                    return self._write(fldrloc, name, spool.rows(rows))
+
+            pipeline = clsPipeline(self._logger, instrument=self._instrument)
+            wrote = pipeline.run(pages, lambda page: self._parse(page)[0], write)
+        except Exception:
+            self._logger.error('Failed to collect, parse or write repository {}'.format(repo))
+            raise
+
+        if self._cacheloc is not None:
+            sc.logstats()
+            self._instrument.addcache('response', sc.hits, sc.misses)
+        if not wrote:
+            self._logger.info('No information found in repository {}'.format(repo))
+            return False
+
+        self._logger.info('{} unique records found in repository {}'.format(pipeline.records, repo))
+        self._instrument.addrecords('fetch', pipeline.records)
+        self._instrument.addrecords('parse', pipeline.rows)
+        self._instrument.addrecords('write', pipeline.result)
+        return True
+
+    def listrepos(self, hostip, username, password):
+        '''Returns the ID of each repository the user can see'''
+        try:
+            sc = self.connect(hostip, username, password)
+            repos = sc.get('repository', params={'fields': 'id,name'}).json()['response']
+        except Exception:
+            self._logger.error('Failed to get the list of repositories from SecurityCenter', exc_info=True)
+            self._closeexit(1)
+        self._logger.info('Found {} repositories: {}'.format(len(repos), ', '.join(x['name'] for x in repos)))
+        return [x['id'] for x in repos]
+
+    def connect(self, hostip, username, password):
+        '''--- Connect to SecurityCenter ---
+        Errors are logged and raised
+        '''
+        from pyCommon import clsCachedSC
+
+        try:
+            # Import SecurityCenter5 class from securitycenter module
+            from securitycenter import SecurityCenter5
+        except Exception:
+            self._logger.error('Failed to import SecurityCenter module')
+            self._logger.error('Likely cause is that the securitycenter module has not been downloaded and installed. See https://pypi.python.org/pypi/pySecurityCenter', exc_info=True)
+            raise
+
+        try:
+            # Create connection to SecurityCenter server using the details stored in config.conf
+            sc = SecurityCenter5(hostip)
+            sc.login(username, password)
+        except Exception:
+            self._logger.error('Failed to connect to SecurityCenter server')
+            self._logger.error(
+                'Likely cause is that the credentials to login into SecurityCenter are incorrect', exc_info=True)
+            raise
+
+        # Count and time every call made to SecurityCenter
+        sc = self._instrument.wrapsc(sc)
+
+        # Serve repeated queries from the local cache if requested
+        if self._cacheloc is not None:
+            sc = clsCachedSC(sc, self._cacheloc, self._logger, hostip, username, ttl=self._cachettl)
+
+        return sc
+
+    def queryfilters(self, repo):
+        '''Returns the filters of the query for a repository ('0' for all)
+
+        Filters are (name, operator, value) tuples and are and-ed together, ie.
+            ('repositoryIDs','=','1')  # Repository 1 only
+            ('pluginID','=','20811,22869')  # Any of the plugins the script parses
+            ('lastSeen','=','0:1')  # Last seen in the past day
+        '''
+        filters = [('pluginID', '=', self._plugins), ('lastSeen', '=', self._endday + ':' + self._startday)]
+        if repo != '0':
+            filters.insert(0, ('repositoryIDs', '=', repo))
+        return filters